@@ -0,0 +1,229 @@
+"""
+Benchmarks of the gridworld envs: step throughput, reset latency, allocations per step and the
+observation encoding, for every env class, grid size and history length, single and batched, and the
+rollout kernels (NumPy, and Numba when installed).
+
+    python benchmarks/bench_envs.py                      # all cases, results/<git revision>.json
+    python benchmarks/bench_envs.py --sizes 7 10 --quick
+    python benchmarks/bench_envs.py --compare results/old.json results/new.json
+
+Every case is timed over several repeats and the best repeat is kept (the least disturbed one).
+The results are written as JSON together with the revision and the machine, so that two revisions
+can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gym_test"))
+
+from gridworld2 import GridWorldEnv, GridWorldEnvNew  # noqa: E402
+from gridworldRNN import GridWorldEnvRnn, GridWorldEnvRnnNew  # noqa: E402
+from batched_gridworld import BatchedGridWorldEnv  # noqa: E402
+from kernels import have_numba, rollout  # noqa: E402
+
+SIZES = (7, 10, 100, 1000)
+HISTORY_LENGTHS = (1, 4, 16, 64)
+NUM_ENVS = 1024
+
+
+def make_env(name, size, max_episode_steps=10 ** 9):
+    kwargs = dict(n_width=size, n_height=size, u_size=40, default_type=0, default_reward=-1,
+                  max_episode_steps=max_episode_steps)
+    if name == "GridWorldEnv":
+        env = GridWorldEnv(**kwargs)
+    elif name == "GridWorldEnvNew":
+        env = GridWorldEnvNew(**kwargs)
+    elif name == "GridWorldEnvRnn":
+        env = GridWorldEnvRnn(**kwargs)
+    else:
+        env = GridWorldEnvRnnNew(num_obs=1, **kwargs)
+    env.end = (size - 1, size - 1)
+    env.refresh_setting()
+    return env
+
+
+def best_of(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def allocations(fn, n):
+    '''the largest temporary memory of one call (bytes traced by tracemalloc above the baseline,
+    max over n calls) and the memory blocks still allocated after the calls, per call (leaks)'''
+    fn()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    for _ in range(n):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - base, (sys.getallocatedblocks() - blocks) / n
+
+
+def bench_single(env, n_steps, repeats):
+    actions = np.random.default_rng(0).integers(0, 4, n_steps).tolist()
+    env.reset()
+
+    def run():
+        step = env.step
+        for a in actions:
+            step(a)
+
+    step_time = best_of(run, repeats)
+    reset_time = best_of(lambda: [env.reset() for _ in range(100)], repeats) / 100
+    alloc_bytes, blocks = allocations(lambda: env.step(1), 1000)
+    return {"steps_per_sec": n_steps / step_time, "reset_us": 1e6 * reset_time,
+            "peak_bytes_per_step": alloc_bytes, "net_blocks_per_step": blocks}
+
+
+def bench_batched(env, n_steps, repeats, num_envs=NUM_ENVS):
+    engine = BatchedGridWorldEnv(env, num_envs, seed=0)
+    actions = np.random.default_rng(0).integers(0, 4, (n_steps, num_envs))
+    engine.reset()
+
+    def run():
+        for a in actions:
+            engine.step(a)
+
+    step_time = best_of(run, repeats)
+    reset_time = best_of(lambda: [engine.reset() for _ in range(100)], repeats) / 100
+    alloc_bytes, blocks = allocations(lambda: engine.step(actions[0]), 200)
+    return {"steps_per_sec": n_steps * num_envs / step_time, "reset_us": 1e6 * reset_time,
+            "peak_bytes_per_step": alloc_bytes / num_envs, "net_blocks_per_step": blocks / num_envs,
+            "num_envs": num_envs}
+
+
+def bench_encoding(env, repeats):
+    '''compiling the lookup tables (incl. fitting the LocalViewEncoder) and encoding positions in bulk'''
+    compile_time = best_of(env.refresh_setting, max(1, repeats // 2))
+    n = env.n_width * env.n_height
+    rng = np.random.default_rng(0)
+    x = rng.integers(1, env.n_width + 1, 100000)
+    y = rng.integers(1, env.n_height + 1, 100000)
+    encode_time = best_of(lambda: env.encoder.encode_batch(x, y), repeats)
+    return {"compile_ms": 1e3 * compile_time, "compile_ns_per_cell": 1e9 * compile_time / n,
+            "encode_per_sec": len(x) / encode_time}
+
+
+def bench_kernel(env, n_steps, repeats, backend):
+    '''kernels.rollout with a random policy, compiled once before timing. The env of the other cases has no
+    time limit (10^9 steps); the rollouts run with a realistic one, 4 * size^2 steps, so that episodes end and
+    restart as in training'''
+    unlimited = env._max_episode_steps
+    env._max_episode_steps = 4 * env.n_width * env.n_height
+    try:
+        rollout(env, steps=10, backend=backend)
+        step_time = best_of(lambda: rollout(env, steps=n_steps, backend=backend), repeats)
+    finally:
+        env._max_episode_steps = unlimited
+    return {"steps_per_sec": n_steps / step_time, "time_limit": 4 * env.n_width * env.n_height}
+
+
+def run(sizes, history_lengths, quick):
+    n_steps = 2000 if quick else 20000
+    repeats = 3 if quick else 5
+    results = []
+    for size in sizes:
+        for name in ("GridWorldEnv", "GridWorldEnvNew", "GridWorldEnvRnn", "GridWorldEnvRnnNew"):
+            start = time.perf_counter()
+            env = make_env(name, size)
+            construct_ms = 1e3 * (time.perf_counter() - start)
+            lengths = history_lengths if name == "GridWorldEnvRnnNew" else (None,)
+            for length in lengths:
+                if length is not None:
+                    env.num_obs = length
+                    env.reset()
+                case = {"env": name, "size": size, "history": length}
+                results.append(dict(case, mode="single", construct_ms=construct_ms,
+                                    **bench_single(env, n_steps, repeats)))
+                results.append(dict(case, mode="batched", **bench_batched(env, max(n_steps // 100, 20), repeats)))
+                _report(results[-2:])
+            for backend in ("numpy", "numba") if have_numba() else ("numpy",):
+                results.append(dict(env=name, size=size, history=None, mode="kernel_" + backend,
+                                    **bench_kernel(env, 10 * n_steps, repeats, backend)))
+                _report(results[-1:])
+            if name == "GridWorldEnvNew":
+                results.append(dict(env=name, size=size, history=None, mode="encoding",
+                                    **bench_encoding(env, repeats)))
+                _report(results[-1:])
+    return results
+
+
+def _report(rows):
+    for r in rows:
+        values = ", ".join("%s=%.4g" % (k, v) for k, v in r.items()
+                           if k not in ("env", "size", "history", "mode") and isinstance(v, (int, float)))
+        print("%-20s %5d %4s %-8s %s" % (r["env"], r["size"], r["history"] or "", r["mode"], values))
+
+
+def _revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old_path, new_path, threshold=0.1):
+    '''print the ratio new / old of every metric, marking changes above threshold'''
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    key = lambda r: (r["env"], r["size"], r["history"], r["mode"])
+    old_rows = {key(r): r for r in old["results"]}
+    print("%s -> %s" % (old["revision"], new["revision"]))
+    for r in new["results"]:
+        o = old_rows.get(key(r))
+        if o is None:
+            continue
+        for metric in ("steps_per_sec", "reset_us", "encode_per_sec", "compile_ms"):
+            if metric in r and metric in o and o[metric]:
+                ratio = r[metric] / o[metric]
+                # higher is better for the rates, lower for the times
+                worse = ratio < 1 - threshold if metric.endswith("per_sec") else ratio > 1 + threshold
+                flag = "  REGRESSION" if worse else ""
+                print("%-20s %5d %4s %-8s %-15s %8.3fx%s" % (r["env"], r["size"], r["history"] or "", r["mode"],
+                                                           metric, ratio, flag))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--history", type=int, nargs="+", default=HISTORY_LENGTHS)
+    parser.add_argument("--quick", action="store_true", help="fewer steps and repeats")
+    parser.add_argument("--out", help="the JSON file, default results/<revision>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    results = run(args.sizes, args.history, args.quick)
+    revision = _revision()
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", revision + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"revision": revision, "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "machine": {"python": platform.python_version(), "numpy": np.__version__,
+                               "platform": platform.platform(), "processor": platform.processor(),
+                               "cpus": os.cpu_count()},
+                   "quick": args.quick, "results": results}, f, indent=1)
+    print("results written to", out)
+
+
+if __name__ == "__main__":
+    main()
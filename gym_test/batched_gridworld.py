@@ -0,0 +1,256 @@
+"""
+Batched GridWorld engine: steps N copies of a gridworld env in one NumPy call
+"""
+import types
+
+import numpy as np
+
+from gridworld2 import GridWorldEnv, GridWorldEnvNew
+from gridworldRNN import GridWorldEnvRnn, GridWorldEnvRnnNew
+from history import HistoryBuffer
+from seeding import BatchNoise, seed_sequence
+
+
+def vec_env_base():
+    '''stable_baselines' VecEnv, object without stable_baselines (it is only needed to train on the adapters).
+    Imported on first use, not with this module: it loads tensorflow'''
+    try:
+        from stable_baselines.common.vec_env import VecEnv
+    except ImportError:
+        VecEnv = object
+    return VecEnv
+
+
+def with_vec_env_base(mixin, name: str):
+    '''the class name derived from mixin and vec_env_base(), see the module __getattr__'''
+    base = vec_env_base()
+    bases = (mixin,) if base is object else (mixin, base)
+    namespace = {"__module__": mixin.__module__, "__qualname__": name, "__doc__": mixin.__doc__}
+    return types.new_class(name, bases, exec_body=lambda ns: ns.update(namespace))
+
+# the observation returned by the different env classes
+KIND_STATE = "state"  # GridWorldEnv: the state index
+KIND_OBS = "obs"  # GridWorldEnvNew: the observation index (0-8)
+KIND_RNN = "rnn"  # GridWorldEnvRnn: [action, observation]
+KIND_HISTORY = "history"  # GridWorldEnvRnnNew: num_obs observations + num_obs actions
+
+
+def _env_kind(env):
+    if isinstance(env, GridWorldEnvRnnNew):
+        return KIND_HISTORY
+    if isinstance(env, GridWorldEnvRnn):
+        return KIND_RNN
+    if isinstance(env, GridWorldEnvNew):
+        return KIND_OBS
+    if isinstance(env, GridWorldEnv):
+        return KIND_STATE
+    raise TypeError("unsupported env class: %s" % type(env).__name__)
+
+
+class BatchedGridWorldEnv(object):
+    '''num_envs copies of a gridworld env, stored as integer arrays and advanced
+    together by one vectorized step.
+
+    The layout (walls, rewards, start, end, time limit, action noise) is copied
+    from a prototype env, and the observations follow the prototype class. After
+    changing the layout of the prototype, call refresh_setting().
+    '''
+
+    def __init__(self, env: GridWorldEnv, num_envs: int, seed=None, first_index: int = 0):
+        """
+        :param seed: an int, None or a np.random.SeedSequence
+        :param first_index: the noise stream of env j is the one of env.seed(seed, index=first_index + j),
+                            workers holding a part of a larger batch pass the index of their first env
+        """
+        self.env = env
+        self.first_index = first_index
+        self.num_envs = num_envs
+        self.kind = _env_kind(env)
+        self.action_space = env.action_space
+        self.num_obs = env.num_obs if self.kind == KIND_HISTORY else 1
+
+        self.state = np.zeros(num_envs, np.int64)
+        self.action = np.zeros(num_envs, np.int64)
+        self.observation = np.zeros(num_envs, np.int64)
+        self._elapsed_steps = np.zeros(num_envs, np.int64)
+        # newest first, the same order as obs_list / act_list in GridWorldEnvRnnNew
+        self._history = HistoryBuffer(self.num_obs, (num_envs,))
+
+        self.seed(seed)
+        self.refresh_setting()
+        self.reset()
+
+    def seed(self, seed=None):
+        sequence = seed_sequence(seed)
+        self.np_random = np.random.default_rng(sequence)
+        self.noise = BatchNoise(sequence, self.first_index + np.arange(self.num_envs))
+        # as for env.seed, the next reset starts episode 0 of the new streams
+        self._elapsed_steps[:] = 0
+        return [sequence.entropy]
+
+    def refresh_setting(self):
+        '''share the lookup tables of the prototype env (indexed by state)'''
+        env = self.env
+        env._check_tables()
+        self.n_width, self.n_height = env.n_width, env.n_height
+        self.action_noise = env.action_noise
+        self._max_episode_steps = env._max_episode_steps
+
+        self._transitions = env.transition_table
+        self._rewards = env.reward_table
+        self._is_end = env.end_table
+        if self.kind == KIND_STATE:
+            self._obs = np.arange(len(env.transition_table))
+        else:
+            self._obs = env.obs_table
+        self._start_state = env._xy_to_state(env.start)
+
+        if self.kind == KIND_HISTORY and env.num_obs != self.num_obs:
+            # a new history length: the env takes it at its next reset, the engine now (call reset())
+            self.num_obs = env.num_obs
+            self._history = HistoryBuffer(self.num_obs, (self.num_envs,))
+            env._update_observation_space()
+        # n_obs follows the layout, num_obs the history length
+        self.observation_space = env.observation_space
+
+    def reset(self, mask=None):
+        '''reset all envs, or only those where mask is True
+        return: the observations of all envs
+        '''
+        if mask is None:
+            mask = np.ones(self.num_envs, bool)
+        self.state[mask] = self._start_state
+        self.action[mask] = 0
+        self.noise.start(mask & (self._elapsed_steps > 0))
+        self._elapsed_steps[mask] = 0
+        self.observation[mask] = self._obs[self._start_state]
+        self._history.reset(self.observation[mask], 0, mask)
+        return self._get_obs()
+
+    def step(self, actions):
+        '''advance all envs by one step
+        :param actions: (num_envs,) array of actions
+        return: observations, rewards, dones, truncated (all arrays over envs);
+                envs that are done are not reset, see reset(mask)
+        '''
+        # a copy, self.action is changed in place by reset(mask)
+        actions = np.array(actions, np.int64).reshape(self.num_envs)
+        assert ((actions >= 0) & (actions < self.action_space.n)).all(), "invalid actions %r" % actions
+        # add some noise here
+        if self.action_noise > 0:
+            actions = self.noise.apply(actions, self.action_noise, self.action_space.n)
+        self.action = actions
+
+        # boundary and wall effect are in the transition table
+        self.state = self._transitions[self.state, actions]
+        self.observation = self._obs[self.state]
+        rewards, dones = self._outcome(self.state)
+
+        self._elapsed_steps += 1
+        truncated = (self._elapsed_steps >= self._max_episode_steps) & ~dones
+        dones = dones | truncated
+
+        if self.kind == KIND_HISTORY:
+            self._history.push(self.observation, actions)
+
+        return self._get_obs(), rewards, dones, truncated
+
+    def _outcome(self, state):
+        # rewards and terminations of entering the states; the goal-conditioned engine uses per-env goals
+        return self._rewards[state], self._is_end[state]
+
+    def _get_obs(self):
+        if self.kind == KIND_STATE:
+            return self.state.copy()
+        if self.kind == KIND_OBS:
+            return self.observation.copy()
+        if self.kind == KIND_RNN:
+            return np.stack([self.action, self.observation], axis=1)
+        return self._history.fill(np.empty((self.num_envs, 2 * self.num_obs), np.int64))
+
+    def get_xy(self):
+        x = (self.state - 1) % self.n_width + 1
+        y = (self.state - 1) // self.n_width + 1
+        return x, y
+
+
+class _BatchedVecEnv(object):
+    '''VecEnv adapter around BatchedGridWorldEnv: done envs are reset
+    automatically, the last observation is kept in info["terminal_observation"]
+    '''
+
+    def __init__(self, env: GridWorldEnv, num_envs: int, seed=None, goals=None):
+        """
+        :param goals: a goal_conditioned.GoalSet (or its goal cells) to run the goal-conditioned engine,
+                      the observations then end with the goal index
+        """
+        if goals is None:
+            self.engine = BatchedGridWorldEnv(env, num_envs, seed=seed)
+        else:
+            from goal_conditioned import GoalConditionedBatchedEnv
+            self.engine = GoalConditionedBatchedEnv(env, num_envs, goals, seed=seed)
+        base = vec_env_base()
+        if base is object:
+            self.num_envs = num_envs
+            self.observation_space = self.engine.observation_space
+            self.action_space = env.action_space
+        else:
+            base.__init__(self, num_envs, self.engine.observation_space, env.action_space)
+        self._actions = None
+
+    def reset(self):
+        return self.engine.reset()
+
+    def step_async(self, actions):
+        self._actions = actions
+
+    def step_wait(self):
+        obs, rewards, dones, truncated = self.engine.step(self._actions)
+        states = self.engine.state
+        infos = [{"state": int(states[i]), "TimeLimit.truncated": bool(truncated[i])}
+                 for i in range(self.num_envs)]
+        if dones.any():
+            for i in np.flatnonzero(dones):
+                infos[i]["terminal_observation"] = obs[i]
+            obs = self.engine.reset(dones)
+        return obs, rewards, dones, infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def seed(self, seed=None):
+        return self.engine.seed(seed)
+
+    def close(self):
+        self.engine.env.close()
+
+    def get_attr(self, attr_name, indices=None):
+        # the layout is shared by all envs, so the prototype answers for each of them
+        return [getattr(self.engine.env, attr_name) for _ in self._indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self.engine.env, attr_name, value)
+        self.engine.refresh_setting()
+        self.observation_space = self.engine.observation_space
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        result = getattr(self.engine.env, method_name)(*method_args, **method_kwargs)
+        self.engine.refresh_setting()
+        self.observation_space = self.engine.observation_space
+        return [result for _ in self._indices(indices)]
+
+    def _indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+
+def __getattr__(name):
+    # BatchedVecEnv derives from VecEnv, so the class is made when it is first imported
+    if name == "BatchedVecEnv":
+        cls = globals()[name] = with_vec_env_base(_BatchedVecEnv, name)
+        return cls
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,145 @@
+"""
+Exact Bayesian belief over the hidden state of the POMDP gridworld envs
+"""
+import types
+
+import numpy as np
+
+
+class BeliefTracker(object):
+    '''Bayes filter over the reachable states of a GridWorldEnvNew (or subclass)
+    layout, for one env or a batch of envs.
+
+    The model is read from the env tables: the intended action is replaced by a
+    uniformly random one with probability env.action_noise, the move follows
+    transition_table and the observation is obs_table of the new state. Each
+    transition matrix has at most 4 non-zeros per row, so it is stored as the
+    (S, 4) array of next states and applied with one bincount.
+    '''
+
+    def __init__(self, env, num_envs: int = 1, action_noise=None):
+        """
+        :param env: the env whose layout is tracked (GridWorldEnvNew or subclass)
+        :param num_envs: number of beliefs updated together
+        :param action_noise: default env.action_noise
+        """
+        env._check_tables()
+        self.num_envs = num_envs
+        self.action_noise = env.action_noise if action_noise is None else action_noise
+
+        # the belief is over the reachable states only, states[i] is the env state of entry i
+        self.states = np.flatnonzero(env._reachable_states())
+        self.n_states = len(self.states)
+        index = np.full(len(env.transition_table), -1, np.int64)
+        index[self.states] = np.arange(self.n_states)
+        self.next_index = index[env.transition_table[self.states]]  # (S, n_actions)
+        self.observations = env.obs_table[self.states]  # (S,)
+        self.start_index = index[env._xy_to_state(env.start)]
+        self.n_env_states = len(env.transition_table)
+
+        # P(effective action | intended action)
+        n_actions = env.action_space.n
+        self.action_probs = ((1 - self.action_noise) * np.eye(n_actions)
+                             + self.action_noise / n_actions)
+        self._offsets = (np.arange(num_envs) * self.n_states)[:, None, None]
+        self.belief = np.zeros((num_envs, self.n_states))
+        self.reset()
+
+    def spawn(self, num_envs: int):
+        '''a tracker of the same model for another number of envs, the tables are shared'''
+        tracker = BeliefTracker.__new__(BeliefTracker)
+        tracker.__dict__.update(self.__dict__)
+        tracker.num_envs = num_envs
+        tracker._offsets = (np.arange(num_envs) * self.n_states)[:, None, None]
+        tracker.belief = np.zeros((num_envs, self.n_states))
+        tracker.reset()
+        return tracker
+
+    def reset(self, observations=None, mask=None):
+        """
+        start new episodes
+        :param observations: None to start from env.start (the envs always reset there),
+                             otherwise the first observations: uniform over matching states
+        :param mask: only reset the envs where mask is True
+        """
+        if observations is None:
+            belief = np.zeros((self.num_envs, self.n_states))
+            belief[:, self.start_index] = 1.0
+        else:
+            belief = self.observations[None, :] == np.reshape(observations, (-1, 1))
+            belief = belief / belief.sum(axis=1, keepdims=True)
+        if mask is None:
+            self.belief[...] = belief
+        else:
+            self.belief[mask] = belief[mask]
+        return self.belief
+
+    def predict(self, actions):
+        '''the belief after the actions, before the observations'''
+        actions = np.reshape(actions, self.num_envs)
+        # weights[n, s, b] = belief[n, s] * P(b | actions[n])
+        weights = self.belief[:, :, None] * self.action_probs[actions][:, None, :]
+        target = self.next_index[None, :, :] + self._offsets
+        prior = np.bincount(target.ravel(), weights.ravel(), minlength=self.num_envs * self.n_states)
+        return prior.reshape(self.num_envs, self.n_states)
+
+    def update(self, actions, observations):
+        """
+        one step of the Bayes filter
+        :param actions: (num_envs,) actions given to the envs
+        :param observations: (num_envs,) observation indices returned by the envs
+        :return: (num_envs, n_states) beliefs
+        """
+        prior = self.predict(actions)
+        likelihood = self.observations[None, :] == np.reshape(observations, (-1, 1))
+        belief = prior * likelihood
+        total = belief.sum(axis=1, keepdims=True)
+        # an observation impossible under the model: fall back to the observation alone
+        lost = total[:, 0] <= 0
+        if lost.any():
+            belief[lost] = likelihood[lost]
+            total[lost] = likelihood[lost].sum(axis=1, keepdims=True)
+        np.divide(belief, total, out=self.belief)
+        return self.belief
+
+    def most_likely_state(self):
+        '''(num_envs,) env states with the highest belief'''
+        return self.states[np.argmax(self.belief, axis=1)]
+
+    def full_belief(self):
+        '''(num_envs, n_env_states) beliefs indexed by env state'''
+        full = np.zeros((self.num_envs, self.n_env_states))
+        full[:, self.states] = self.belief
+        return full
+
+
+class _BeliefObservationWrapper(object):
+    '''replaces the observation of a POMDP gridworld env by the exact belief
+    over its reachable states (see BeliefTracker.states for the order)
+    '''
+
+    def __init__(self, env):
+        from gym import spaces
+        super(_BeliefObservationWrapper, self).__init__(env)
+        self.tracker = BeliefTracker(env)
+        self.observation_space = spaces.Box(low=0.0, high=1.0, shape=(self.tracker.n_states,), dtype=np.float64)
+
+    def reset(self, **kwargs):
+        self.env.reset(**kwargs)
+        return self.tracker.reset()[0].copy()
+
+    def step(self, action):
+        _, reward, done, info = self.env.step(action)
+        belief = self.tracker.update([action], [self.env.observation])
+        return belief[0].copy(), reward, done, info
+
+
+def __getattr__(name):
+    # BeliefObservationWrapper is a gym.Wrapper: gym is imported when the class is first used
+    if name == "BeliefObservationWrapper":
+        import gym
+        namespace = {"__module__": __name__, "__qualname__": name, "__doc__": _BeliefObservationWrapper.__doc__}
+        cls = globals()[name] = types.new_class(name, (_BeliefObservationWrapper, gym.Wrapper),
+                                                exec_body=lambda ns: ns.update(namespace))
+        return cls
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,177 @@
+"""
+NumPy-only base of the gridworld envs: the gym.Env interface and the Discrete / MultiDiscrete spaces,
+so that the envs import without gym. Once gym is loaded (e.g. by stable_baselines), the spaces of an
+env are handed out as the equivalent gym.spaces objects
+"""
+import sys
+
+import numpy as np
+
+
+def np_random(seed=None, index=None):
+    '''a np.random.RandomState and its seed, like gym.utils.seeding.np_random;
+    with index the state of the child index of the seed (SeedSequence.spawn)'''
+    if seed is not None and not (isinstance(seed, (int, np.integer)) and seed >= 0):
+        raise ValueError("seed must be a non-negative integer or None, not %r" % (seed,))
+    sequence = np.random.SeedSequence(None if seed is None else int(seed),
+                                      spawn_key=() if index is None else (int(index),))
+    return np.random.RandomState(np.random.MT19937(sequence)), sequence.entropy
+
+
+class Space(object):
+    '''the part of gym.spaces.Space the envs use'''
+
+    def __init__(self, shape=None, dtype=None):
+        self.shape = None if shape is None else tuple(shape)
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self.np_random = None
+        self._gym = None
+        self.seed()
+
+    def seed(self, seed=None):
+        self.np_random, seed = np_random(seed)
+        return [seed]
+
+    def sample(self):
+        raise NotImplementedError
+
+    def contains(self, x):
+        raise NotImplementedError
+
+    def __contains__(self, x):
+        return self.contains(x)
+
+    def to_gym(self):
+        '''the equivalent gym space (imports gym), made once and seeded from this space'''
+        if self._gym is None:
+            self._gym = self._make_gym()
+            self._gym.seed(int(self.np_random.randint(2 ** 31)))
+        return self._gym
+
+    def _make_gym(self):
+        raise NotImplementedError
+
+
+class Discrete(Space):
+    '''{0, 1, ..., n-1}'''
+
+    def __init__(self, n: int):
+        assert n >= 0
+        self.n = n
+        super(Discrete, self).__init__((), np.int64)
+
+    def sample(self):
+        return self.np_random.randint(self.n)
+
+    def contains(self, x):
+        # the same test as gym.spaces.Discrete
+        if isinstance(x, int):
+            as_int = x
+        elif isinstance(x, (np.generic, np.ndarray)) and (x.dtype.char in np.typecodes['AllInteger'] and x.shape == ()):
+            as_int = int(x)
+        else:
+            return False
+        return 0 <= as_int < self.n
+
+    def _make_gym(self):
+        from gym import spaces
+        return spaces.Discrete(self.n)
+
+    def __repr__(self):
+        return "Discrete(%d)" % self.n
+
+    def __eq__(self, other):
+        return isinstance(other, Discrete) and self.n == other.n
+
+
+class MultiDiscrete(Space):
+    '''a vector of discrete values, entry i in {0, ..., nvec[i]-1}'''
+
+    def __init__(self, nvec):
+        self.nvec = np.asarray(nvec, dtype=np.int64)
+        assert (self.nvec > 0).all(), 'nvec (counts) have to be positive'
+        super(MultiDiscrete, self).__init__(self.nvec.shape, np.int64)
+
+    def sample(self):
+        return (self.np_random.random_sample(self.nvec.shape) * self.nvec).astype(self.dtype)
+
+    def contains(self, x):
+        if isinstance(x, list):
+            x = np.array(x)
+        return x.shape == self.shape and x.dtype != object and (0 <= x).all() and (x < self.nvec).all()
+
+    def _make_gym(self):
+        from gym import spaces
+        return spaces.MultiDiscrete(self.nvec)
+
+    def __repr__(self):
+        return "MultiDiscrete(%s)" % self.nvec
+
+    def __eq__(self, other):
+        return isinstance(other, MultiDiscrete) and np.array_equal(self.nvec, other.nvec)
+
+
+def _as_gym(space):
+    # stable_baselines and the gym wrappers test isinstance(space, gym.spaces.Discrete)
+    if isinstance(space, Space) and "gym" in sys.modules:
+        return space.to_gym()
+    return space
+
+
+class Env(object):
+    '''the interface of gym.Env without importing gym.
+
+    action_space and observation_space are stored as the NumPy spaces above;
+    when gym has been imported they are returned as gym spaces. Code on the hot
+    path reads self._action_space directly.
+    '''
+    metadata = {'render.modes': []}
+    reward_range = (-float('inf'), float('inf'))
+    spec = None
+    _action_space = None
+    _observation_space = None
+
+    @property
+    def action_space(self):
+        return _as_gym(self._action_space)
+
+    @action_space.setter
+    def action_space(self, space):
+        self._action_space = space
+
+    @property
+    def observation_space(self):
+        return _as_gym(self._observation_space)
+
+    @observation_space.setter
+    def observation_space(self, space):
+        self._observation_space = space
+
+    def step(self, action):
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def render(self, mode='human'):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def seed(self, seed=None):
+        return
+
+    @property
+    def unwrapped(self):
+        return self
+
+    def __str__(self):
+        return '<{} instance>'.format(type(self).__name__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
@@ -0,0 +1,124 @@
+"""
+Batched policy evaluation: many episodes run together in a BatchedGridWorldEnv
+"""
+from statistics import NormalDist
+
+import numpy as np
+
+from batched_gridworld import BatchedGridWorldEnv
+
+
+class EvaluationResult(object):
+    '''per-episode returns, lengths and truncation flags with summary statistics;
+    the intervals are normal intervals of the mean (Wilson for the rates)'''
+
+    def __init__(self, returns, lengths, truncated, confidence: float = 0.95):
+        self.returns = np.asarray(returns, np.float64)
+        self.lengths = np.asarray(lengths, np.int64)
+        self.truncated = np.asarray(truncated, bool)
+        self.confidence = confidence
+        self._z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    @property
+    def n_episodes(self):
+        return len(self.returns)
+
+    @property
+    def mean_return(self):
+        return float(self.returns.mean())
+
+    @property
+    def std_return(self):
+        return float(self.returns.std(ddof=1)) if self.n_episodes > 1 else 0.0
+
+    @property
+    def return_ci(self):
+        return self._mean_ci(self.returns)
+
+    @property
+    def mean_length(self):
+        return float(self.lengths.mean())
+
+    @property
+    def length_ci(self):
+        return self._mean_ci(self.lengths)
+
+    @property
+    def truncation_rate(self):
+        return float(self.truncated.mean())
+
+    @property
+    def truncation_ci(self):
+        # Wilson score interval, sensible also for rates close to 0 or 1
+        n, p, z = self.n_episodes, self.truncation_rate, self._z
+        center = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        return float(center - half), float(center + half)
+
+    def _mean_ci(self, values):
+        if len(values) < 2:
+            return float(values.mean()), float(values.mean())
+        half = self._z * values.std(ddof=1) / np.sqrt(len(values))
+        return float(values.mean() - half), float(values.mean() + half)
+
+    def summary(self):
+        return {"n_episodes": self.n_episodes, "mean_return": self.mean_return, "std_return": self.std_return,
+                "return_ci": self.return_ci, "mean_length": self.mean_length, "length_ci": self.length_ci,
+                "truncation_rate": self.truncation_rate, "truncation_ci": self.truncation_ci}
+
+    def __str__(self):
+        lo, hi = self.return_ci
+        return ("%d episodes: return %.3f +- %.3f (%d%% CI [%.3f, %.3f]), length %.1f, truncated %.1f%%"
+                % (self.n_episodes, self.mean_return, self.std_return, round(100 * self.confidence), lo, hi,
+                   self.mean_length, 100 * self.truncation_rate))
+
+
+def evaluate_policy(policy, env, num_episodes: int = 10000, num_envs: int = 1000, seed=None,
+                    gamma: float = 1.0, deterministic: bool = True, confidence: float = 0.95):
+    """
+    run num_episodes episodes of a policy, num_envs at a time
+    :param policy: a model with predict(obs, state, mask, deterministic) -> (actions, state) like the
+                   stable_baselines models (the recurrent state is carried per env and reset by mask
+                   at the start of each episode; recurrent models need num_envs equal to their n_envs),
+                   or a function observations (num_envs, ...) -> actions (num_envs,)
+    :param env: the prototype env, its layout and observations are used (see BatchedGridWorldEnv)
+    :param gamma: discount of the returns, 1 for the plain sum of rewards
+    :return: an EvaluationResult
+    """
+    num_envs = min(num_envs, num_episodes)
+    engine = BatchedGridWorldEnv(env, num_envs, seed=seed)
+    # a fixed number of episodes per env, so that short episodes are not favoured
+    quota = np.full(num_envs, num_episodes // num_envs)
+    quota[:num_episodes % num_envs] += 1
+
+    returns, lengths, truncations = [], [], []
+    finished = np.zeros(num_envs, np.int64)
+    episode_return = np.zeros(num_envs)
+    discount = np.ones(num_envs)
+    obs = engine.reset()
+    state = None
+    starts = np.ones(num_envs, bool)
+    predict = getattr(policy, "predict", None)
+
+    while (finished < quota).any():
+        if predict is not None:
+            actions, state = predict(obs, state=state, mask=starts, deterministic=deterministic)
+        else:
+            actions = policy(obs)
+        obs, rewards, dones, truncated = engine.step(actions)
+        episode_return += discount * rewards
+        discount *= gamma
+
+        starts = dones
+        if dones.any():
+            record = dones & (finished < quota)
+            returns.append(episode_return[record])
+            lengths.append(engine._elapsed_steps[record])
+            truncations.append(truncated[record])
+            finished += record
+            episode_return[dones] = 0.0
+            discount[dones] = 1.0
+            obs = engine.reset(dones)
+
+    return EvaluationResult(np.concatenate(returns), np.concatenate(lengths), np.concatenate(truncations),
+                            confidence)
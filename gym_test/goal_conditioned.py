@@ -0,0 +1,215 @@
+"""
+Goal-conditioned mode of the gridworld envs: every episode draws its goal from a set of goal cells, the episode
+ends when the goal is reached, the rewards follow the goal and the observation ends with the goal index, so one
+policy is trained over many goals on one env (or one batch of envs) without building an env per goal
+
+    goals = GoalSet(env)                                    # all cells reachable from the start, but the start
+    single = GoalConditionedEnv(env, goals, seed=0)         # obs + [goal]
+    batch = GoalConditionedBatchedEnv(env, 4096, goals, seed=0)
+
+The goal of episode e of env i is drawn like the action noise (seeding.py) from (seed, i, e): a single env
+seeded with (seed, index=i) and slot j of a batch with first_index + j = i play the same goals.
+"""
+import numpy as np
+
+from batched_gridworld import BatchedGridWorldEnv
+from env_core import Discrete, Env, MultiDiscrete, _as_gym
+from gridworld2 import GridWorldEnv
+from seeding import episode_bases, stream_keys
+
+GOAL_KEY = 0x676F616C  # spawn_key tag of the goal streams
+GOAL_BLOCK = 64  # goals drawn per block by a single env
+
+
+def goal_draws(keys, episodes, n_goals: int):
+    '''the goal index of episode e (0, 1, ...) of each goal stream key, broadcast over keys and episodes'''
+    return (episode_bases(keys, episodes) % np.uint64(n_goals)).astype(np.int64)
+
+
+def goal_space(space, n_goals: int):
+    '''the observation space of an env with the goal index appended'''
+    nvec = [space.n] if isinstance(space, Discrete) else list(space.nvec)
+    return MultiDiscrete(nvec + [n_goals])
+
+
+class GoalSet(object):
+    '''the goal cells of the goal-conditioned mode and their tables.
+
+    rewards[g, s-1] is the reward of entering state s with goal g (env._goal_reward_table: the
+    reward fields of reward_fields.py for the rnn envs, the layout rewards otherwise), states[g] the
+    state of goal g; an episode with goal g ends in states[g]. The tables follow the layout of env,
+    refresh() rebuilds them after it changed.
+    '''
+
+    def __init__(self, env: GridWorldEnv, goals=None):
+        """
+        :param goals: the goal cells [(x, y), ...]; default all cells reachable from the start but the start
+        """
+        self.env = env
+        env._check_tables()
+        if goals is None:
+            reachable = env._reachable_states()
+            reachable[env._xy_to_state(env.start)] = False
+            x, y = env._state_to_xy(np.flatnonzero(reachable))
+            goals = np.stack([x, y], axis=1)
+        self.goals = np.asarray(goals, np.int64).reshape(-1, 2)
+        self.n_goals = len(self.goals)
+        assert self.n_goals > 0, "the goal set is empty"
+        self.states = env._xy_to_state(self.goals[:, 0], self.goals[:, 1])
+        assert (env.type_table[self.states] != 1).all(), "goals on walls"
+        self._source = None
+        self.refresh()
+
+    def refresh(self):
+        '''rebuild the reward tables if the env recompiled its tables since'''
+        self.env._check_tables()
+        if self._source is not self.env.reward_table:
+            self.rewards = self.env._goal_reward_table(self.goals)
+            self._source = self.env.reward_table
+
+    def index(self, goal):
+        '''the index of the goal cell (x, y)'''
+        found = np.flatnonzero((self.goals == np.asarray(goal)).all(axis=1))
+        assert len(found), "%r is not a goal" % (goal,)
+        return int(found[0])
+
+
+def _goal_set(env, goals):
+    return goals if isinstance(goals, GoalSet) else GoalSet(env, goals)
+
+
+class GoalConditionedEnv(Env):
+    '''one gridworld env in the goal-conditioned mode.
+
+    reset() draws the goal of the next episode, the observation of env gets the goal index
+    appended, the rewards are the ones of the goal and the episode ends at the goal (the ends of
+    the layout do not end it) or at the time limit. The goals are drawn GOAL_BLOCK episodes at a
+    time; an episode counts once it has stepped, as for the action noise.
+    '''
+
+    def __init__(self, env: GridWorldEnv, goals=None, seed=None, index=None):
+        """
+        :param goals: a GoalSet or its goal cells, see GoalSet
+        :param seed, index: seed env with env.seed(seed, index); by default the goals follow its current seed
+        """
+        self.env = env
+        self.goal_set = _goal_set(env, goals)
+        self.action_space = env._action_space
+        self.metadata = env.metadata
+        if seed is not None or index is not None:
+            env.seed(seed, index)
+        self._seed_goals()
+
+    def seed(self, seed=None, index=None):
+        result = self.env.seed(seed, index)
+        self._seed_goals()
+        return result
+
+    def _seed_goals(self):
+        self._keys = stream_keys(self.env.noise.entropy, [self.env.env_index], tag=GOAL_KEY)
+        self._first, self._goals = 0, []
+        self.episode = 0
+        self.goal = None
+
+    def _draw_goal(self, episode: int):
+        if not self._first <= episode < self._first + len(self._goals):
+            self._first = episode
+            self._goals = goal_draws(self._keys, np.arange(episode, episode + GOAL_BLOCK),
+                                     self.goal_set.n_goals).tolist()
+        return self._goals[episode - self._first]
+
+    def reset(self, goal=None):
+        '''
+        :param goal: the goal index of this episode instead of the drawn one
+        return: the observation of env.reset() with the goal index appended
+        '''
+        if self.env._elapsed_steps:
+            self.episode += 1
+        result = self.env.reset()
+        self.goal_set.refresh()
+        self.goal = self._draw_goal(self.episode) if goal is None else int(goal)
+        self._goal_state = int(self.goal_set.states[self.goal])
+        self._rewards = self.goal_set.rewards[self.goal]
+        self.observation_space = goal_space(self.env._observation_space, self.goal_set.n_goals)
+        # GridWorldEnvRnn.reset returns (input, state)
+        if isinstance(result, tuple):
+            return (self._with_goal(result[0]),) + result[1:]
+        return self._with_goal(result)
+
+    def step(self, action):
+        observation, _, _, info = self.env.step(action)
+        state = self.env.state
+        self.env.reward = reward = float(self._rewards[state - 1])
+        done = state == self._goal_state
+        if self.env._elapsed_steps >= self.env._max_episode_steps:
+            info['TimeLimit.truncated'] = not done
+            done = True
+        else:
+            info['TimeLimit.truncated'] = False
+        info["goal"] = self.goal
+        return self._with_goal(observation), reward, done, info
+
+    def _with_goal(self, observation):
+        return np.append(observation, self.goal)
+
+    @property
+    def goal_xy(self):
+        return tuple(int(v) for v in self.goal_set.goals[self.goal])
+
+    def render(self, mode='human'):
+        return self.env.render(mode)
+
+    def close(self):
+        self.env.close()
+
+    @property
+    def unwrapped(self):
+        return self.env
+
+
+class GoalConditionedBatchedEnv(BatchedGridWorldEnv):
+    '''BatchedGridWorldEnv in the goal-conditioned mode: every env has its own goal (self.goal),
+    drawn for all reset envs in one vectorized call; the observations get the goal index as last
+    column. Slot j plays the goals of GoalConditionedEnv(env, goals, seed, index=first_index + j).
+    '''
+
+    def __init__(self, env: GridWorldEnv, num_envs: int, goals=None, seed=None, first_index: int = 0):
+        """
+        :param goals: a GoalSet or its goal cells, see GoalSet; one GoalSet can be shared by many engines
+        """
+        self.goal_set = _goal_set(env, goals)
+        self.goal = np.zeros(num_envs, np.int64)
+        self._goal_state = np.zeros(num_envs, np.int64)
+        super(GoalConditionedBatchedEnv, self).__init__(env, num_envs, seed=seed, first_index=first_index)
+
+    def seed(self, seed=None):
+        result = super(GoalConditionedBatchedEnv, self).seed(seed)
+        self._goal_keys = stream_keys(self.noise.entropy, self.noise.indices, tag=GOAL_KEY)
+        return result
+
+    def refresh_setting(self):
+        super(GoalConditionedBatchedEnv, self).refresh_setting()
+        self.goal_set.refresh()
+        self._goal_rewards = self.goal_set.rewards
+        self.observation_space = _as_gym(goal_space(self.env._observation_space, self.goal_set.n_goals))
+
+    def reset(self, mask=None, goals=None):
+        '''reset all envs, or only those where mask is True, and draw their goals
+        :param goals: the goal indices of the reset envs instead of the drawn ones
+        return: the observations of all envs
+        '''
+        if mask is None:
+            mask = np.ones(self.num_envs, bool)
+        super(GoalConditionedBatchedEnv, self).reset(mask)
+        if goals is None:
+            goals = goal_draws(self._goal_keys[mask], self.noise.episodes[mask], self.goal_set.n_goals)
+        self.goal[mask] = goals
+        self._goal_state[mask] = self.goal_set.states[self.goal[mask]]
+        return self._get_obs()
+
+    def _outcome(self, state):
+        return self._goal_rewards[self.goal, state - 1], state == self._goal_state
+
+    def _get_obs(self):
+        observations = super(GoalConditionedBatchedEnv, self)._get_obs()
+        return np.column_stack([observations, self.goal])
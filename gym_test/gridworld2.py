@@ -2,34 +2,67 @@
 General GridWorld Environment
 """
 from typing import List, Tuple
+from collections.abc import MutableMapping
 
 import math
-import gym
-from gym import spaces
-from gym.utils import seeding
 import numpy as np
 import time
-from random import random
+
+# 不导入gym：gym只在渲染时才用到，stable_baselines等导入gym后空间自动转换为gym.spaces
+from env_core import Env, Discrete, np_random
+from layouts import border_walls
+from local_view import LocalViewEncoder
+from seeding import NoiseStream
 # from stable_baselines.common.env_checker import check_env
 # from stable_baselines import PPO2
 # from stable_baselines.common.evaluation import evaluate_policy
 
+# 0,1,2,3 represent left, right, up, down
+ACTION_DX = np.array([-1, 1, 0, 0], np.int64)
+ACTION_DY = np.array([0, 0, 1, -1], np.int64)
+
+# step()返回的info的形式，见GridWorldEnv.set_info_mode
+INFO_MODES = ("full", "lazy", "minimal", "none")
+
+
 class Grid(object):
-    def __init__(self, x: int = None,
-                 y: int = None,
-                 type: int = 0,
-                 reward: float = 0.0,
-                 value: float = 0.0):  # value属性备用
+    '''格子矩阵中一个格子的轻量视图，属性直接读写GridMatrix中的数组
+    '''
+    __slots__ = ("matrix", "x", "y", "index")
+
+    def __init__(self, matrix, x: int, y: int):
+        self.matrix = matrix  # 所属的格子矩阵
         self.x = x  # 坐标x
         self.y = y
-        self.type = type  # 类别值（0：空；1：障碍或边界）
-        self.reward = reward  # 该格子的即时奖励
-        self.value = value  # 该格子的价值，暂没用上
-        self.name = None  # 该格子的名称
-        self._update_name()
+        self.index = (y-1) * matrix.n_width + x-1  # 在数组中的位置
+
+    @property
+    def type(self):  # 类别值（0：空；1：障碍或边界）
+        return self.matrix.get_type(self.x, self.y)
+
+    @type.setter
+    def type(self, type):
+        self.matrix.set_type(self.x, self.y, type)
+
+    @property
+    def reward(self):  # 该格子的即时奖励
+        return self.matrix.get_reward(self.x, self.y)
 
-    def _update_name(self):
-        self.name = "X{0}-Y{1}".format(self.x, self.y)
+    @reward.setter
+    def reward(self, reward):
+        self.matrix.set_reward(self.x, self.y, reward)
+
+    @property
+    def value(self):  # 该格子的价值
+        return self.matrix.get_value(self.x, self.y)
+
+    @value.setter
+    def value(self, value):
+        self.matrix.set_value(self.x, self.y, value)
+
+    @property
+    def name(self):  # 该格子的名称
+        return "X{0}-Y{1}".format(self.x, self.y)
 
     def __str__(self):
         return "name:{4}, x:{0}, y:{1}, type:{2}, value:{3}".format(self.x,
@@ -40,8 +73,56 @@ class Grid(object):
                                                                     )
 
 
+class LazyInfo(MutableMapping):
+    '''step()返回的info，字段在第一次读取时才由env._info_value计算并缓存。
+    只保存step时的状态编号，序列化（pickle）时变为普通的dict
+    '''
+    __slots__ = ("_env", "_state", "_keys", "_values")
+
+    def __init__(self, env, state: int, keys):
+        self._env = env
+        self._state = state
+        self._keys = keys
+        self._values = {"TimeLimit.truncated": False}
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            if key not in self._keys:
+                raise
+        value = self._values[key] = self._env._info_value(key, self._state)
+        return value
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._keys = tuple(k for k in self._keys if k != key)
+        self._values.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._values or key in self._keys
+
+    def __iter__(self):
+        yield from self._keys
+        yield from (k for k in self._values if k not in self._keys)
+
+    def __len__(self):
+        return len(self._keys) + sum(k not in self._keys for k in self._values)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def __repr__(self):
+        return "LazyInfo(%r)" % dict(self)
+
+
 class GridMatrix(object):
     '''格子矩阵，通过不同的设置，模拟不同的格子世界环境
+    类型、奖励、价值分别保存在连续数组中，格子(x, y)位于下标 (y-1)*n_width + x-1
     '''
 
     def __init__(self, n_width: int,  # 水平方向格子数
@@ -50,88 +131,108 @@ class GridMatrix(object):
                  default_reward: float = 0.0,  # 默认即时奖励值
                  default_value: float = 0.0  # 默认价值（这个有点多余）
                  ):
-        self.grids = None
         self.n_height = n_height
         self.n_width = n_width
         self.len = n_width * n_height
         self.default_reward = default_reward
         self.default_value = default_value
         self.default_type = default_type
+        self.version = 0  # 每次修改类型或奖励时加一，环境据此重建查找表
         self.reset()
 
     def reset(self):
-        self.grids = []
-        for x in range(self.n_height):
-            for y in range(self.n_width):
-                self.grids.append(Grid(x+1,
-                                       y+1,
-                                       self.default_type,
-                                       self.default_reward,
-                                       self.default_value))
-
-    def get_grid(self, x, y=None):
-        '''获取一个格子信息
-        args:坐标信息，由x，y表示或仅有一个类型为tuple的x表示
-        return:grid object
-        '''
+        self.version += 1
+        self._types = np.full(self.len, self.default_type, np.int8)
+        self._rewards = np.full(self.len, self.default_reward, np.float64)
+        self._values = np.full(self.len, self.default_value, np.float64)
+        # 只读视图，形状为(n_height, n_width)，[y-1, x-1]对应格子(x, y)
+        self.types = self._read_only(self._types)
+        self.rewards = self._read_only(self._rewards)
+        self.values = self._read_only(self._values)
+
+    def _read_only(self, array):
+        view = array.reshape(self.n_height, self.n_width)
+        view.flags.writeable = False
+        return view
+
+    @property
+    def grids(self):
+        return [Grid(self, index % self.n_width + 1, index // self.n_width + 1) for index in range(self.len)]
+
+    def _index(self, x, y=None):
         xx, yy = None, None
-        if isinstance(x, int):
+        if isinstance(x, (int, np.integer)):
             xx, yy = x, y
         elif isinstance(x, tuple):
             xx, yy = x[0], x[1]
 
         assert (xx >= 1 and yy >= 1 and xx <= self.n_width and yy <= self.n_height), "任意坐标值应在合理区间"
 
-        index = (yy-1) * self.n_width + xx-1
-        return self.grids[index]
+        return (yy-1) * self.n_width + xx-1
+
+    def get_grid(self, x, y=None):
+        '''获取一个格子信息
+        args:坐标信息，由x，y表示或仅有一个类型为tuple的x表示
+        return:grid object
+        '''
+        index = self._index(x, y)
+        return Grid(self, index % self.n_width + 1, index // self.n_width + 1)
 
     def set_reward(self, x, y, reward):
-        grid = self.get_grid(x, y)
-        if grid is not None:
-            grid.reward = reward
-        else:
-            raise ("grid doesn't exist")
+        self._rewards[self._index(x, y)] = reward
+        self.version += 1
 
     def set_value(self, x, y, value):
-        grid = self.get_grid(x, y)
-        if grid is not None:
-            grid.value = value
+        self._values[self._index(x, y)] = value
+
+    def set_values(self, values, mask=None):
+        '''一次设置所有格子的价值
+        args:形状为(n_height, n_width)的数组，mask为True的格子才会被修改
+        '''
+        values = np.asarray(values, np.float64).reshape(self.n_height, self.n_width)
+        target = self._values.reshape(self.n_height, self.n_width)
+        if mask is None:
+            target[...] = values
         else:
-            raise ("grid doesn't exist")
+            target[mask] = values[mask]
 
     def set_type(self, x, y, type):
-        grid = self.get_grid(x, y)
-        if grid is not None:
-            grid.type = type
-        else:
-            raise ("grid doesn't exist")
+        self._types[self._index(x, y)] = type
+        self.version += 1
+
+    def set_types(self, types):
+        '''一次设置所有格子的类型
+        args:形状为(n_height, n_width)的数组
+        '''
+        self._types[:] = np.asarray(types, np.int8).reshape(self.len)
+        self.version += 1
 
     def get_reward(self, x, y):
-        grid = self.get_grid(x, y)
-        if grid is None:
-            return None
-        return grid.reward
+        return self._rewards[self._index(x, y)].item()
 
     def get_value(self, x, y):
-        grid = self.get_grid(x, y)
-        if grid is None:
-            return None
-        return grid.value
+        return self._values[self._index(x, y)].item()
 
     def get_type(self, x, y):
-        grid = self.get_grid(x, y)
-        if grid is None:
-            return None
-        return grid.type
+        return self._types[self._index(x, y)].item()
 
 
-class GridWorldEnv(gym.Env):
+class GridWorldEnv(Env):
     '''格子世界环境，可以模拟各种不同的格子世界
     '''
     metadata = {
         'render.modes': ['human', 'rgb_array'],
         'video.frames_per_second': 30
     }
+    # 动作噪声：以该概率将动作替换为随机动作
+    action_noise = 0.2
+    env_index = 0  # 噪声流的编号，seed(seed, index)设置
+    # "full"模式下info的字段（另加TimeLimit.truncated），子类的_info与之对应
+    INFO_KEYS = ("x", "y")
+    info_mode = "full"
+    info_fields = None
+    _rasterizer = None  # render(mode='rgb_array')用的GridRasterizer，第一次使用时创建
+    _phase_clock = None  # StepProfiler挂上时为其计时函数，step在每个阶段结束时调用；未挂上时不计时
 
     def __init__(self, n_width: int = 7,
                  n_height: int = 7,
@@ -147,6 +248,8 @@ class GridWorldEnv(gym.Env):
         self.height = u_size * n_height  # 场景长度
         self.default_reward = default_reward
         self.default_type = default_type
+        self._tables_dirty = True
+        self._tables_version = None
         self._adjust_size()
 
         self.grids = GridMatrix(n_width=self.n_width,
@@ -158,10 +261,10 @@ class GridWorldEnv(gym.Env):
         self.action = None  # for rendering
 
         # 0,1,2,3 represent left, right, up, down
-        self.action_space = spaces.Discrete(4)
+        self.action_space = Discrete(4)
 
         # 观察空间由low和high决定
-        self.observation_space = spaces.Discrete(self.n_height * self.n_width)
+        self.observation_space = Discrete(self.n_height * self.n_width)
 
         # 坐标原点为左下角，这个pyglet是一致的
         # 通过设置起始点、终止点以及特殊奖励和类型的格子可以构建各种不同类型的格子世界环境
@@ -179,86 +282,229 @@ class GridWorldEnv(gym.Env):
         self._elapsed_steps = None
 
         # set the wall to the grid
-        index = []
-        for i in range(self.n_width):
-            index.append((i+1, 1, 1))
-            index.append((i+1, self.n_width, 1))
-            index.append((1, i+1, 1))
-            index.append((self.n_width, i+1, 1))
-        self.types = index
+        self.types = border_walls(self.n_width, self.n_height)
 
         self.refresh_setting()
 
         self.reset()
 
+    def _update_observation_space(self):
+        self.observation_space = Discrete(self.n_height * self.n_width)
+
+    def set_layout(self, layout, cache=None):
+        """
+        replace the grid world by a layout (see layouts.py), the size may change; call reset() afterwards
+        :param layout: a layouts.Layout (types, start, end and rewards)
+        :param cache: a layouts.TableCache, the compiled tables are taken from it when it has them
+        """
+        if (layout.n_width, layout.n_height) != (self.n_width, self.n_height):
+            self.n_width, self.n_height = layout.n_width, layout.n_height
+            self.width, self.height = self.u_size * self.n_width, self.u_size * self.n_height
+            self.grids = GridMatrix(n_width=self.n_width, n_height=self.n_height, default_reward=self.default_reward,
+                                    default_type=self.default_type, default_value=0.0)
+            if self.viewer is not None:
+                self.viewer.close()
+                self.viewer = None
+        else:
+            self.grids.reset()
+        # 地图写入格子矩阵，types列表清空，refresh_setting之后只会再加上rewards
+        self.grids.set_types(layout.types)
+        self.types = []
+        self.rewards = list(layout.rewards)
+        for x, y, r in self.rewards:
+            self.grids.set_reward(x, y, r)
+        self.start, self.end = layout.start, layout.end
+
+        tables = None
+        if cache is not None:
+            key = cache.key(self, layout)
+            tables = cache.load(key)
+        if tables is None:
+            self._compile_tables()
+            if cache is not None:
+                cache.save(key, self._cached_tables())
+        else:
+            self._restore_tables(tables)
+        self._tables_dirty = False
+        self._update_observation_space()
+        self._elapsed_steps = None
+
+    def _table_signature(self):
+        # 查找表除地图外还依赖的设置，用作缓存键的一部分
+        return [self.default_reward]
+
+    def _cached_tables(self):
+        return {"transition_table": self.transition_table, "reward_table": self.reward_table,
+                "end_table": self.end_table, "type_table": self.type_table}
+
+    def _restore_tables(self, tables):
+        self.transition_table = tables["transition_table"]
+        self.reward_table = tables["reward_table"]
+        self.end_table = tables["end_table"]
+        self.type_table = tables["type_table"]
+        self._tables_version = self.grids.version
+
     def _adjust_size(self):
         '''调整场景尺寸适合最大宽度、高度不超过800
         '''
         pass
 
-    def seed(self, seed=None):
+    def seed(self, seed=None, index=None):
         # 产生一个随机化时需要的种子，同时返回一个np_random对象，支持后续的随机化生成操作
-        self.np_random, seed = seeding.np_random(seed)
+        # 动作噪声来自按(seed, index, episode, step)计数的独立流，见seeding.py；index为并行环境的编号
+        self.np_random, seed = np_random(seed, index)
+        if index is not None:
+            self.env_index = index
+        self.noise = NoiseStream(seed, self.env_index)
         return [seed]
 
+    # 修改以下设置后查找表会在下一次step/reset时自动重建
+    @property
+    def types(self):
+        return self._types
+
+    @types.setter
+    def types(self, types):
+        self._types = types
+        self._tables_dirty = True
+
+    @property
+    def rewards(self):
+        return self._rewards
+
+    @rewards.setter
+    def rewards(self, rewards):
+        self._rewards = rewards
+        self._tables_dirty = True
+
+    @property
+    def start(self):
+        return self._start
+
+    @start.setter
+    def start(self, start):
+        self._start = start
+        self._tables_dirty = True
+
+    @property
+    def end(self):
+        return self._end
+
+    @end.setter
+    def end(self, end):
+        self._end = end
+        self._tables_dirty = True
+
+    @property
+    def ends(self):
+        '''终止格子的列表，end可以是一个坐标(x, y)，也可以是多个坐标的列表'''
+        return [tuple(int(v) for v in end) for end in np.asarray(self.end).reshape(-1, 2)]
+
     def step(self, action):
-        assert self.action_space.contains(action), "%r (%s) invalid" % (action, type(action))
+        # 子类只需重写_observe和_info；instrumentation.StepProfiler通过_phase_clock记录各阶段的结束时间
+        clock = self._phase_clock
+        assert self._elapsed_steps is not None, "cannot call env.step() before calling reset() "
+        assert self._action_space.contains(action), "%r (%s) invalid" % (action, type(action))
+        self._check_tables()
+        if clock is not None:
+            clock()  # tables
         self.action = action  # action for rendering
         # add some noise here
-        r = random()
-        if r <= 0.2:
-            self.action = self.action_space.sample()
-
-        old_x, old_y = self._state_to_xy(self.state)
-        new_x, new_y = old_x, old_y
-
-        if action == 0:
-            new_x -= 1  # left
-        elif action == 1:
-            new_x += 1  # right
-        elif action == 2:
-            new_y += 1  # up
-        elif action == 3:
-            new_y -= 1  # down
-
-        # boundary effect
-        if new_x < 1: new_x = 1
-        if new_x > self.n_width: new_x = self.n_width
-        if new_y < 1: new_y = 1
-        if new_y > self.n_height: new_y = self.n_height
-
-        # wall effect:
-        # when the type of grid is 1, it means that the object couldn't get in
-        if self.grids.get_type(new_x, new_y) == 1:
-            new_x, new_y = old_x, old_y
-
-        self.reward = self.grids.get_reward(new_x, new_y)
-        done = self._is_end_state(new_x, new_y)
-        ### 这里修改状态
-        self.state = self._xy_to_state(new_x, new_y)
-
-        # 提供格子所在信息
-        info = {"x": new_x, "y": new_y, "grids": self.grids, "TimeLimit.truncated": False}
+        if self.action_noise > 0:
+            noise = self.noise.action(self.action_noise, self._action_space.n)
+            if noise >= 0:
+                self.action = noise
+
+        # boundary and wall effect are in the transition table
+        self.state = int(self.transition_table[self.state, self.action])
+        if clock is not None:
+            clock()  # movement
+        observation = self._observe()
+        if clock is not None:
+            clock()  # observation
+
+        self.reward = float(self.reward_table[self.state])
+        done = bool(self.end_table[self.state])
+        if clock is not None:
+            clock()  # reward
+        info = self._info()
+        if clock is not None:
+            clock()  # info
 
         self._elapsed_steps += 1
 
         if self._elapsed_steps >= self._max_episode_steps:
             info['TimeLimit.truncated'] = not done
             done = True
+        if clock is not None:
+            clock()  # time_limit
+
+        return observation, self.reward, done, info
 
-        return self.state, self.reward, done, info
+    def _observe(self):
+        return self.state
 
+    def _info(self):
+        # 提供格子所在信息
+        new_x, new_y = self._state_to_xy(self.state)
+        return {"x": new_x, "y": new_y, "TimeLimit.truncated": False}
 
+    def set_info_mode(self, mode: str = "full", fields=None):
+        """
+        what step() returns as info
+        :param mode: "full": a dict of INFO_KEYS (the default);
+                     "lazy": a LazyInfo, a field is computed only when it is read;
+                     "minimal": only TimeLimit.truncated;
+                     "none": an empty dict (TimeLimit.truncated is only set when the episode is truncated)
+        :param fields: with "full" or "lazy", exactly these fields instead of INFO_KEYS, any of
+                       x, y, state, observation, obs_matrix and grids (a copy of the grid types)
+        """
+        assert mode in INFO_MODES, "unknown info mode %r, use one of %s" % (mode, INFO_MODES)
+        assert fields is None or mode in ("full", "lazy"), "fields need the full or lazy info mode"
+        self.info_mode = mode
+        self.info_fields = None if fields is None else tuple(fields)
+        # 非默认模式以实例属性覆盖_info，默认模式不增加任何开销
+        self.__dict__.pop("_info", None)
+        if mode == "full" and fields is not None:
+            self._info = self._fields_info
+        elif mode == "lazy":
+            self._info = self._lazy_info
+        elif mode == "minimal":
+            self._info = self._minimal_info
+        elif mode == "none":
+            self._info = dict
+
+    def _fields_info(self):
+        info = {key: self._info_value(key, self.state) for key in self.info_fields}
+        info["TimeLimit.truncated"] = False
+        return info
+
+    def _lazy_info(self):
+        return LazyInfo(self, self.state, self.info_fields or self.INFO_KEYS)
+
+    def _minimal_info(self):
+        return {"TimeLimit.truncated": False}
+
+    def _info_value(self, key, state):
+        '''one field of the info of state, see set_info_mode'''
+        if key == "x" or key == "y":
+            x, y = self._state_to_xy(state)
+            return x if key == "x" else y
+        if key == "state" or key == "observation":
+            return state
+        if key == "grids":
+            return self.grids.types.copy()
+        raise KeyError(key)
 
     # 将状态变为横纵坐标
     def _state_to_xy(self, s):
-        y: int = int(s / self.n_width) + 1
-        x: int = int(s % self.n_width)
+        y: int = (s - 1) // self.n_width + 1
+        x: int = (s - 1) % self.n_width + 1
         return x, y
 
     def _xy_to_state(self, x, y=None):
-        if isinstance(x, int):
-            assert (isinstance(y, int)), "incomplete Position info"
+        if isinstance(x, (int, np.ndarray)):
+            assert (isinstance(y, type(x))), "incomplete Position info"
             return self.n_width * (y-1) + x
         elif isinstance(x, tuple):
             return self.n_width * (x[1]-1) + x[0]
@@ -272,10 +518,75 @@ class GridWorldEnv(gym.Env):
             self.grids.set_reward(x, y, r)
         for x, y, t in self.types:
             self.grids.set_type(x, y, t)
+        self._compile_tables()
+        self._tables_dirty = False
+
+    def _check_tables(self):
+        if self._tables_dirty:
+            self.refresh_setting()
+        elif self._tables_version != self.grids.version:
+            self._compile_tables()
+
+    def _compile_tables(self):
+        '''把格子世界编译为按状态索引的查找表，step/reset只做查表。
+        状态s的范围是1..n_width*n_height，第0行不使用。
+        transition_table[s, a]: 执行动作a后的状态（已处理边界与障碍）
+        reward_table[s]: 进入状态s的即时奖励
+        end_table[s]: s是否为终止状态（ends中的任一格子）
+        '''
+        n = self.n_width * self.n_height
+        s = np.arange(1, n + 1)
+        x, y = self._state_to_xy(s)
+
+        type_table = np.zeros(n + 1, np.int64)
+        type_table[1:] = self.grids.types.ravel()
+
+        new_x = np.clip(x[:, None] + ACTION_DX, 1, self.n_width)
+        new_y = np.clip(y[:, None] + ACTION_DY, 1, self.n_height)
+        new_s = self._xy_to_state(new_x, new_y)
+        new_s = np.where(type_table[new_s] == 1, s[:, None], new_s)
+        self.transition_table = np.zeros((n + 1, self._action_space.n), np.int64)
+        self.transition_table[1:] = new_s
+
+        self.reward_table = np.zeros(n + 1, np.float64)
+        self.reward_table[1:] = self._compile_reward_table(x, y)
+
+        ends = np.array(self.ends).reshape(-1, 2)
+        self.end_table = np.zeros(n + 1, bool)
+        self.end_table[self._xy_to_state(ends[:, 0], ends[:, 1])] = True
+
+        self.type_table = type_table
+        self._tables_version = self.grids.version
+
+    def _reachable_states(self):
+        '''从起点出发可以到达的状态（按状态索引的bool数组）'''
+        reached = np.zeros(len(self.transition_table), bool)
+        owner = np.zeros(len(self.transition_table), np.int64)  # 用于去重
+        frontier = np.array([self._xy_to_state(self.start)])
+        reached[frontier] = True
+        while len(frontier):
+            frontier = self.transition_table[frontier].ravel()
+            frontier = frontier[~reached[frontier]]
+            owner[frontier] = np.arange(len(frontier))
+            frontier = frontier[owner[frontier] == np.arange(len(frontier))]
+            reached[frontier] = True
+        return reached
+
+    def _compile_reward_table(self, x, y):
+        return self.grids.rewards.ravel()
+
+    def _goal_reward_table(self, goals):
+        '''(G, n)的奖励表，第g行为以goals[g]为目标时进入状态s的奖励（第s-1列），见goal_conditioned.py；
+        这里的奖励与目标无关，各行是reward_table的同一个视图
+        '''
+        self._check_tables()
+        return np.broadcast_to(self.reward_table[1:], (len(goals), len(self.reward_table) - 1))
 
     def reset(self):
+        self._check_tables()
         self.state = self._xy_to_state(self.start)
         self._elapsed_steps = 0
+        self.noise.start()
         return self.state
 
     # 判断是否是终止状态
@@ -287,13 +598,16 @@ class GridWorldEnv(gym.Env):
         else:
             assert (isinstance(x, tuple)), "坐标数据不完整"
             xx, yy = x[0], x[1]
-        # change the end:
-        # for end in self.ends:
-        #     if xx == end[0] and yy == end[1]:
-        #         return True
-        if xx == self.end[0] and yy == self.end[1]:
-            return True
-        return False
+        # 所有终止格子都在end_table中
+        self._check_tables()
+        return bool(self.end_table[self._xy_to_state(int(xx), int(yy))])
+
+    def _render_array(self):
+        # rgb_array不需要显示器：由rasterizer直接画进NumPy数组，背景按布局缓存
+        if self._rasterizer is None:
+            from rasterizer import GridRasterizer
+            self._rasterizer = GridRasterizer()
+        return self._rasterizer.render(self)
 
     # 图形化界面
     def render(self, mode='human', close=False):
@@ -302,6 +616,8 @@ class GridWorldEnv(gym.Env):
                 self.viewer.close()
                 self.viewer = None
             return
+        if mode == 'rgb_array':
+            return self._render_array()
         zero = (0, 0)
         u_size = self.u_size
         m = 2  # 格子之间的间隙尺寸
@@ -388,12 +704,15 @@ class GridWorldEnv(gym.Env):
 
         self.agent_trans.set_translation((x-1+0.5 ) * u_size, (y -1+0.5) * u_size)
 
-        return self.viewer.render(return_rgb_array=mode == 'rgb_array')
+        return self.viewer.render()
 
 class GridWorldEnvNew(GridWorldEnv):
+    INFO_KEYS = ("x", "y", "state")
 
-    def __init__(self, n_width, n_height, u_size, default_reward, default_type,max_episode_steps):
+    def __init__(self, n_width, n_height, u_size, default_reward, default_type,max_episode_steps, obs_radius=1):
 
+        # 观测为智能体周围(2*obs_radius+1)x(2*obs_radius+1)的格子
+        self.encoder = LocalViewEncoder(obs_radius)
         super(GridWorldEnvNew, self).__init__(n_width=n_width,
                                               n_height=n_height,
                                               u_size= u_size,
@@ -402,20 +721,13 @@ class GridWorldEnvNew(GridWorldEnv):
                                               max_episode_steps= max_episode_steps)
 
 
-        self.observation_space = spaces.Discrete(9)
         # set the start and the end observation
         # set a time limit
         self._max_episode_steps = max_episode_steps
         self._elapsed_steps = None
 
         # set the wall to the grid
-        index = []
-        for i in range(self.n_width):
-            index.append((i+1, 1, 1))
-            index.append((i+1, self.n_width, 1))
-            index.append((1, i+1, 1))
-            index.append((self.n_width, i+1, 1))
-        self.types = index
+        self.types = border_walls(self.n_width, self.n_height)
         self.refresh_setting()
         self.reset()
 
@@ -434,254 +746,176 @@ class GridWorldEnvNew(GridWorldEnv):
         state[7]：[1 1 1, 0 0 0, 0 0 0]
         state[8]: [1 1 1, 0 0 1, 0 0 1]
 
-        return: the index of new states(in the range of (0,8))
-
-        """
-        s0 = list(np.zeros((9, )))
-        s1 = [0, 0, 1,
-              0, 0, 1,
-              0, 0, 1]
-        s2 = [0, 0, 1,
-              0, 0, 1,
-              1, 1, 1]
-        s3 = [0, 0, 0,
-              0, 0, 0,
-              1, 1, 1]
-        s4 = [1, 0, 0,
-              1, 0, 0,
-              1, 1, 1]  # the initial state (1,1)
-        s5 = [1, 0, 0,
-              1, 0, 0,
-              1, 0, 0]
-        s6 = [1, 1, 1,
-              1, 0, 0,
-              1, 0, 0]
-        s7 = [1, 1, 1,
-              0, 0, 0,
-              0, 0, 0]
-        s8 = [1, 1, 1,
-              0, 0, 1,
-              0, 0, 1]
-        s = [s0, s1, s2, s3, s4, s5, s6, s7, s8]
-
-        if isinstance(x, int):
-            assert (isinstance(y, int)),"complete position info"
-            xx, yy = x, y
-        elif isinstance(x, tuple):
-            xx, yy = x[0], x[1]
-
-        states = np.zeros((9,))
-        for i in range(3):
-            for j in range(3):
-                states[i*3+j] = self.grids.get_type(xx - 1 + j, yy + 1 - i)
-        states = list(states)
-        #print("the states is:", states)
-        index = 0
-        for item in s:
-            assert index <= 8, "the object is out of the range "
-            if (states == item):
-                return index
-            index += 1
-        #print("index is:",index)
+        the other patterns (interior obstacles, obs_radius > 1) are numbered from 9 on, see LocalViewEncoder
 
+        return: the index of new states(in the range of (0,n_obs-1)), -1 for unknown patterns
 
-    def step(self, action):
-        assert self.action_space.contains(action), "%r (%s) invalid" % (action, type(action))
-        #self.action = action  # action for rendering
-        # add some noise here
-        r = random()
-        if r <= 0.2:
-            self.action = self.action_space.sample()
-        else:
-            self.action = action  # action for rendering
-        #  the env store the internal state
-        old_x, old_y = self._state_to_xy(self.state)
-        new_x, new_y = old_x, old_y
-
-        if action == 0:
-            new_x -= 1  # left
-        elif action == 1:
-            new_x += 1  # right
-        elif action == 2:
-            new_y += 1  # up
-        elif action == 3:
-            new_y -= 1  # down
-
-        # boundary effect
-        if new_x < 1: new_x = 1
-        if new_x > self.n_width: new_x = self.n_width
-        if new_y < 1: new_y = 1
-        if new_y > self.n_height: new_y = self.n_height
-
-        # wall effect:
-        # when the type of grid is 1, it means that the object couldn't get in
-        if self.grids.get_type(new_x, new_y) == 1:
-            new_x, new_y = old_x, old_y
+        """
+        self._check_tables()
+        return int(self.obs_table[self._xy_to_state(x, y)])
 
+    def _compile_tables(self):
+        '''在父类查找表的基础上增加观测表：
+        obs_matrix_table[s]: 状态s周围窗口内的格子类型（由上到下逐行），地图外视为障碍
+        obs_table[s]: 该窗口对应的观测编号，可到达格子上出现的新模式会得到新的编号
+        '''
+        super(GridWorldEnvNew, self)._compile_tables()
+        types = self.type_table[1:].reshape(self.n_height, self.n_width)
+        windows = self.encoder.windows(types)
+        self._obs_codes = self.encoder.pack(windows)
+        self._obs_reachable = self._reachable_states()[1:]
+        self._fit_observations(windows)
+
+    def _fit_observations(self, windows=None):
+        n = self.n_width * self.n_height
+        self.obs_table = np.full(n + 1, -1, np.int64)
+        self.obs_table[1:] = self.encoder.fit_codes(self._obs_codes, self.n_width, self._obs_reachable, windows)
+        self.obs_matrix_table = np.zeros((n + 1, self.encoder.size ** 2), np.float64)
+        self.obs_matrix_table[1:] = self.encoder.window_table
+
+        self.n_obs = max(9, self.encoder.n_patterns)
+        self._update_observation_space()
+
+    def _table_signature(self):
+        return super(GridWorldEnvNew, self)._table_signature() + [self.encoder.radius]
+
+    def _cached_tables(self):
+        # 只缓存窗口编码，观测编号由编码器重新分配（编号取决于编码器已登记的模式）
+        tables = super(GridWorldEnvNew, self)._cached_tables()
+        tables.update(obs_codes=self._obs_codes, obs_reachable=self._obs_reachable)
+        return tables
+
+    def _restore_tables(self, tables):
+        super(GridWorldEnvNew, self)._restore_tables(tables)
+        self._obs_codes = tables["obs_codes"]
+        self._obs_reachable = tables["obs_reachable"]
+        self._fit_observations()
+
+    def _update_observation_space(self):
+        self.observation_space = Discrete(self.n_obs)
+
+    def _observe(self):
         ### 这里修改第二状态并更新两个状态
+        self.observation = int(self.obs_table[self.state])
+        return self.observation
 
-        self.observation = self._xy_to_obs(new_x, new_y)
-        self.state = self._xy_to_state(new_x, new_y)
-
-        ## reward for observation, internal state
-        self.reward = self.grids.get_reward(new_x, new_y)
-
-        ## judge if the process is finished
-        done_state = self._is_end_state(new_x, new_y)
-
+    def _info(self):
         # 提供格子世界所有的信息在info内
-        info = {"x": new_x, "y": new_y, "grids": self.grids,"state":self.state,"TimeLimit.truncated": False}
+        new_x, new_y = self._state_to_xy(self.state)
+        return {"x": new_x, "y": new_y, "state": self.state, "TimeLimit.truncated": False}
 
-        self._elapsed_steps += 1
-
-        if self._elapsed_steps >= self._max_episode_steps:
-            info['TimeLimit.truncated'] = True
-            done_state = True
-
-        return self.observation, self.reward, done_state, info
+    def _info_value(self, key, state):
+        if key == "observation":
+            return int(self.obs_table[state])
+        if key == "obs_matrix":
+            return list(self.obs_matrix_table[state])
+        return super(GridWorldEnvNew, self)._info_value(key, state)
 
     def reset(self):
+        self._check_tables()
         self.state = self._xy_to_state(self.start)
-        self.observation = self._xy_to_obs(self.start)  # state[4]: [1 0 0, 1 0 0, 1 1 1]
+        self.observation = int(self.obs_table[self.state])  # state[4]: [1 0 0, 1 0 0, 1 1 1]
         self._elapsed_steps = 0
+        self.noise.start()
 
         return self.observation
 
     def render(self, mode='human', close=False):
-        global rendering
         if close:
             if self.viewer is not None:
                 self.viewer.close()
                 self.viewer = None
             return
+        if mode == 'rgb_array':
+            return self._render_array()
         zero = (0, 0)
         u_size = self.u_size
         m = 2  # 格子间间隙
+        r_obs = self.encoder.radius  # 观测窗口半径，3x3窗口为1
 
-        # initialzie our view
+        # initialzie our view：所有geom只在第一次创建，之后每帧只更新变换
         if self.viewer is None:
             from gym.envs.classic_control import rendering
             self.viewer = rendering.Viewer(self.width, self.height)
 
-        # 绘制格子
-        for x in range(self.n_width):
-            for y in range(self.n_height):
-
-                v = [(x * u_size + m, y * u_size + m),
-                     ((x + 1) * u_size - m, y * u_size + m),
-                     ((x + 1) * u_size - m, (y + 1) * u_size - m),
-                     (x * u_size + m, (y + 1) * u_size - m)]
-
-                rect = rendering.FilledPolygon(v)
-                r = self.grids.get_reward(x+1, y+1) / 10
-                if r < 0:
-                    rect.set_color(0.9 - r, 0.9 + r, 0.9 + r)
-                elif r > 0:
-                    rect.set_color(0.3, 0.5 + r, 0.3)
-                else:
-                    rect.set_color(0.9, 0.9, 0.9)
-                self.viewer.add_geom(rect)
-
-                # 绘制边框
-                v_outline = [(x * u_size + m, y * u_size + m),
-                             ((x + 1) * u_size - m, y * u_size + m),
-                             ((x + 1) * u_size - m, (y + 1) * u_size - m),
-                             (x * u_size + m, (y + 1) * u_size - m)]
-                outline = rendering.make_polygon(v_outline, False)
-                outline.set_linewidth(3)
-
-                # 绘制 Observation 的边框
-                # v_obs_outline = [(x * u_size + m, y * u_size + m),
-                #                  ((x + 3) * u_size - m, y * u_size + m),
-                #                  ((x + 3) * u_size - m, (y + 3) * u_size - m ),
-                #                  (x * u_size + m, (y + 3) * u_size - m)]
-                v_obs_outline = [((x - 1) * u_size + m, (y - 1) * u_size + m),
-                                 ((x + 2) * u_size, (y - 1) * u_size + m),
-                                 ((x + 2) * u_size, (y + 2) * u_size),
-                                 ((x - 1) * u_size + m, (y + 2) * u_size)]
-
-                obs_outline = rendering.make_polygon(v_obs_outline, False)
-                obs_outline.set_linewidth(3)
-
-                if self._is_end_state(x+1, y+1):
-                    # 给终点方格添加金黄色边框
-                    outline.set_color(0.9, 0.9, 0)
-                    obs_outline.set_color(0.9, 0.9, 0)
-                    self.viewer.add_geom(outline)
-                    self.viewer.add_geom(obs_outline)
-
-
-                if self.start[0] == (x+1) and self.start[1] == (y+1):
-                    # 添加起始点方格
-                    outline.set_color(0.5, 0.5, 0.8)
-                    self.viewer.add_geom(outline)
-                    # 添加起始点的九格方框
-                    obs_outline.set_color(0.5, 0.5, 0.8)
-                    self.viewer.add_geom(obs_outline)
-
-                if self.grids.get_type(x+1, y+1) == 1:  # 障碍格子用深灰色表示
-                    rect.set_color(0.3, 0.3, 0.3)
-                else:
-                    pass
-
-        # set the agent part
-
-        # 填充一个矩形
-        # self.agent_obs = rendering.make_polygon([((1 - 1) * u_size + m, (1 - 1) * u_size + m),
-        #                                       ((1 + 2) * u_size, (1 - 1) * u_size + m),
-        #                                       ((1 + 2) * u_size, (1 + 2) * u_size),
-        #                                       ((1 - 1) * u_size + m, (1 + 2) * u_size)], True)
-        self.agent_obs = rendering.make_polygon([((1 - 1) * u_size , (1 - 1) * u_size ),
-                                                 ((1 + 2) * u_size , (1 - 1) * u_size ),
-                                                 ((1 + 2) * u_size , (1 + 2) * u_size),
-                                                 ((1 - 1) * u_size , (1 + 2) * u_size)], True)
-        self.agent_obs.set_color(1, 1, 204/255.)
-        self.viewer.add_geom(self.agent_obs)
-        self.agent_obs_trans = rendering.Transform()
-        self.agent_obs.add_attr(self.agent_obs_trans)
+            # 绘制格子
+            for x in range(self.n_width):
+                for y in range(self.n_height):
 
-        # update the position of agent
-        x, y = self._state_to_xy(self.state)
-        self.agent_obs_trans.set_translation( (x-1 -1) * u_size, (y-1 -1)  * u_size)
+                    v = [(x * u_size + m, y * u_size + m),
+                         ((x + 1) * u_size - m, y * u_size + m),
+                         ((x + 1) * u_size - m, (y + 1) * u_size - m),
+                         (x * u_size + m, (y + 1) * u_size - m)]
 
+                    rect = rendering.FilledPolygon(v)
+                    r = self.grids.get_reward(x+1, y+1) / 10
+                    if r < 0:
+                        rect.set_color(0.9 - r, 0.9 + r, 0.9 + r)
+                    elif r > 0:
+                        rect.set_color(0.3, 0.5 + r, 0.3)
+                    else:
+                        rect.set_color(0.9, 0.9, 0.9)
+                    self.viewer.add_geom(rect)
+
+                    # 绘制边框
+                    v_outline = [(x * u_size + m, y * u_size + m),
+                                 ((x + 1) * u_size - m, y * u_size + m),
+                                 ((x + 1) * u_size - m, (y + 1) * u_size - m),
+                                 (x * u_size + m, (y + 1) * u_size - m)]
+                    outline = rendering.make_polygon(v_outline, False)
+                    outline.set_linewidth(3)
 
-        # 绘制圆心
-        self.agent = rendering.make_circle(u_size / 4, 30, True)
-        self.agent.set_color(1.0, 1.0, 0)
-        #self.viewer.add_geom(self.agent)
-        self.agent_trans = rendering.Transform()
-        self.agent.add_attr(self.agent_trans)
-        self.agent_trans.set_translation((x + 0.5) * u_size, (y + 0.5) * u_size)
+                    # 绘制 Observation 的边框
+                    v_obs_outline = [((x - r_obs) * u_size + m, (y - r_obs) * u_size + m),
+                                     ((x + 1 + r_obs) * u_size, (y - r_obs) * u_size + m),
+                                     ((x + 1 + r_obs) * u_size, (y + 1 + r_obs) * u_size),
+                                     ((x - r_obs) * u_size + m, (y + 1 + r_obs) * u_size)]
+
+                    obs_outline = rendering.make_polygon(v_obs_outline, False)
+                    obs_outline.set_linewidth(3)
+
+                    if self._is_end_state(x+1, y+1):
+                        # 给终点方格添加金黄色边框
+                        outline.set_color(0.9, 0.9, 0)
+                        obs_outline.set_color(0.9, 0.9, 0)
+                        self.viewer.add_geom(outline)
+                        self.viewer.add_geom(obs_outline)
+
+                    if self.start[0] == (x+1) and self.start[1] == (y+1):
+                        # 添加起始点方格
+                        outline.set_color(0.5, 0.5, 0.8)
+                        self.viewer.add_geom(outline)
+                        # 添加起始点的九格方框
+                        obs_outline.set_color(0.5, 0.5, 0.8)
+                        self.viewer.add_geom(obs_outline)
+
+                    if self.grids.get_type(x+1, y+1) == 1:  # 障碍格子用深灰色表示
+                        rect.set_color(0.3, 0.3, 0.3)
+
+            # set the agent part：观测窗口，填充一个(2r+1)x(2r+1)格的矩形
+            size = (2 * r_obs + 1) * u_size
+            self.agent_obs = rendering.make_polygon([(0, 0), (size, 0), (size, size), (0, size)], True)
+            self.agent_obs.set_color(1, 1, 204/255.)
+            self.viewer.add_geom(self.agent_obs)
+            self.agent_obs_trans = rendering.Transform()
+            self.agent_obs.add_attr(self.agent_obs_trans)
+
+        # update the position of agent
+        x, y = self._state_to_xy(self.state)
+        self.agent_obs_trans.set_translation((x - 1 - r_obs) * u_size, (y - 1 - r_obs) * u_size)
 
-        return self.viewer.render(return_rgb_array=mode == "rgb_array")
+        return self.viewer.render()
 
-    def evaluate(model, num_episodes=100):
+    def evaluate(self, model, num_episodes=100, num_envs=1):
         """
-        Evaluate a RL agent
-        :param model: (BaseRLModel object) the RL Agent
+        Evaluate a RL agent on copies of this env, see evaluation.evaluate_policy
+        :param model: (BaseRLModel object) the RL Agent, or a function observations -> actions
         :param num_episodes: (int) number of episodes to evaluate it
+        :param num_envs: number of episodes run together (recurrent models need their n_envs)
         :return: (float) Mean reward for the last num_episodes
         """
-        # This function will only work for a single Environment
-        env = model.get_env()
-        all_episode_rewards = []
-        for i in range(num_episodes):
-            episode_rewards = []
-            done = False
-            obs = env.reset
-            while not done:
-                # _states are only useful when using LSTM policies
-                action, _states = model.predict(obs)
-                # here, action, rewards and dones are arrays
-                obs, reward, done, info = env.step(action)
-                episode_rewards.append(reward)
-
-            all_episode_rewards.append(sum(episode_rewards))
-
-        mean_episode_reward = np.mean(all_episode_rewards)
-        # print("Mean reward:", mean_episode_reward, "Num episodes:", num_episodes)
-
-        return mean_episode_reward
+        from evaluation import evaluate_policy
+        return evaluate_policy(model, self, num_episodes=num_episodes, num_envs=num_envs).mean_return
 
 if __name__ == "__main__":
 
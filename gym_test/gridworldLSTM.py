@@ -0,0 +1,126 @@
+"""
+POMDP environment whose observation is the state predicted by a trained LSTM
+"""
+import numpy as np
+
+from env_core import Discrete
+from gridworldRNN import GridWorldEnvRnn
+from numpy_lstm import NumpyLstmStatePredictor
+
+
+class LstmStatePredictor(object):
+    '''Runs the state estimator (Embedding -> LSTM -> Dense -> softmax, see
+    pomdp_colab/embedding_lstm.ipynb) one time step at a time.
+
+    The hidden and cell state of every env are carried across steps, so a step
+    costs one LSTM cell update instead of re-running the whole input sequence.
+    Because the LSTM is causal, the predictions are the same as running the
+    trained model over the full sequence.
+    '''
+
+    def __init__(self, model, num_envs: int = 1):
+        """
+        :param model: a trained keras model, or the path to load it from
+        :param num_envs: number of envs predicted together
+        """
+        from keras.models import load_model
+        if isinstance(model, str):
+            model = load_model(model)
+        self.num_envs = num_envs
+        self.step_model = self._build_step_model(model)
+        self.h = np.zeros((num_envs, self.units), np.float32)
+        self.c = np.zeros((num_envs, self.units), np.float32)
+
+    def _build_step_model(self, model):
+        # the same layers as the trained model, for one time step and with explicit states
+        from keras.layers import Input, Embedding, Reshape, LSTM, TimeDistributed, Dense, Activation
+        from keras.models import Model
+
+        embedding = [l for l in model.layers if isinstance(l, Embedding)][0]
+        lstm = [l for l in model.layers if isinstance(l, LSTM)][0]
+        dense = [l.layer if isinstance(l, TimeDistributed) else l for l in model.layers
+                 if isinstance(l, Dense) or (isinstance(l, TimeDistributed) and isinstance(l.layer, Dense))][-1]
+        self.n_inputs = int(model.input_shape[-1])
+        self.units = lstm.units
+        self.n_states = dense.units
+
+        x = Input(batch_shape=(None, 1, self.n_inputs))
+        h0 = Input(shape=(self.units,))
+        c0 = Input(shape=(self.units,))
+        e = Embedding(embedding.input_dim, embedding.output_dim, weights=embedding.get_weights())(x)
+        e = Reshape((1, self.n_inputs * embedding.output_dim))(e)
+        out, h, c = LSTM(self.units, return_sequences=True, return_state=True,
+                         activation=lstm.activation, recurrent_activation=lstm.recurrent_activation,
+                         weights=lstm.get_weights())(e, initial_state=[h0, c0])
+        y = TimeDistributed(Dense(self.n_states, weights=dense.get_weights()))(out)
+        y = Activation('softmax')(y)
+        return Model(inputs=[x, h0, c0], outputs=[y, h, c])
+
+    def reset(self, mask=None):
+        '''start new sequences for all envs, or only those where mask is True'''
+        if mask is None:
+            self.h[...] = 0
+            self.c[...] = 0
+        else:
+            self.h[mask] = 0
+            self.c[mask] = 0
+
+    def predict(self, inputs):
+        """
+        :param inputs: (num_envs, n_inputs) array of [action, observation_matrix]
+        :return: (num_envs, n_states) probabilities of the states
+        """
+        x = np.asarray(inputs, np.float32).reshape(self.num_envs, 1, self.n_inputs)
+        y, self.h, self.c = self.step_model.predict_on_batch([x, self.h, self.c])
+        return np.asarray(y)[:, 0]
+
+    def predict_state(self, inputs):
+        return np.argmax(self.predict(inputs), axis=-1)
+
+
+class GridWorldEnvLstm(GridWorldEnvRnn):
+    '''the observation is the state predicted from the [action, observation_matrix] history'''
+
+    def __init__(self, n_width, n_height, u_size, default_type, max_episode_steps, default_reward,
+                 predictor=None, model_path='my_lstm_model_2.0'):
+
+        # load the lstm model, weights exported to .npz run without TensorFlow
+        if predictor is None and model_path.endswith('.npz'):
+            predictor = NumpyLstmStatePredictor.load(model_path)
+        elif predictor is None:
+            predictor = LstmStatePredictor(model_path)
+        self.predictor = predictor
+        self.predicted_state = None
+
+        super(GridWorldEnvLstm, self).__init__(n_width=n_width,
+                                               n_height=n_height,
+                                               u_size=u_size,
+                                               default_type=default_type,
+                                               default_reward=default_reward,
+                                               max_episode_steps=max_episode_steps
+                                               )
+
+    def _update_observation_space(self):
+        self.observation_space = Discrete(self.n_width * self.n_height)
+
+    def lstm_model(self, input):
+        """
+        :param input (array): [action,observation_matrix] with the shape(10,)
+        for example(array): [action,obs]=[3, 0, 0, 1, 0, 0, 1, 0, 0, 1]
+        :return: predicated state: [new_obst]=23 ; the number is in the range of [1,100]
+        """
+        return int(self.predictor.predict_state(np.asarray(input)[None])[0])
+
+    def step(self, action):
+        _, reward, done, info = super(GridWorldEnvLstm, self).step(action)
+        x = np.hstack((self.action, self.obs_matrix_table[self.state]))
+        self.predicted_state = self.lstm_model(x)
+        return self.predicted_state, reward, done, info
+
+    def reset(self):
+        super(GridWorldEnvLstm, self).reset()
+        self.predictor.reset()
+        # the first input of a sequence is [0, observation matrix of the start]
+        x = np.hstack((self.action, self.obs_matrix_table[self.state]))
+        self.predicted_state = self.lstm_model(x)
+        return self.predicted_state
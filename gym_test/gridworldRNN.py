@@ -1,14 +1,22 @@
 from gridworld2 import *
+from env_core import MultiDiscrete
+from history import HistoryBuffer
+from reward_fields import nearest_reward, reward_fields
 
-class GridWorldEnvRnn(GridWorldEnvNew, gym.Wrapper):
-    def __init__(self, n_width, n_height, u_size, default_type, max_episode_steps,default_reward):
+class GridWorldEnvRnn(GridWorldEnvNew):
+    # the rnn envs are deterministic, see the commented noise in step()
+    action_noise = 0.0
+    INFO_KEYS = ("x", "y", "state", "obs_matrix")
+
+    def __init__(self, n_width, n_height, u_size, default_type, max_episode_steps,default_reward, obs_radius=1):
 
         super(GridWorldEnvRnn, self).__init__(n_width=n_width,
                                               n_height=n_height,
                                               u_size=u_size,
                                               default_type=default_type,
                                               default_reward=default_reward,
-                                              max_episode_steps=max_episode_steps
+                                              max_episode_steps=max_episode_steps,
+                                              obs_radius=obs_radius
                                               )
         # Todo
         self.reward = default_reward
@@ -16,46 +24,69 @@ class GridWorldEnvRnn(GridWorldEnvNew, gym.Wrapper):
         self.observation = None
         self.input = None
         self.state = None
-        # first is action, second is observation
-        self.observation_space = spaces.MultiDiscrete([4, 9])
-
         self.start = (2, 2)
         self.end = (5, 6)
 
-        # find the largest distance between the state and the end state for normalization:
-        n_width_max = max([np.abs(i+2 - self.end[0]) for i in range(self.n_width-2)])
-        n_height_max = max([np.abs(i+2 - self.end[1]) for i in range(self.n_height-2)])
-        self.n_max = n_height_max+n_width_max
-
         # set a time limit
         self._max_episode_steps = max_episode_steps
         self._elapsed_steps = None
 
 
         # set the wall to the grid:
-        index = []
-        for i in range(self.n_width):
-            index.append((i+1, 1, 1))
-            index.append((i+1, self.n_width, 1))
-            index.append((1, i+1, 1))
-            index.append((self.n_width, i+1, 1))
-        self.types = index
+        self.types = border_walls(self.n_width, self.n_height)
         self.refresh_setting()
 
         self.reset()
 
+    def _update_observation_space(self):
+        # first is action, second is observation
+        self.observation_space = MultiDiscrete([4, self.n_obs])
+
+    # 奖励为到终点的距离（按n_max归一化）的负值，"l1"或"bfs"（绕开障碍的最短步数），见reward_fields.py
+    @property
+    def reward_metric(self):
+        return self.__dict__.get("_reward_metric", "l1")
+
+    @reward_metric.setter
+    def reward_metric(self, metric):
+        self._reward_metric = metric
+        self._tables_dirty = True
+
+    def _compile_reward_table(self, x, y):
+        # the field of (layout, ends, metric) is computed once and shared by all envs, n_max is the largest
+        # distance to the end for normalization; with several ends the reward follows the nearest one,
+        # normalized by the largest n_max of the ends
+        self.reward_field = reward_fields(self.grids.types, self.ends, self.reward_metric)
+        self.n_max = int(self.reward_field["n_max"].max())
+        return nearest_reward(self.reward_field).ravel()
+
+    def _goal_reward_table(self, goals):
+        # the reward fields of all goals, read-only views of the shared cache
+        self._check_tables()
+        fields = reward_fields(self.grids.types, goals, self.reward_metric)
+        return fields["reward"].reshape(len(goals), -1)
+
+    def _table_signature(self):
+        return super(GridWorldEnvRnn, self)._table_signature() + [self.reward_metric]
+
+    def _cached_tables(self):
+        tables = super(GridWorldEnvRnn, self)._cached_tables()
+        tables["n_max"] = np.array(self.n_max)
+        return tables
+
+    def _restore_tables(self, tables):
+        super(GridWorldEnvRnn, self)._restore_tables(tables)
+        self.n_max = tables["n_max"].item()
+
     def get_reward(self, x, y):
         """
-        we get the reward function through the L1 norm between the current state and end state
+        we get the reward function through the L1 norm (or the metric of reward_metric) between the
+        current state and end state
         :param state: the current state of the agent
         :return: the reward
         """
-
-        # redefine the end
-        l_1 = np.abs(x-self.end[0]) + np.abs(y-self.end[1])
-        reward = -1*l_1/self.n_max
-
-        return reward
+        self._check_tables()
+        return self.reward_table[self._xy_to_state(x, y)]
 
 
     def _xy_to_obs_matrix(self, x, y=None):
@@ -73,244 +104,113 @@ class GridWorldEnvRnn(GridWorldEnvNew, gym.Wrapper):
         state[7]：[1 1 1, 0 0 0, 0 0 0]
         state[8]: [1 1 1, 0 0 1, 0 0 1]
 
-        return: the index of new states(in the range of (0,8))
+        return: the 3x3 grid types around (x, y), read row by row from the top
 
         """
-        s0 = list(np.zeros((9, )))
-        s1 = [0, 0, 1,
-              0, 0, 1,
-              0, 0, 1]
-        s2 = [0, 0, 1,
-              0, 0, 1,
-              1, 1, 1]
-        s3 = [0, 0, 0,
-              0, 0, 0,
-              1, 1, 1]
-        s4 = [1, 0, 0,
-              1, 0, 0,
-              1, 1, 1]  # the initial state (1,1)
-        s5 = [1, 0, 0,
-              1, 0, 0,
-              1, 0, 0]
-        s6 = [1, 1, 1,
-              1, 0, 0,
-              1, 0, 0]
-        s7 = [1, 1, 1,
-              0, 0, 0,
-              0, 0, 0]
-        s8 = [1, 1, 1,
-              0, 0, 1,
-              0, 0, 1]
-        s = [s0, s1, s2, s3, s4, s5, s6, s7, s8]
-
-        if isinstance(x, int):
-            assert (isinstance(y, int)),"complete position info"
-            xx, yy = x, y
-        elif isinstance(x, tuple):
-            xx, yy = x[0], x[1]
-
-        states = np.zeros((9,))
-        for i in range(3):
-            for j in range(3):
-                states[i*3+j] = self.grids.get_type(xx - 1 + j, yy + 1 - i)
-        states = list(states)
-        # print("the states is:", states)
-        return states
-
-
-
-    def step(self,action):
-        assert self._elapsed_steps is not None, "cannot call env.step() before calling reset() "
-        assert self.action_space.contains(action), "%r (%s) invalid" % (action, type(action))
-        ## to do the step part
-        # add some noise here
-        #r = random()
-        # if r <= 0.2:
-        #     self.action = self.action_space.sample()
-        # else:
-        #     self.action = action  # action for rendering
-        self.action = action
-        #  the env store the internal state
-        old_x, old_y = self._state_to_xy(self.state)
-        new_x, new_y = old_x, old_y
-
-        if action == 0:
-            new_x -= 1  # left
-        elif action == 1:
-            new_x += 1  # right
-        elif action == 2:
-            new_y += 1  # up
-        elif action == 3:
-            new_y -= 1  # down
-
-        # boundary effect
-        if new_x < 1: new_x = 1
-        if new_x > self.n_width: new_x = self.n_width
-        if new_y < 1: new_y = 1
-        if new_y > self.n_height: new_y = self.n_height
-
-
-        # wall effect:
-        # when the type of grid is 1, it means that the object couldn't get in
-        if self.grids.get_type(new_x, new_y) == 1: new_x, new_y = old_x, old_y
+        self._check_tables()
+        return list(self.obs_matrix_table[self._xy_to_state(x, y)])
+
 
+
+    def _observe(self):
         # 修改状态，观测值
-        self.observation = self._xy_to_obs(new_x, new_y)
-        self.state = self._xy_to_state(new_x, new_y)
-        obs_matrix = self._xy_to_obs_matrix(new_x, new_y)
-        # print("position is :", (new_x, new_y))
-        # print("the state is:", self.state)
+        self.observation = int(self.obs_table[self.state])
         # change the whole observation part
         self.input = np.asarray([self.action, self.observation], np.int64)
+        return self.input
 
-        # reward for the state(obs)
-        self.reward = self.get_reward(new_x, new_y)
-
-        # judge if the process is finished
-        done = self._is_end_state(new_x, new_y)
-
+    def _info(self):
         # 提供格子所在信息
-        info = {"x": new_x, "y": new_y, "state":self.state,"grids": self.grids, "TimeLimit.truncated": False, "obs_matrix":obs_matrix}
-
-        self._elapsed_steps += 1
-
-        if self._elapsed_steps >= self._max_episode_steps:
-            info['TimeLimit.truncated'] = not done
-            done = True
-
-        return self.input, self.reward, done, info
-
+        new_x, new_y = self._state_to_xy(self.state)
+        obs_matrix = list(self.obs_matrix_table[self.state])
+        return {"x": new_x, "y": new_y, "state": self.state, "TimeLimit.truncated": False, "obs_matrix": obs_matrix}
 
     def reset(self):
+        self._check_tables()
         self.state = self._xy_to_state(self.start)
-        self.observation = self._xy_to_obs(self.start)
+        self.observation = int(self.obs_table[self.state])
         self.action = 0
         self._elapsed_steps = 0
+        self.noise.start()
         # Todo
         self.input = np.asarray([self.action, self.observation], np.int64)
         return self.input, self.state
 
 class GridWorldEnvRnnNew(GridWorldEnvRnn):
-    def __init__(self, n_width, n_height, u_size, default_type, max_episode_steps,default_reward,num_obs):
+    INFO_KEYS = ("x", "y", "observation")
 
+    def __init__(self, n_width, n_height, u_size, default_type, max_episode_steps,default_reward,num_obs, obs_radius=1,
+                 copy_obs=False):
+
+        self.num_obs = num_obs
+        # the observation is filled in place into self.input, set copy_obs to get a new array per step
+        self.copy_obs = copy_obs
+        self.history = HistoryBuffer(num_obs)
         super(GridWorldEnvRnnNew, self).__init__(n_width=n_width,
                                               n_height=n_height,
                                               u_size=u_size,
                                               default_type=default_type,
                                               default_reward=default_reward,
-                                               max_episode_steps=max_episode_steps
+                                               max_episode_steps=max_episode_steps,
+                                               obs_radius=obs_radius
                                                 )
 
-
-        self.num_obs = num_obs
-        lst1 = [9 for i in range(self.num_obs)] + [4 for i in range(self.num_obs)]
-        self.observation_space = spaces.MultiDiscrete(lst1)
-        self.obs_list = [self.observation for i in range(self.num_obs)]
-        self.act_list = [self.action for i in range(self.num_obs)]
         # print("observation space:", self.observation_space)
         # print("the num obs",self.num_obs)
 
 
-        # find the largest distance between the state and the end state for normalization:
-        n_width_max = max([np.abs(i+2 - self.end[0]) for i in range(self.n_width-2)])
-        n_height_max = max([np.abs(i+2 - self.end[1]) for i in range(self.n_height-2)])
-        self.n_max = n_height_max+n_width_max
-
         # set the wall to the grid:
-        index = []
-        for i in range(self.n_width):
-            index.append((i+1, 1, 1))
-            index.append((i+1, self.n_width, 1))
-            index.append((1, i+1, 1))
-            index.append((self.n_width, i+1, 1))
-        self.types = index
+        self.types = border_walls(self.n_width, self.n_height)
         self.refresh_setting()
 
         self.reset()
 
-    def step(self, action):
-        assert self._elapsed_steps is not None, "cannot call env.step() before calling reset() "
-        assert self.action_space.contains(action), "%r (%s) invalid" % (action, type(action))
-        ## to do the step part
-        # add some noise here
-        #r = random()
-        # if r <= 0.2:
-        #     self.action = self.action_space.sample()
-        # else:
-        #     self.action = action  # action for rendering
-        self.action = action
-        #  the env store the internal state
-        old_x, old_y = self._state_to_xy(self.state)
-        new_x, new_y = old_x, old_y
-
-        if action == 0:
-            new_x -= 1  # left
-        elif action == 1:
-            new_x += 1  # right
-        elif action == 2:
-            new_y += 1  # up
-        elif action == 3:
-            new_y -= 1  # down
-
-        # boundary effect
-        if new_x < 1: new_x = 1
-        if new_x > self.n_width: new_x = self.n_width
-        if new_y < 1: new_y = 1
-        if new_y > self.n_height: new_y = self.n_height
-
-
-        # wall effect:
-        # when the type of grid is 1, it means that the object couldn't get in
-        if self.grids.get_type(new_x, new_y) == 1: new_x, new_y = old_x, old_y
+    @property
+    def obs_list(self):
+        return self.history.observations.tolist()
 
-        # 修改状态，观测值
-        self.observation = self._xy_to_obs(new_x, new_y)
+    @property
+    def act_list(self):
+        return self.history.actions.tolist()
 
-        #print("the new obs:", self.observation)
-        # store the new observation to the list
-        self.obs_list.insert(0, self.obs_list.pop())
-        self.obs_list[0] = self.observation
-        # store the action to the list
-        self.act_list.insert(0, self.act_list.pop())
-        self.act_list[0] = self.action
+    def _update_observation_space(self):
+        lst1 = [self.n_obs for i in range(self.num_obs)] + [4 for i in range(self.num_obs)]
+        self.observation_space = MultiDiscrete(lst1)
 
-        self.state = self._xy_to_state(new_x, new_y)
+    def _observe(self):
+        # 修改状态，观测值
+        self.observation = int(self.obs_table[self.state])
+        # store the new observation and action to the history
+        self.history.push(self.observation, self.action)
         # change the whole observation part
-        self.input = np.asarray(self.obs_list+self.act_list, np.int64)
-
-        # reward for the state(obs)
-        self.reward = self.get_reward(new_x, new_y)
-
-        # judge if the process is finished
-        done = self._is_end_state(new_x, new_y)
+        self.input = self._history_input()
+        return self.input
 
+    def _info(self):
         # 提供格子所在信息
-        info = {"x": new_x, "y": new_y, "grids": self.grids, "TimeLimit.truncated": False,"observation": self.observation}
-
-        self._elapsed_steps += 1
-
-        if self._elapsed_steps >= self._max_episode_steps:
-            info['TimeLimit.truncated'] = not done
-            done = True
-
-        return self.input, self.reward, done, info
-
+        new_x, new_y = self._state_to_xy(self.state)
+        return {"x": new_x, "y": new_y, "TimeLimit.truncated": False, "observation": self.observation}
 
     def reset(self):
+        self._check_tables()
         self.state = self._xy_to_state(self.start)
-        self.observation = self._xy_to_obs(self.start)
+        self.observation = int(self.obs_table[self.state])
         #print("the observation:",self.observation)
         self.action = 0
         self._elapsed_steps = 0
-        # Todo
-        self.num_obs=4
-        self.obs_list = [self.observation for i in range(self.num_obs)]
-        self.act_list = [self.action for i in range(self.num_obs)]
-        #self.obs_list = [self.observation, self.observation, self.observation, self.observation]
-        #print(self.obs_list)
-        self.input = np.asarray(self.obs_list+self.act_list, np.int64)
+        self.noise.start()
+        if self.history.length != self.num_obs:
+            self.history = HistoryBuffer(self.num_obs)
+            self._update_observation_space()
+        self.history.reset(self.observation, self.action)
+        self.input = self._history_input()
         return self.input
 
+    def _history_input(self):
+        if self.copy_obs:
+            return self.history.fill().copy()
+        return self.history.fill()
+
     def print_obs(self):
         print(self.num_obs)
 
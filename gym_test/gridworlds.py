@@ -0,0 +1,75 @@
+"""
+One import for the gridworld code: the envs (layout, dynamics, observations) are loaded with this
+module and need only NumPy; batching adapters, recording, datasets, solvers and profiling are loaded
+from their modules on first use
+
+    import gridworlds
+    env = gridworlds.GridWorldEnvRnnNew(...)          # NumPy only
+    solver = gridworlds.PointBasedSolver(env)        # imports belief, planning and pbvi now
+"""
+import importlib
+
+from env_core import Discrete, Env, MultiDiscrete
+from gridworld2 import GridMatrix, GridWorldEnv, GridWorldEnvNew, LazyInfo
+from gridworldRNN import GridWorldEnvRnn, GridWorldEnvRnnNew
+from history import HistoryBuffer
+from layouts import GENERATORS, Layout, TableCache, generate, layout_stream
+from local_view import LocalViewEncoder
+from seeding import BatchNoise, NoiseStream
+
+# name -> module, imported by __getattr__ when the name is first used
+_LAZY = {
+    "BatchedGridWorldEnv": "batched_gridworld",
+    "BatchedVecEnv": "batched_gridworld",  # stable_baselines
+    "ParallelRolloutCollector": "parallel_rollout",  # stable_baselines
+    "SharedArrays": "parallel_rollout",
+    "TrajectoryRecorder": "recorder",
+    "load_trajectories": "recorder",
+    "TrajectoryDataset": "trajectory_dataset",
+    "DatasetWriter": "trajectory_dataset",
+    "convert_csv": "trajectory_dataset",
+    "TbpttBatchGenerator": "tbptt",
+    "BeliefTracker": "belief",
+    "BeliefObservationWrapper": "belief",  # gym
+    "MdpModel": "planning",
+    "value_iteration": "planning",
+    "policy_iteration": "planning",
+    "PointBasedSolver": "pbvi",
+    "AlphaVectorPolicy": "pbvi",
+    "evaluate_policy": "evaluation",
+    "EvaluationResult": "evaluation",
+    "StepProfiler": "instrumentation",
+    "cprofile_session": "instrumentation",
+    "pyinstrument_session": "instrumentation",  # pyinstrument
+    "rollout": "kernels",  # numba (optional)
+    "evaluate_table_policy": "kernels",
+    "GridRasterizer": "rasterizer",
+    "record_episodes": "rasterizer",
+    "save_video": "rasterizer",
+    "reward_fields": "reward_fields",
+    "distance_fields": "reward_fields",
+    "GoalSet": "goal_conditioned",
+    "GoalConditionedEnv": "goal_conditioned",
+    "GoalConditionedBatchedEnv": "goal_conditioned",
+    "NumpyLstmStatePredictor": "numpy_lstm",
+    "export_weights": "numpy_lstm",
+    "GridWorldEnvLstm": "gridworldLSTM",
+    "LstmStatePredictor": "gridworldLSTM",
+}
+
+# only the core, so that "from gridworlds import *" stays light
+__all__ = ["Discrete", "Env", "MultiDiscrete", "GridMatrix", "GridWorldEnv", "GridWorldEnvNew", "LazyInfo",
+           "GridWorldEnvRnn", "GridWorldEnvRnnNew", "HistoryBuffer", "LocalViewEncoder",
+           "GENERATORS", "Layout", "TableCache", "generate", "layout_stream", "BatchNoise", "NoiseStream"]
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = globals()[name] = getattr(importlib.import_module(module), name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
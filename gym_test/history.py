@@ -0,0 +1,61 @@
+"""
+Truncated history of observations and actions for the GridWorldEnvRnnNew envs
+"""
+import numpy as np
+
+
+class HistoryBuffer(object):
+    '''保存最近length个观测和动作（最新的在前），可以是单个环境也可以是一批环境。
+
+    使用长度为2*length的环形缓冲区：每个值同时写在pos和pos+length处，
+    因此[pos, pos+length)总是一段连续的、按从新到旧排列的视图，
+    step时不需要移动数据，也不需要分配内存。
+    '''
+
+    def __init__(self, length: int, batch_shape=(), dtype=np.int64):
+        assert length >= 1, "the history needs at least one entry"
+        self.length = length
+        self.batch_shape = tuple(batch_shape)
+        self._obs = np.zeros(self.batch_shape + (2 * length,), dtype)
+        self._act = np.zeros(self.batch_shape + (2 * length,), dtype)
+        self._pos = 0  # 最新值所在的位置
+        # the default output of fill(): observations then actions
+        self.out = np.zeros(self.batch_shape + (2 * length,), dtype)
+
+    def reset(self, observation, action=0, mask=None):
+        '''fill the whole history with one observation and action
+        :param mask: for a batch, only reset the envs where mask is True
+        '''
+        if mask is None:
+            self._obs[...] = np.asarray(observation)[..., None]
+            self._act[...] = np.asarray(action)[..., None]
+        else:
+            self._obs[mask] = np.asarray(observation)[..., None]
+            self._act[mask] = np.asarray(action)[..., None]
+
+    def push(self, observation, action):
+        '''add the newest observation and action, the oldest ones are dropped'''
+        pos = self._pos - 1 if self._pos > 0 else self.length - 1
+        self._obs[..., pos] = observation
+        self._obs[..., pos + self.length] = observation
+        self._act[..., pos] = action
+        self._act[..., pos + self.length] = action
+        self._pos = pos
+
+    @property
+    def observations(self):
+        '''view of the last length observations, newest first'''
+        return self._obs[..., self._pos:self._pos + self.length]
+
+    @property
+    def actions(self):
+        '''view of the last length actions, newest first'''
+        return self._act[..., self._pos:self._pos + self.length]
+
+    def fill(self, out=None):
+        '''write [observations, actions] into out (default: self.out) and return it'''
+        if out is None:
+            out = self.out
+        out[..., :self.length] = self.observations
+        out[..., self.length:] = self.actions
+        return out
@@ -0,0 +1,248 @@
+"""
+Opt-in timing of the env hot path: per-phase step latency, reset latency and episode statistics,
+exported as a dict / CSV, plus cProfile and pyinstrument sessions
+"""
+import contextlib
+import cProfile
+import csv
+import pstats
+from time import perf_counter_ns
+
+import numpy as np
+
+from gridworld2 import GridWorldEnv
+
+# the phases of GridWorldEnv.step, in order. The wall check has no phase of its own:
+# walls and boundaries are part of transition_table, so it is a single lookup inside "movement"
+PHASES = ("tables", "movement", "observation", "reward", "info", "time_limit")
+N_BUCKETS = 64  # log2 histogram of nanoseconds, bucket b holds latencies in [2^(b-1), 2^b)
+
+
+class _Timer(object):
+    '''count, total, max and log2 histogram of latencies in ns'''
+    __slots__ = ("count", "total", "max", "hist")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.hist = [0] * N_BUCKETS
+
+    def add(self, ns):
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        self.hist[ns.bit_length()] += 1
+
+    def quantile(self, q):
+        '''upper edge of the histogram bucket holding quantile q (within a factor 2)'''
+        if not self.count:
+            return 0
+        cum = np.cumsum(self.hist)
+        return int(min(2 ** int(np.searchsorted(cum, q * self.count)), self.max))
+
+    def to_dict(self):
+        return {"count": self.count, "total_ms": self.total / 1e6,
+                "mean_us": self.total / self.count / 1e3 if self.count else 0.0,
+                "p50_us": self.quantile(0.5) / 1e3, "p99_us": self.quantile(0.99) / 1e3,
+                "max_us": self.max / 1e3, "hist": list(self.hist)}
+
+
+class StepProfiler(object):
+    '''Counters and histograms of the step/reset latency of one env.
+
+    The profiler attaches to an env instance by shadowing its step and reset
+    with timed versions, detach() removes them again: an env without profiler
+    runs the plain methods, there is no cost when it is off. The step of the
+    env class always runs unchanged; for the gridworld envs (GridWorldEnv and
+    subclasses) GridWorldEnv.step marks the end of each of PHASES, other envs
+    (e.g. BatchedGridWorldEnv, BatchedVecEnv) get the whole step timed.
+    Returns and lengths of the finished episodes are kept too; for batched
+    envs per sub-env.
+
+    usage:
+        with StepProfiler(env) as profiler:
+            model.learn(10000)
+        print(profiler.summary())
+        profiler.to_csv("step_times.csv")
+    '''
+
+    def __init__(self, env=None):
+        self.env = None
+        self.reset_stats()
+        if env is not None:
+            self.attach(env)
+
+    def reset_stats(self):
+        self.step_timer = _Timer()
+        self.reset_timer = _Timer()
+        self.phase_timers = {name: _Timer() for name in PHASES}
+        self.episode_returns = []
+        self.episode_lengths = []
+        self.episode_truncated = []
+        self._return = 0.0
+        self._length = 0
+
+    def attach(self, env):
+        assert self.env is None, "the profiler is already attached, detach() first"
+        self.env = env
+        self._phased = isinstance(env, GridWorldEnv)
+        # instance attributes shadow the methods of the class; the real step of the class runs,
+        # GridWorldEnv.step reports the end of every phase to _phase_clock
+        env.step = self._timed_step
+        env.reset = self._timed_reset
+        if self._phased:
+            self._marks = []
+            env._phase_clock = self._mark
+        return self
+
+    def detach(self):
+        if self.env is not None:
+            del self.env.step
+            del self.env.reset
+            if self._phased:
+                del self.env._phase_clock
+            self.env = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.detach()
+
+    def _mark(self):
+        self._marks.append(perf_counter_ns())
+
+    def _timed_step(self, action):
+        step = type(self.env).step
+        if self._phased:
+            del self._marks[:]
+        t0 = perf_counter_ns()
+        result = step(self.env, action)
+        t1 = perf_counter_ns()
+        self.step_timer.add(t1 - t0)
+        # a subclass step that does not call GridWorldEnv.step leaves no marks, only the whole step is timed
+        if self._phased and len(self._marks) == len(PHASES):
+            last = t0
+            for name, mark in zip(PHASES, self._marks):
+                self.phase_timers[name].add(mark - last)
+                last = mark
+        self._count_episode(result[1], result[2], result[3])
+        return result
+
+    def _timed_reset(self, *args, **kwargs):
+        reset = type(self.env).reset
+        t0 = perf_counter_ns()
+        result = reset(self.env, *args, **kwargs)
+        self.reset_timer.add(perf_counter_ns() - t0)
+        mask = args[0] if args else kwargs.get("mask")
+        if np.ndim(self._return) == 0 or mask is None:
+            self._return, self._length = 0.0, 0
+        else:
+            self._return[mask] = 0.0
+            self._length[mask] = 0
+        return result
+
+    def _count_episode(self, reward, done, info):
+        if np.ndim(done) == 0:
+            self._return += reward
+            self._length += 1
+            if done:
+                self.episode_returns.append(self._return)
+                self.episode_lengths.append(self._length)
+                self.episode_truncated.append(bool(info.get("TimeLimit.truncated", False)))
+                self._return, self._length = 0.0, 0
+            return
+        # batched: arrays over the sub-envs; info is the truncated array or a list of info dicts
+        dones = np.asarray(done, bool)
+        if np.ndim(self._return) == 0:
+            self._return = np.zeros(len(dones))
+            self._length = np.zeros(len(dones), np.int64)
+        self._return += reward
+        self._length += 1
+        if dones.any():
+            if isinstance(info, np.ndarray):
+                truncated = info[dones]
+            else:
+                truncated = [bool(i.get("TimeLimit.truncated", False)) for i, d in zip(info, dones) if d]
+            self.episode_returns.extend(self._return[dones].tolist())
+            self.episode_lengths.extend(self._length[dones].tolist())
+            self.episode_truncated.extend(bool(t) for t in truncated)
+            self._return[dones] = 0.0
+            self._length[dones] = 0
+
+    @property
+    def env_seconds(self):
+        '''time spent in step and reset, compare with the wall time of a training run'''
+        return (self.step_timer.total + self.reset_timer.total) / 1e9
+
+    def episode_stats(self):
+        n = len(self.episode_returns)
+        if not n:
+            return {"episodes": 0}
+        return {"episodes": n, "mean_return": float(np.mean(self.episode_returns)),
+                "mean_length": float(np.mean(self.episode_lengths)),
+                "truncation_rate": float(np.mean(self.episode_truncated))}
+
+    def to_dict(self):
+        timers = {"step": self.step_timer.to_dict(), "reset": self.reset_timer.to_dict()}
+        if self.phase_timers["movement"].count:
+            timers.update((name, t.to_dict()) for name, t in self.phase_timers.items())
+        return {"timers": timers, "episodes": self.episode_stats(), "env_seconds": self.env_seconds}
+
+    def to_csv(self, path):
+        '''one row per timer: name, count, total_ms, mean_us, p50_us, p99_us, max_us'''
+        fields = ["count", "total_ms", "mean_us", "p50_us", "p99_us", "max_us"]
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["timer"] + fields)
+            for name, t in self.to_dict()["timers"].items():
+                writer.writerow([name] + [t[k] for k in fields])
+
+    def summary(self):
+        d = self.to_dict()
+        step_total = d["timers"]["step"]["total_ms"] or 1.0
+        lines = ["%-12s %10s %10s %9s %9s %9s %7s" % ("timer", "count", "total_ms", "mean_us", "p50_us",
+                                                     "p99_us", "share")]
+        for name, t in d["timers"].items():
+            share = "" if name == "reset" else "%6.1f%%" % (100 * t["total_ms"] / step_total)
+            lines.append("%-12s %10d %10.2f %9.3f %9.3f %9.3f %7s" % (name, t["count"], t["total_ms"], t["mean_us"],
+                                                                    t["p50_us"], t["p99_us"], share))
+        lines.append("episodes: %s" % d["episodes"])
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def cprofile_session(path=None, sort: str = "cumulative", limit: int = 30):
+    '''profile the body with cProfile; the stats are dumped to path (for snakeviz / pstats) or printed'''
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        else:
+            pstats.Stats(profiler).sort_stats(sort).print_stats(limit)
+
+
+@contextlib.contextmanager
+def pyinstrument_session(path=None):
+    '''profile the body with pyinstrument (pip install pyinstrument); HTML report to path or text printed'''
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        raise ImportError("pyinstrument_session needs pyinstrument, pip install pyinstrument")
+    profiler = Profiler()
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        if path:
+            with open(path, "w") as f:
+                f.write(profiler.output_html())
+        else:
+            print(profiler.output_text())
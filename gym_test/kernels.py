@@ -0,0 +1,301 @@
+"""
+Whole episodes or K steps of one gridworld env in one call, for bulk data generation and Monte-Carlo
+evaluation: the loop runs over the env tables in compiled code (Numba, optional) or a NumPy/list loop,
+with a random policy or a policy table, and returns the trajectory as arrays
+
+    trajectory = rollout(env, episodes=1000, policy=table)
+    result = evaluate_table_policy(env, table, num_episodes=100000)
+
+The action noise is drawn from the counter-based streams of seeding.py, the same numbers env.step uses:
+rollout(env, seed=s, index=i, episode=e) follows env.seed(s, index=i) from its episode e on, step by step.
+"""
+import importlib.util
+from bisect import bisect_right
+
+import numpy as np
+
+from gridworld2 import GridWorldEnv, GridWorldEnvNew
+from seeding import BLOCK, EPISODE_GAMMA, GAMMA, counter_draws, episode_bases, noise_actions, seed_sequence, stream_keys
+
+BACKENDS = ("numba", "numpy")
+POLICY_KEY = 0x706F6C69  # spawn_key tag of the policy streams
+CHUNK = 1 << 18  # steps per piece of trajectory memory when only the number of episodes is given
+_NUMBA_KERNEL = None
+
+
+def have_numba():
+    return importlib.util.find_spec("numba") is not None
+
+
+def _rollout_kernel(transitions, rewards, ends, observations, start, max_steps, n_steps, n_episodes,
+                    noise_key, noise_threshold, noise_all, policy_key, table, cumulative, n_actions,
+                    episode, t, state,
+                    out_obs, out_action, out_taken, out_state, out_reward, out_done, out_truncated, out_episode):
+    # compiled by _numba_kernel; the same loop as _rollout_numpy, all arithmetic on uint64 wraps.
+    # goes on from step t of episode in state, returns (steps written, episodes finished, episode, t, state)
+    gamma = np.uint64(GAMMA)
+    episode_gamma = np.uint64(EPISODE_GAMMA)
+    n = np.uint64(n_actions)
+
+    def mix(z):
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+    t_total = 0
+    finished = 0
+    while t_total < n_steps and finished < n_episodes:
+        noise_base = mix(noise_key + np.uint64(episode + 1) * episode_gamma)
+        policy_base = mix(policy_key + np.uint64(episode + 1) * episode_gamma)
+        ended = False
+        while t_total < n_steps:
+            counter = np.uint64(t + 1) * gamma
+            obs = observations[state]
+            if table.shape[0] > 0:
+                action = table[obs]
+            else:
+                z = mix(policy_base + counter)
+                if cumulative.shape[0] > 0:
+                    u = np.float64(z >> np.uint64(11)) * 1.1102230246251565e-16  # 2^-53
+                    action = 0
+                    while action < n_actions - 1 and cumulative[obs, action] <= u:
+                        action += 1
+                else:
+                    action = np.int64(z % n)
+            taken = action
+            if noise_all or noise_threshold > np.uint64(0):
+                z = mix(noise_base + counter)
+                if noise_all or z < noise_threshold:
+                    taken = np.int64(z % n)
+            state = transitions[state, taken]
+            done = ends[state]
+            truncated = t + 1 >= max_steps and not done
+            out_obs[t_total] = obs
+            out_action[t_total] = action
+            out_taken[t_total] = taken
+            out_state[t_total] = state
+            out_reward[t_total] = rewards[state]
+            out_done[t_total] = done
+            out_truncated[t_total] = truncated
+            out_episode[t_total] = episode
+            t_total += 1
+            t += 1
+            if done or truncated:
+                ended = True
+                break
+        if ended:
+            finished += 1
+            episode += 1
+            t = 0
+            state = start
+    return t_total, finished, episode, t, state
+
+
+def _numba_kernel():
+    global _NUMBA_KERNEL
+    if _NUMBA_KERNEL is None:
+        try:
+            import numba
+        except ImportError:
+            raise ImportError("the numba backend needs numba, pip install numba, or use backend='numpy'")
+        _NUMBA_KERNEL = numba.njit(cache=True, nogil=True)(_rollout_kernel)
+    return _NUMBA_KERNEL
+
+
+def _rollout_numpy(transitions, rewards, ends, observations, start, max_steps, n_steps, n_episodes,
+                   noise_key, noise_p, policy_key, table, cumulative, n_actions, episode, t, state, out):
+    # the draws are computed BLOCK steps at a time, the steps run over Python lists; the same position
+    # arguments and result as _rollout_kernel
+    transitions, rewards, ends = transitions.tolist(), rewards.tolist(), ends.tolist()
+    observations = observations.tolist()
+    table = table.tolist() if len(table) else None
+    cumulative = cumulative.tolist() if len(cumulative) else None
+    columns = [[] for _ in range(8)]
+    out_obs, out_action, out_taken, out_state, out_reward, out_done, out_truncated, out_episode = columns
+    t_total = 0
+    finished = 0
+    while t_total < n_steps and finished < n_episodes:
+        noise_base = episode_bases(noise_key, [episode])
+        policy_base = episode_bases(policy_key, [episode])
+        first, filled = t, 0  # the drawn block holds the steps first, ..., first + filled - 1
+        ended = False
+        while t_total < n_steps:
+            if t == first + filled:
+                first, filled = t, BLOCK
+                steps = np.arange(t, t + BLOCK)
+                if noise_p > 0:
+                    noise = noise_actions(counter_draws(noise_base, steps), -1, noise_p, n_actions).tolist()
+                if table is None:
+                    draws = counter_draws(policy_base, steps)
+                    if cumulative is None:
+                        draws = (draws % np.uint64(n_actions)).astype(np.int64).tolist()
+                    else:
+                        draws = ((draws >> np.uint64(11)).astype(np.float64) * 2.0 ** -53).tolist()
+            k = t - first
+            obs = observations[state]
+            if table is not None:
+                action = table[obs]
+            elif cumulative is None:
+                action = draws[k]
+            else:
+                action = min(bisect_right(cumulative[obs], draws[k]), n_actions - 1)
+            taken = noise[k] if noise_p > 0 and noise[k] >= 0 else action
+            state = transitions[state][taken]
+            done = ends[state]
+            truncated = t + 1 >= max_steps and not done
+            out_obs.append(obs)
+            out_action.append(action)
+            out_taken.append(taken)
+            out_state.append(state)
+            out_reward.append(rewards[state])
+            out_done.append(done)
+            out_truncated.append(truncated)
+            out_episode.append(episode)
+            t_total += 1
+            t += 1
+            if done or truncated:
+                ended = True
+                break
+        if ended:
+            finished += 1
+            episode += 1
+            t = 0
+            state = start
+    for name, column in zip(out, columns):
+        out[name][:t_total] = column
+    return t_total, finished, episode, t, state
+
+
+def _policy_arrays(policy, n_keys: int, n_actions: int):
+    # (table, cumulative): a deterministic table, the cumulative probabilities, or two empty arrays for random
+    empty_table, empty_cumulative = np.zeros(0, np.int64), np.zeros((0, n_actions))
+    if policy is None:
+        return empty_table, empty_cumulative
+    policy = np.asarray(policy)
+    assert len(policy) >= n_keys, "the policy table has %d rows, the env has %d observations" % (len(policy), n_keys)
+    if policy.ndim == 1:
+        assert ((policy >= 0) & (policy < n_actions)).all(), "invalid actions in the policy table"
+        return np.ascontiguousarray(policy, np.int64), empty_cumulative
+    assert policy.shape[1] == n_actions, "the policy table needs one column per action"
+    probs = np.asarray(policy, np.float64)
+    cumulative = np.cumsum(probs / probs.sum(axis=1, keepdims=True), axis=1)
+    return empty_table, np.ascontiguousarray(cumulative)
+
+
+def rollout(env: GridWorldEnv, steps=None, episodes=None, policy=None, seed=None, index=None, episode: int = 0,
+            backend=None):
+    """
+    run env from its start without the gym step loop
+    :param steps: run this many steps, starting a new episode whenever one ends
+    :param episodes: run this many complete episodes; by default one episode
+    :param policy: None for uniform random actions, a table of actions (n_obs,) or of action probabilities
+                   (n_obs, n_actions), indexed by the observation code of the env (obs_table), the state for
+                   GridWorldEnv. For GridWorldEnvRnnNew only the newest observation is used
+    :param seed, index: the noise (and random policy) streams of env.seed(seed, index=index);
+                        default the current seed and index of env
+    :param episode: the number of the first episode in the streams
+    :param backend: "numba" or "numpy", default numba when it is installed
+    :return: dict of arrays over the steps: obs (before the step), action (of the policy), taken (after the
+             action noise), state, reward, done, truncated (after the step) and episode (its number)
+    """
+    # steps given: one buffer of that size; episodes only: pieces of CHUNK steps, as long as the episodes run
+    pieces = list(_rollout_chunks(env, steps, episodes, policy, seed, index, episode, backend, chunk=steps))
+    if len(pieces) == 1:
+        return pieces[0]
+    return {name: np.concatenate([piece[name] for piece in pieces]) for name in pieces[0]}
+
+
+def _rollout_chunks(env: GridWorldEnv, steps=None, episodes=None, policy=None, seed=None, index=None,
+                    episode: int = 0, backend=None, chunk=None):
+    # the trajectory of rollout in pieces of at most chunk steps: the memory follows the steps actually run,
+    # not the time limit, the kernel goes on from where the last piece stopped
+    backend = backend or ("numba" if have_numba() else "numpy")
+    assert backend in BACKENDS, "backend must be one of %s" % (BACKENDS,)
+    env._check_tables()
+    n_actions = env._action_space.n
+    if isinstance(env, GridWorldEnvNew):
+        observations = env.obs_table
+        n_keys = env.n_obs
+    else:
+        observations = np.arange(len(env.transition_table))
+        n_keys = len(env.transition_table)
+    table, cumulative = _policy_arrays(policy, n_keys, n_actions)
+
+    if seed is None:
+        entropy = env.noise.entropy
+        index = env.env_index if index is None else index
+    else:
+        entropy = seed_sequence(seed).entropy
+        index = 0 if index is None else index
+    noise_key = stream_keys(entropy, [index])
+    policy_key = stream_keys(entropy, [index], tag=POLICY_KEY)
+
+    max_steps = env._max_episode_steps
+    if steps is None:
+        episodes = 1 if episodes is None else episodes
+        steps = episodes * max_steps  # a bound, nothing is allocated for it
+    elif episodes is None:
+        episodes = steps
+    tables = (np.ascontiguousarray(env.transition_table, np.int64), np.ascontiguousarray(env.reward_table, np.float64),
+              np.ascontiguousarray(env.end_table, bool), np.ascontiguousarray(observations, np.int64),
+              env._xy_to_state(env.start), max_steps)
+    p = env.action_noise
+    if backend == "numba":
+        threshold = np.uint64(0) if p <= 0 or p >= 1 else np.uint64(int(np.ceil(p * 2.0 ** 64)))
+        kernel = _numba_kernel()
+    position = (episode, 0, tables[4])  # (episode, step in the episode, state)
+    chunk = chunk or CHUNK
+    total, finished = 0, 0
+    while total < steps and finished < episodes:
+        size = min(chunk, steps - total)
+        out = {"obs": np.empty(size, np.int64), "action": np.empty(size, np.int64),
+               "taken": np.empty(size, np.int64), "state": np.empty(size, np.int64),
+               "reward": np.empty(size, np.float64), "done": np.empty(size, bool),
+               "truncated": np.empty(size, bool), "episode": np.empty(size, np.int64)}
+        if backend == "numba":
+            n, k, *position = kernel(*tables, size, episodes - finished, noise_key[0], threshold, p >= 1,
+                                     policy_key[0], table, cumulative, n_actions, *position, *out.values())
+        else:
+            n, k, *position = _rollout_numpy(*tables, size, episodes - finished, noise_key, p, policy_key, table,
+                                             cumulative, n_actions, *position, out)
+        total += n
+        finished += k
+        yield {name: values[:n] for name, values in out.items()}
+
+
+def _episode_sums(trajectory, gamma: float = 1.0, carry=(0.0, 0)):
+    # (returns, lengths, truncated) of the episodes ending in the trajectory and the (return, length) of the
+    # unfinished last one; carry is that of the piece before, its episode goes on at the first step
+    ends_mask = trajectory["done"] | trajectory["truncated"]
+    ends = np.flatnonzero(ends_mask)
+    segment = np.cumsum(ends_mask) - ends_mask  # the episode of every step, 0 goes on from carry
+    starts = np.concatenate([[0], ends + 1])
+    rewards = trajectory["reward"]
+    if gamma != 1.0:
+        t = np.arange(len(rewards)) - starts[segment] + np.where(segment == 0, carry[1], 0)
+        rewards = rewards * gamma ** t
+    returns = np.bincount(segment, rewards, minlength=len(starts))
+    lengths = np.bincount(segment, minlength=len(starts))
+    returns[0] += carry[0]
+    lengths[0] += carry[1]
+    n = len(ends)
+    return returns[:n], lengths[:n], trajectory["truncated"][ends], (returns[n], lengths[n])
+
+
+def episode_returns(trajectory, gamma: float = 1.0):
+    '''(returns, lengths, truncated) of the complete episodes of a rollout trajectory'''
+    return _episode_sums(trajectory, gamma)[:3]
+
+
+def evaluate_table_policy(env: GridWorldEnv, policy=None, num_episodes: int = 10000, seed=None, gamma: float = 1.0,
+                          confidence: float = 0.95, backend=None):
+    '''Monte-Carlo evaluation of a policy table (see rollout) over num_episodes episodes, an EvaluationResult;
+    the episodes run in pieces of CHUNK steps, only their returns are kept'''
+    from evaluation import EvaluationResult
+    results = []
+    carry = (0.0, 0)
+    for piece in _rollout_chunks(env, episodes=num_episodes, policy=policy, seed=seed, backend=backend):
+        *result, carry = _episode_sums(piece, gamma, carry)
+        results.append(result)
+    returns, lengths, truncated = (np.concatenate(columns) for columns in zip(*results))
+    return EvaluationResult(returns, lengths, truncated, confidence=confidence)
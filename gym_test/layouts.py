@@ -0,0 +1,346 @@
+"""
+Grid layouts: procedural generators (random obstacles, mazes, rooms, ambiguous corridors) and a cache of
+the compiled env tables keyed by the layout hash, in memory and on disk
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+WALL = 1
+FREE = 0
+# bump when the compiled tables change, the cached tables of older versions are then ignored
+CACHE_VERSION = 1
+
+# 4-neighbourhood in (dy, dx), same order as the actions left, right, up, down
+_NEIGHBOURS = ((0, -1), (0, 1), (1, 0), (-1, 0))
+
+
+def border_walls(n_width: int, n_height: int):
+    '''the types list [(x, y, 1), ...] of the outer wall of a n_width x n_height grid'''
+    walls = []
+    for x in range(1, n_width + 1):
+        walls.append((x, 1, WALL))
+        walls.append((x, n_height, WALL))
+    for y in range(2, n_height):
+        walls.append((1, y, WALL))
+        walls.append((n_width, y, WALL))
+    return walls
+
+
+class Layout(object):
+    '''A rectangular grid layout.
+
+    types is a (n_height, n_width) int8 array, types[y-1, x-1] is the type of
+    the grid (x, y) (1: wall), like GridMatrix.types. start and end are (x, y),
+    rewards an optional list of special rewards [(x, y, r), ...]. Layouts are
+    applied to an env with env.set_layout(layout, cache).
+    '''
+
+    def __init__(self, types, start, end, rewards=(), meta=None):
+        self.types = np.array(types, np.int8)
+        assert self.types.ndim == 2, "types should be (n_height, n_width)"
+        self.start = tuple(int(v) for v in start)
+        self.end = tuple(int(v) for v in end)
+        self.rewards = [tuple(r) for r in rewards]
+        self.meta = dict(meta or {})
+        for x, y in (self.start, self.end):
+            assert 1 <= x <= self.n_width and 1 <= y <= self.n_height, "(%d, %d) is outside the grid" % (x, y)
+            assert self.types[y - 1, x - 1] != WALL, "(%d, %d) is a wall" % (x, y)
+        self._key = None
+
+    @property
+    def n_width(self):
+        return self.types.shape[1]
+
+    @property
+    def n_height(self):
+        return self.types.shape[0]
+
+    @property
+    def key(self):
+        '''sha1 hex digest of the content (size, types, start, end, rewards), not of meta'''
+        if self._key is None:
+            h = hashlib.sha1()
+            h.update(np.array([self.n_width, self.n_height], np.int64).tobytes())
+            h.update(np.ascontiguousarray(self.types).tobytes())
+            h.update(json.dumps([self.start, self.end, self.rewards]).encode())
+            self._key = h.hexdigest()
+        return self._key
+
+    def distances(self, source=None):
+        '''(n_height, n_width) BFS distances (steps) from source (default start) over the free grids, -1 if unreachable'''
+        return bfs_distances(self.types, source or self.start)
+
+    def is_connected(self):
+        return self.distances()[self.end[1] - 1, self.end[0] - 1] >= 0
+
+    def to_text(self):
+        '''rows from the top: # wall, . free, S start, G end'''
+        rows = np.where(self.types == WALL, "#", ".")
+        rows[self.start[1] - 1, self.start[0] - 1] = "S"
+        rows[self.end[1] - 1, self.end[0] - 1] = "G"
+        return "\n".join("".join(r) for r in rows[::-1])
+
+    @classmethod
+    def from_text(cls, text, **kwargs):
+        '''the inverse of to_text'''
+        rows = [r.strip() for r in text.strip().splitlines()][::-1]
+        chars = np.array([list(r) for r in rows])
+        start = np.argwhere(chars == "S")[0]
+        end = np.argwhere(chars == "G")[0]
+        return cls(np.where(chars == "#", WALL, FREE), (start[1] + 1, start[0] + 1), (end[1] + 1, end[0] + 1),
+                   **kwargs)
+
+    def __repr__(self):
+        return "Layout(%dx%d, start=%s, end=%s, %s)" % (self.n_width, self.n_height, self.start, self.end,
+                                                         self.meta.get("generator", "custom"))
+
+
+def bfs_distances(types, source):
+    '''(n_height, n_width) steps from the grid source = (x, y) to every grid, -1 for walls and unreachable grids'''
+    free = np.asarray(types) != WALL
+    dist = np.full(free.shape, -1, np.int64)
+    frontier = np.zeros(free.shape, bool)
+    frontier[source[1] - 1, source[0] - 1] = True
+    d = 0
+    while frontier.any():
+        dist[frontier] = d
+        grow = np.zeros_like(frontier)
+        grow[1:] |= frontier[:-1]
+        grow[:-1] |= frontier[1:]
+        grow[:, 1:] |= frontier[:, :-1]
+        grow[:, :-1] |= frontier[:, 1:]
+        frontier = grow & free & (dist < 0)
+        d += 1
+    return dist
+
+
+def _farthest(dist):
+    # the (x, y) grid with the largest distance, the first one in grid order on ties
+    iy, ix = np.unravel_index(np.argmax(dist), dist.shape)
+    return int(ix) + 1, int(iy) + 1
+
+
+def _box(n_width, n_height):
+    assert n_width >= 3 and n_height >= 3, "a layout needs at least 3x3 grids"
+    types = np.zeros((n_height, n_width), np.int8)
+    types[[0, -1], :] = WALL
+    types[:, [0, -1]] = WALL
+    return types
+
+
+def _seed_meta(seed):
+    return int(seed) if isinstance(seed, (int, np.integer)) else None
+
+
+def box(n_width: int, n_height: int, seed=None, start=(2, 2), end=None):
+    '''the empty room of the envs: an outer wall only, end default the corner opposite to start
+    (seed is not used, all generators take one)'''
+    end = end or (n_width - 1, n_height - 1)
+    return Layout(_box(n_width, n_height), start, end, meta={"generator": "box"})
+
+
+def random_obstacles(n_width: int, n_height: int, density: float = 0.2, seed=None, start=(2, 2), end=None,
+                     max_tries: int = 100):
+    '''interior grids become walls with probability density; redrawn until end is reachable from start'''
+    rng = np.random.default_rng(seed)
+    end = end or (n_width - 1, n_height - 1)
+    for _ in range(max_tries):
+        types = _box(n_width, n_height)
+        inner = rng.random((n_height - 2, n_width - 2)) < density
+        types[1:-1, 1:-1][inner] = WALL
+        for x, y in (start, end):
+            types[y - 1, x - 1] = FREE
+        layout = Layout(types, start, end, meta={"generator": "random_obstacles", "density": density,
+                                                 "seed": _seed_meta(seed)})
+        if layout.is_connected():
+            return layout
+    raise ValueError("no connected layout in %d tries, lower the density" % max_tries)
+
+
+def maze(n_width: int, n_height: int, seed=None, start=(2, 2)):
+    '''a perfect maze (one path between any two grids) by a randomized depth-first search on the grids
+    with even x and y; end is the grid farthest from start. Odd sizes use the whole grid'''
+    rng = np.random.default_rng(seed)
+    types = np.ones((n_height, n_width), np.int8)
+    # cells at (x, y) = (2 + 2i, 2 + 2j), 1-based
+    nx, ny = (n_width - 1) // 2, (n_height - 1) // 2
+    assert nx >= 1 and ny >= 1, "a maze needs at least 3x3 grids"
+    visited = np.zeros((ny, nx), bool)
+    sx, sy = (start[0] - 2) // 2, (start[1] - 2) // 2
+    stack = [(sx, sy)]
+    visited[sy, sx] = True
+    types[2 * sy + 1, 2 * sx + 1] = FREE
+    while stack:
+        cx, cy = stack[-1]
+        options = [(cx + dx, cy + dy) for dy, dx in _NEIGHBOURS
+                   if 0 <= cx + dx < nx and 0 <= cy + dy < ny and not visited[cy + dy, cx + dx]]
+        if not options:
+            stack.pop()
+            continue
+        nx_, ny_ = options[rng.integers(len(options))]
+        visited[ny_, nx_] = True
+        # open the cell and the wall between
+        types[2 * ny_ + 1, 2 * nx_ + 1] = FREE
+        types[cy + ny_ + 1, cx + nx_ + 1] = FREE
+        stack.append((nx_, ny_))
+    start = (2 * sx + 2, 2 * sy + 2)
+    end = _farthest(bfs_distances(types, start))
+    return Layout(types, start, end, meta={"generator": "maze", "seed": _seed_meta(seed)})
+
+
+def rooms(n_width: int, n_height: int, room_size: int = 5, extra_doors: float = 0.2, seed=None, start=(2, 2)):
+    '''rooms of room_size x room_size grids separated by walls; the doors form a random spanning tree
+    of the rooms plus each other wall with probability extra_doors. end is the grid farthest from start'''
+    rng = np.random.default_rng(seed)
+    types = _box(n_width, n_height)
+    step = room_size + 1
+    # inner walls at x = 1 + k*step (1-based), the rooms between
+    wall_x = list(range(1 + step, n_width, step))
+    wall_y = list(range(1 + step, n_height, step))
+    wall_x = [x for x in wall_x if x < n_width - 1]
+    wall_y = [y for y in wall_y if y < n_height - 1]
+    for x in wall_x:
+        types[:, x - 1] = WALL
+    for y in wall_y:
+        types[y - 1, :] = WALL
+    # room (i, j) spans x in edges_x[i] + 1 .. edges_x[i + 1] - 1
+    edges_x = [1] + wall_x + [n_width]
+    edges_y = [1] + wall_y + [n_height]
+    nx, ny = len(edges_x) - 1, len(edges_y) - 1
+
+    def door(i, j, di, dj):
+        # open one grid of the wall between room (i, j) and room (i + di, j + dj)
+        if di:
+            x = edges_x[i + 1]
+            y = rng.integers(edges_y[j] + 1, edges_y[j + 1])
+        else:
+            y = edges_y[j + 1]
+            x = rng.integers(edges_x[i] + 1, edges_x[i + 1])
+        types[y - 1, x - 1] = FREE
+
+    # spanning tree by a randomized DFS over the rooms, then the extra doors
+    walls = [(i, j, 1, 0) for i in range(nx - 1) for j in range(ny)] + \
+            [(i, j, 0, 1) for i in range(nx) for j in range(ny - 1)]
+    parent = list(range(nx * ny))
+
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    for k in rng.permutation(len(walls)):
+        i, j, di, dj = walls[k]
+        a, b = find(j * nx + i), find((j + dj) * nx + i + di)
+        if a != b:
+            parent[a] = b
+            door(i, j, di, dj)
+        elif rng.random() < extra_doors:
+            door(i, j, di, dj)
+    types[start[1] - 1, start[0] - 1] = FREE
+    end = _farthest(bfs_distances(types, start))
+    return Layout(types, start, end, meta={"generator": "rooms", "room_size": room_size,
+                                           "extra_doors": extra_doors, "seed": _seed_meta(seed)})
+
+
+def t_maze(length: int = 10, goal_up=None, seed=None):
+    '''the ambiguous corridor: a corridor of length grids ending in a T junction, the goal is at the end of
+    the upper or the lower arm. Along the corridor every local view is the same, only a notch next to the
+    start (above it when the goal is up) tells the side, so the agent has to remember it.
+    The grid is (length + 2) x 7'''
+    if goal_up is None:
+        goal_up = bool(np.random.default_rng(seed).integers(2))
+    n_width, n_height = length + 2, 7
+    types = np.ones((n_height, n_width), np.int8)
+    types[3, 1:-1] = FREE  # the corridor, y = 4
+    types[1:-1, -2] = FREE  # the arms, x = length + 1
+    cue_y = 5 if goal_up else 3
+    types[cue_y - 1, 1] = FREE
+    end = (length + 1, 6 if goal_up else 2)
+    return Layout(types, (2, 4), end, meta={"generator": "t_maze", "goal_up": bool(goal_up),
+                                            "seed": _seed_meta(seed)})
+
+
+GENERATORS = {"box": box, "random_obstacles": random_obstacles, "maze": maze, "rooms": rooms, "t_maze": t_maze}
+
+
+def generate(kind: str, *args, **kwargs):
+    '''generate("maze", 21, 21, seed=0), see GENERATORS'''
+    assert kind in GENERATORS, "unknown layout generator %r, use one of %s" % (kind, list(GENERATORS))
+    return GENERATORS[kind](*args, **kwargs)
+
+
+def layout_stream(kind: str, n: int, *args, seed=None, **kwargs):
+    '''n layouts of one generator with independent seeds derived from seed (SeedSequence.spawn)'''
+    for child in np.random.SeedSequence(seed).spawn(n):
+        yield generate(kind, *args, seed=int(child.generate_state(1)[0]), **kwargs)
+
+
+class TableCache(object):
+    '''Compiled env tables (transition, reward, end, types, observation codes)
+    keyed by layout hash, env class and the settings the tables depend on.
+
+    The newest max_items entries are kept in memory; with a directory every
+    entry is also written as <key>.npz (atomically, so parallel workers can
+    share the directory) and read back in later runs.
+
+    usage:
+        cache = TableCache("layout_cache")
+        for layout in layout_stream("maze", 1000, 21, 21, seed=0):
+            env.set_layout(layout, cache)
+            env.reset()
+    '''
+
+    def __init__(self, directory=None, max_items: int = 1024):
+        self.directory = directory
+        self.max_items = max_items
+        self._memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(env, layout):
+        h = hashlib.sha1()
+        h.update(json.dumps([CACHE_VERSION, layout.key, type(env).__module__, type(env).__qualname__,
+                             env._table_signature()], default=str).encode())
+        return h.hexdigest()
+
+    def load(self, key):
+        '''dict name -> array, None on a miss'''
+        tables = self._memory.get(key)
+        if tables is None and self.directory:
+            path = os.path.join(self.directory, key + ".npz")
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    tables = {name: data[name] for name in data.files}
+                self._remember(key, tables)
+        if tables is None:
+            self.misses += 1
+            return None
+        self._memory.move_to_end(key)
+        self.hits += 1
+        return tables
+
+    def save(self, key, tables):
+        self._remember(key, tables)
+        if self.directory:
+            path = os.path.join(self.directory, key + ".npz")
+            tmp = "%s.%d.tmp" % (path, os.getpid())
+            with open(tmp, "wb") as f:
+                np.savez(f, **tables)
+            os.replace(tmp, path)
+
+    def _remember(self, key, tables):
+        self._memory[key] = tables
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def __len__(self):
+        return len(self._memory)
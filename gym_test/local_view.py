@@ -0,0 +1,121 @@
+"""
+Local view observations: the (2r+1)x(2r+1) window of grid types around the agent
+"""
+import numpy as np
+
+# the 9 observations of GridWorldEnvNew, each one a 3x3 window read row by row from the top
+OBS_TEMPLATES = np.array([[0, 0, 0, 0, 0, 0, 0, 0, 0],
+                          [0, 0, 1, 0, 0, 1, 0, 0, 1],
+                          [0, 0, 1, 0, 0, 1, 1, 1, 1],
+                          [0, 0, 0, 0, 0, 0, 1, 1, 1],
+                          [1, 0, 0, 1, 0, 0, 1, 1, 1],
+                          [1, 0, 0, 1, 0, 0, 1, 0, 0],
+                          [1, 1, 1, 1, 0, 0, 1, 0, 0],
+                          [1, 1, 1, 0, 0, 0, 0, 0, 0],
+                          [1, 1, 1, 0, 0, 1, 0, 0, 1]])
+
+# a window is packed into one uint64, so at most 7x7 cells
+MAX_RADIUS = 3
+
+
+class LocalViewEncoder(object):
+    '''把格子周围(2r+1)x(2r+1)窗口内的格子类型（1：障碍，其余：空）编码为观测编号。
+
+    每个窗口按位打包为一个整数（第一个格子为最高位），整数到编号的映射在
+    不同地图之间保持不变：radius=1时9种模板依次为0..8，其余模式按首次出现
+    （格子下标）的顺序追加。地图外的格子视为障碍。
+    '''
+
+    def __init__(self, radius: int = 1):
+        assert 1 <= radius <= MAX_RADIUS, "radius should be in [1, %d]" % MAX_RADIUS
+        self.radius = radius
+        self.size = 2 * radius + 1
+        n_bits = self.size * self.size
+        self._weights = np.left_shift(np.uint64(1), np.arange(n_bits - 1, -1, -1, dtype=np.uint64))
+        # packed window -> id, sorted by packed value for the batch lookups
+        self._codes = np.zeros(0, np.uint64)
+        self._code_ids = np.zeros(0, np.int64)
+        self.id_table = None  # id of every cell of the last fitted layout, -1 if unknown
+        self.window_table = None  # window of every cell of the last fitted layout
+        self.n_width = None
+        if radius == 1:
+            self._register(self.pack(OBS_TEMPLATES))
+
+    @property
+    def n_patterns(self):
+        return len(self._codes)
+
+    def windows(self, types):
+        '''the window of every cell
+        :param types: (n_height, n_width) grid types, [y-1, x-1] is the grid (x, y)
+        :return: (n_height*n_width, size*size) array in cell order, rows of a window from the top
+        '''
+        n_height, n_width = types.shape
+        r = self.radius
+        padded = np.ones((n_height + 2 * r, n_width + 2 * r), np.int8)
+        padded[r:-r, r:-r] = types == 1
+        # padded[r + y - 1 + dy, r + x - 1 + dx] is the grid (x + dx, y + dy)
+        shifted = [padded[r + dy:r + dy + n_height, r + dx:r + dx + n_width]
+                   for dy in range(r, -r - 1, -1) for dx in range(-r, r + 1)]
+        return np.stack(shifted, axis=-1).reshape(n_height * n_width, self.size * self.size)
+
+    def pack(self, windows):
+        '''pack (n, size*size) windows of 0/1 into (n,) uint64 codes'''
+        return (np.asarray(windows, np.uint64) * self._weights).sum(axis=1, dtype=np.uint64)
+
+    def unpack(self, codes):
+        '''the inverse of pack'''
+        return ((np.asarray(codes, np.uint64)[:, None] & self._weights) != 0).astype(np.int8)
+
+    def encode_windows(self, windows):
+        '''the ids of (n, size*size) windows, -1 for windows that were never registered'''
+        return self._lookup(self.pack(windows))
+
+    def fit(self, types, reachable=None):
+        '''compute the id of every cell of a layout, new patterns met on reachable
+        cells get new ids
+        :param types: (n_height, n_width) grid types
+        :param reachable: optional (n_height*n_width,) bool mask, default all cells
+        :return: (n_height*n_width,) ids
+        '''
+        windows = self.windows(types)
+        return self.fit_codes(self.pack(windows), types.shape[1], reachable, windows)
+
+    def fit_codes(self, codes, n_width: int, reachable=None, windows=None):
+        '''fit() from the packed windows of the cells of a layout (e.g. cached ones)
+        :param windows: the unpacked windows if at hand, default unpacked from codes
+        '''
+        self.n_width = n_width
+        self.window_table = self.unpack(codes) if windows is None else windows
+        self._register(codes if reachable is None else codes[reachable])
+        self.id_table = self._lookup(codes)
+        return self.id_table
+
+    def encode(self, x, y):
+        '''the id of the grid (x, y) in the last fitted layout'''
+        return int(self.id_table[(y - 1) * self.n_width + x - 1])
+
+    def encode_batch(self, x, y):
+        '''the ids of many grids in the last fitted layout'''
+        return self.id_table[(np.asarray(y) - 1) * self.n_width + np.asarray(x) - 1]
+
+    def _register(self, codes):
+        # the new codes in the order of their first appearance
+        codes, first = np.unique(codes, return_index=True)
+        new = codes[np.argsort(first)]
+        new = new[self._lookup(new) < 0]
+        if len(new) == 0:
+            return
+        # keep the order of first registration for the ids, then sort for searchsorted
+        order = np.argsort(np.concatenate([self._codes, new]), kind="stable")
+        ids = np.concatenate([self._code_ids, np.arange(len(self._codes), len(self._codes) + len(new))])
+        codes = np.concatenate([self._codes, new])
+        self._codes, self._code_ids = codes[order], ids[order]
+
+    def _lookup(self, codes):
+        if len(self._codes) == 0:
+            return np.full(len(codes), -1, np.int64)
+        pos = np.searchsorted(self._codes, codes)
+        pos = np.minimum(pos, len(self._codes) - 1)
+        found = self._codes[pos] == codes
+        return np.where(found, self._code_ids[pos], -1)
@@ -0,0 +1,164 @@
+"""
+NumPy inference for the state-estimator LSTM (Embedding -> LSTM -> Dense -> softmax)
+without loading TensorFlow
+"""
+import numpy as np
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+ACTIVATIONS = {"sigmoid": _sigmoid, "hard_sigmoid": _hard_sigmoid, "tanh": np.tanh}
+
+
+def export_weights(source, path, recurrent_activation=None):
+    """
+    write the weights of a trained state estimator into a compact .npz file
+    :param source: a keras model, or the path of a weights file saved by model.save_weights
+                   (e.g. lstm_weights.h5 with Embedding 35x60, LSTM 50 units, Dense 100)
+    :param path: the .npz file to write
+    :param recurrent_activation: the recurrent activation of the LSTM, read from the model
+                   when possible, otherwise 'sigmoid' (the keras >= 2.3 default)
+    """
+    if isinstance(source, str):
+        weights = _read_h5_weights(source)
+    else:
+        weights = _read_model_weights(source)
+        if recurrent_activation is None:
+            recurrent_activation = weights.pop("recurrent_activation")
+    weights.pop("recurrent_activation", None)
+    np.savez(path, recurrent_activation=recurrent_activation or "sigmoid", **weights)
+
+
+def _read_model_weights(model):
+    weights = {}
+    for layer in model.layers:
+        name = type(layer).__name__
+        if name == "TimeDistributed":
+            layer = layer.layer
+            name = type(layer).__name__
+        if name == "Embedding":
+            weights["embedding"], = layer.get_weights()
+        elif name == "LSTM":
+            weights["kernel"], weights["recurrent_kernel"], weights["bias"] = layer.get_weights()
+            weights["recurrent_activation"] = layer.get_config()["recurrent_activation"]
+        elif name == "Dense":
+            weights["dense_kernel"], weights["dense_bias"] = layer.get_weights()
+    return weights
+
+
+def _read_h5_weights(path):
+    import h5py
+    weights = {}
+    with h5py.File(path, "r") as f:
+        group = f["model_weights"] if "model_weights" in f else f
+        for layer_name in group.attrs["layer_names"]:
+            layer = group[layer_name]
+            names = [n.decode() if isinstance(n, bytes) else n for n in layer.attrs["weight_names"]]
+            values = {n.split("/")[-1].split(":")[0]: np.asarray(layer[n]) for n in names}
+            if "embeddings" in values:
+                weights["embedding"] = values["embeddings"]
+            elif "recurrent_kernel" in values:
+                weights["kernel"] = values["kernel"]
+                weights["recurrent_kernel"] = values["recurrent_kernel"]
+                weights["bias"] = values["bias"]
+            elif "kernel" in values:
+                weights["dense_kernel"] = values["kernel"]
+                weights["dense_bias"] = values["bias"]
+    return weights
+
+
+class NumpyLstmStatePredictor(object):
+    '''The state estimator evaluated with NumPy, with the same interface as
+    gridworldLSTM.LstmStatePredictor plus run() for whole sequences.
+
+    The embedding is folded into the LSTM input kernel: for input position k
+    and token v the contribution embedding[v] @ kernel[k] is precomputed, so
+    the input projection of a step is a gather and a sum.
+    '''
+
+    def __init__(self, embedding, kernel, recurrent_kernel, bias, dense_kernel, dense_bias,
+                 recurrent_activation="sigmoid", num_envs: int = 1):
+        n_tokens, dim = embedding.shape
+        self.units = recurrent_kernel.shape[0]
+        self.n_inputs = kernel.shape[0] // dim
+        self.n_states = dense_kernel.shape[1]
+        self.num_envs = num_envs
+
+        # (n_inputs, n_tokens, 4*units)
+        kernel = kernel.reshape(self.n_inputs, dim, 4 * self.units)
+        self.input_table = np.einsum("vd,kdg->kvg", embedding, kernel).astype(np.float32)
+        self.recurrent_kernel = recurrent_kernel.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.dense_kernel = dense_kernel.astype(np.float32)
+        self.dense_bias = dense_bias.astype(np.float32)
+        self.recurrent_activation = ACTIVATIONS[str(recurrent_activation)]
+        self._positions = np.arange(self.n_inputs)
+
+        self.h = np.zeros((num_envs, self.units), np.float32)
+        self.c = np.zeros((num_envs, self.units), np.float32)
+
+    @classmethod
+    def load(cls, path, num_envs: int = 1):
+        '''load the weights written by export_weights'''
+        with np.load(path) as f:
+            weights = {key: f[key] for key in f.files}
+        weights["recurrent_activation"] = str(weights["recurrent_activation"])
+        return cls(num_envs=num_envs, **weights)
+
+    def reset(self, mask=None):
+        '''start new sequences for all envs, or only those where mask is True'''
+        if mask is None:
+            self.h[...] = 0
+            self.c[...] = 0
+        else:
+            self.h[mask] = 0
+            self.c[mask] = 0
+
+    def cell(self, inputs, h, c):
+        """
+        one LSTM step
+        :param inputs: (batch, n_inputs) integer tokens [action, observation_matrix]
+        :return: state probabilities (batch, n_states), new h, new c
+        """
+        tokens = np.asarray(inputs).astype(np.int64)
+        z = self.input_table[self._positions, tokens].sum(axis=1) + h @ self.recurrent_kernel + self.bias
+        i, f, g, o = np.split(z, 4, axis=1)
+        c = self.recurrent_activation(f) * c + self.recurrent_activation(i) * np.tanh(g)
+        h = self.recurrent_activation(o) * np.tanh(c)
+        logits = h @ self.dense_kernel + self.dense_bias
+        logits -= logits.max(axis=1, keepdims=True)
+        y = np.exp(logits)
+        y /= y.sum(axis=1, keepdims=True)
+        return y, h, c
+
+    def predict(self, inputs):
+        """
+        :param inputs: (num_envs, n_inputs) array of [action, observation_matrix]
+        :return: (num_envs, n_states) probabilities of the states
+        """
+        y, self.h, self.c = self.cell(np.reshape(inputs, (self.num_envs, self.n_inputs)), self.h, self.c)
+        return y
+
+    def predict_state(self, inputs):
+        return np.argmax(self.predict(inputs), axis=-1)
+
+    def run(self, sequences):
+        """
+        run whole sequences from zero states, like model.predict on the trained model
+        :param sequences: (batch, T, n_inputs)
+        :return: (batch, T, n_states)
+        """
+        sequences = np.asarray(sequences)
+        batch, T = sequences.shape[:2]
+        h = np.zeros((batch, self.units), np.float32)
+        c = np.zeros((batch, self.units), np.float32)
+        out = np.empty((batch, T, self.n_states), np.float32)
+        for t in range(T):
+            out[:, t], h, c = self.cell(sequences[:, t], h, c)
+        return out
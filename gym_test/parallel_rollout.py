@@ -0,0 +1,400 @@
+"""
+Parallel rollouts: the envs are sharded across worker processes that write into shared memory
+"""
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from batched_gridworld import BatchedGridWorldEnv, vec_env_base, with_vec_env_base
+from gridworld2 import GridWorldEnv
+
+
+class SharedArrays(object):
+    '''named numpy arrays in multiprocessing.shared_memory, created in the
+    parent and attached by name in the workers'''
+
+    def __init__(self, specs=None, names=None):
+        """
+        :param specs: dict name -> (shape, dtype) to create the arrays
+        :param names: the description() of existing arrays to attach to
+        """
+        self.blocks, self.arrays = {}, {}
+        self.owner = names is None
+        if self.owner:
+            names = {}
+            for key, (shape, dtype) in specs.items():
+                size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                block = shared_memory.SharedMemory(create=True, size=size)
+                names[key] = (block.name, tuple(shape), np.dtype(dtype).str)
+                self.blocks[key] = block
+        for key, (name, shape, dtype) in names.items():
+            if not self.owner:
+                self.blocks[key] = shared_memory.SharedMemory(name=name)
+            self.arrays[key] = np.ndarray(shape, dtype, buffer=self.blocks[key].buf)
+        self.names = names
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+
+
+class _BatchedRunner(object):
+    # the envs of a worker as one BatchedGridWorldEnv
+    def __init__(self, env_fn, lo, n, seed):
+        self.env = env_fn()
+        self.engine = BatchedGridWorldEnv(self.env, n, seed=seed, first_index=lo)
+        self.action_space = self.engine.action_space
+        self.rng = self.engine.np_random
+
+    def seed(self, seed):
+        self.engine.seed(seed)
+        self.rng = self.engine.np_random
+
+    def reset(self, mask=None):
+        return self.engine.reset(mask)
+
+    def step(self, actions):
+        # a copy: reset(dones) changes the engine state in place before the states are stored
+        return self.engine.step(actions) + (self.engine.state.copy(),)
+
+    @property
+    def targets(self):
+        return [self.env]
+
+
+class _EnvListRunner(object):
+    # the envs of a worker as separate env instances, for env classes the batched engine can not run
+    def __init__(self, env_fn, lo, n, seed):
+        self.envs = [env_fn() for _ in range(n)]
+        self.action_space = self.envs[0].action_space
+        self.lo = lo
+        for env in self.envs:
+            if isinstance(env, GridWorldEnv):
+                # only TimeLimit.truncated is read from the info
+                env.set_info_mode("minimal")
+        self.seed(seed)
+        self.obs = None
+
+    def seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+        for i, env in enumerate(self.envs):
+            if isinstance(env, GridWorldEnv):
+                # the noise stream of env lo + i of the collector, as in the batched runner
+                env.seed(seed.entropy, index=self.lo + i)
+            else:
+                env.seed(int(self.rng.integers(2 ** 31)))
+
+    def reset(self, mask=None):
+        mask = np.ones(len(self.envs), bool) if mask is None else mask
+        obs = [_first(env.reset()) if m else None for env, m in zip(self.envs, mask)]
+        if self.obs is None:
+            self.obs = np.stack([np.asarray(o) for o in obs])
+        for i in np.flatnonzero(mask):
+            self.obs[i] = obs[i]
+        return self.obs.copy()
+
+    def step(self, actions):
+        rewards = np.zeros(len(self.envs))
+        dones = np.zeros(len(self.envs), bool)
+        truncated = np.zeros(len(self.envs), bool)
+        states = np.zeros(len(self.envs), np.int64)
+        for i, env in enumerate(self.envs):
+            obs, rewards[i], dones[i], info = env.step(int(actions[i]))
+            self.obs[i] = obs
+            truncated[i] = info.get("TimeLimit.truncated", False)
+            states[i] = env.state
+        return self.obs.copy(), rewards, dones, truncated, states
+
+    @property
+    def targets(self):
+        return self.envs
+
+
+def _first(reset_output):
+    # GridWorldEnvRnn.reset returns (input, state)
+    return reset_output[0] if isinstance(reset_output, tuple) else reset_output
+
+
+def _worker(conn, env_fn, lo, hi, seed, batched, names):
+    runner = (_BatchedRunner if batched else _EnvListRunner)(env_fn, lo, hi - lo, seed)
+    shared = SharedArrays(names=names)
+    rollout = None
+    policy = None
+    obs = runner.reset()
+    try:
+        while True:
+            cmd, arg = conn.recv()
+            if cmd == "reset":
+                obs = runner.reset()
+                shared["obs"][lo:hi] = obs
+                conn.send(None)
+            elif cmd == "step":
+                obs, rewards, dones, truncated, states = runner.step(shared["actions"][lo:hi])
+                shared["terminal_obs"][lo:hi] = obs
+                if dones.any():
+                    obs = runner.reset(dones)
+                shared["obs"][lo:hi] = obs
+                shared["rewards"][lo:hi] = rewards
+                shared["dones"][lo:hi] = dones
+                shared["truncated"][lo:hi] = truncated
+                shared["states"][lo:hi] = states
+                conn.send(None)
+            elif cmd == "collect":
+                for t in range(arg):
+                    rollout["obs"][t, lo:hi] = obs
+                    if policy is None:
+                        actions = runner.rng.integers(0, runner.action_space.n, hi - lo)
+                    else:
+                        actions = policy(obs)
+                    obs, rewards, dones, truncated, states = runner.step(actions)
+                    if dones.any():
+                        obs = runner.reset(dones)
+                    rollout["actions"][t, lo:hi] = actions
+                    rollout["rewards"][t, lo:hi] = rewards
+                    rollout["dones"][t, lo:hi] = dones
+                    rollout["truncated"][t, lo:hi] = truncated
+                    rollout["states"][t, lo:hi] = states
+                shared["obs"][lo:hi] = obs
+                conn.send(None)
+            elif cmd == "seed":
+                runner.seed(arg)
+                obs = runner.reset()
+                shared["obs"][lo:hi] = obs
+                conn.send(None)
+            elif cmd == "rollout_buffers":
+                if rollout is not None:
+                    rollout.close()
+                rollout = SharedArrays(names=arg)
+                conn.send(None)
+            elif cmd == "policy":
+                policy = arg
+                conn.send(None)
+            elif cmd == "get_attr":
+                conn.send([getattr(env, arg) for env in runner.targets])
+            elif cmd == "set_attr":
+                name, value = arg
+                for env in runner.targets:
+                    setattr(env, name, value)
+                if batched:
+                    runner.engine.refresh_setting()
+                conn.send(None)
+            elif cmd == "env_method":
+                name, args, kwargs = arg
+                result = [getattr(env, name)(*args, **kwargs) for env in runner.targets]
+                if batched:
+                    runner.engine.refresh_setting()
+                conn.send(result)
+            elif cmd == "close":
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if rollout is not None:
+            rollout.close()
+        shared.close()
+        conn.close()
+
+
+class _ParallelRolloutCollector(object):
+    '''num_envs gridworld envs sharded across num_workers processes.
+
+    Every worker steps its shard (as one BatchedGridWorldEnv, or as separate
+    env instances with batched=False) and writes the observations, rewards
+    and dones straight into shared memory; the pipes only carry short
+    commands, no observations and no info dicts.
+
+    Two interfaces:
+    - the VecEnv one (reset / step_async / step_wait), done envs are reset
+      automatically and the last observation is in info["terminal_observation"]
+    - collect(k): every worker runs k steps on its own with the policy given
+      to set_policy (default uniform random) and fills (k, num_envs) arrays
+    '''
+
+    def __init__(self, env_fn, num_envs: int, num_workers=None, seed=None, batched: bool = True,
+                 start_method=None):
+        """
+        :param env_fn: a picklable function that returns a new gridworld env (the layout of the shard)
+        :param num_envs: the total number of envs
+        :param num_workers: default the number of cpus
+        :param seed: seed of the worker seeds; the action noise of env i follows env.seed(seed, index=i),
+                     whatever the number of workers
+        :param batched: run each shard with BatchedGridWorldEnv (fast, for the four base env
+                        classes), otherwise as separate env instances (any env)
+        :param start_method: the multiprocessing start method, default the platform default
+        """
+        num_workers = min(num_workers or mp.cpu_count(), num_envs)
+        env = env_fn()
+        if batched:
+            probe = BatchedGridWorldEnv(env, 1).reset()[0]
+        else:
+            probe = np.asarray(_first(env.reset()))
+        base = vec_env_base()
+        if base is object:
+            self.num_envs = num_envs
+            self.observation_space = env.observation_space
+            self.action_space = env.action_space
+        else:
+            base.__init__(self, num_envs, env.observation_space, env.action_space)
+        self.num_workers = num_workers
+        self.obs_shape, self.obs_dtype = probe.shape, probe.dtype
+
+        self.shared = SharedArrays({
+            "obs": ((num_envs,) + self.obs_shape, self.obs_dtype),
+            "terminal_obs": ((num_envs,) + self.obs_shape, self.obs_dtype),
+            "actions": ((num_envs,), np.int64),
+            "rewards": ((num_envs,), np.float64),
+            "dones": ((num_envs,), np.bool_),
+            "truncated": ((num_envs,), np.bool_),
+            "states": ((num_envs,), np.int64),
+        })
+        self.rollout = None
+        self.bounds = [(int(s[0]), int(s[-1]) + 1) for s in np.array_split(np.arange(num_envs), num_workers)]
+        seeds = np.random.SeedSequence(seed).spawn(num_workers)
+
+        ctx = mp.get_context(start_method)
+        self.pipes, self.processes = [], []
+        for (lo, hi), s in zip(self.bounds, seeds):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=_worker, args=(child, env_fn, lo, hi, s, batched, self.shared.names),
+                                  daemon=True)
+            process.start()
+            child.close()
+            self.pipes.append(parent)
+            self.processes.append(process)
+        self.closed = False
+
+    def _call(self, cmd, arg=None, workers=None):
+        workers = range(self.num_workers) if workers is None else workers
+        for i in workers:
+            self.pipes[i].send((cmd, arg))
+        return [self.pipes[i].recv() for i in workers]
+
+    def reset(self):
+        self._call("reset")
+        return self.shared["obs"].copy()
+
+    def step_async(self, actions):
+        self.shared["actions"][:] = np.asarray(actions).reshape(self.num_envs)
+        for pipe in self.pipes:
+            pipe.send(("step", None))
+
+    def step_wait(self):
+        for pipe in self.pipes:
+            pipe.recv()
+        shared = self.shared
+        dones = shared["dones"].copy()
+        infos = [{"state": int(s), "TimeLimit.truncated": bool(t)}
+                 for s, t in zip(shared["states"], shared["truncated"])]
+        for i in np.flatnonzero(dones):
+            infos[i]["terminal_observation"] = shared["terminal_obs"][i].copy()
+        return shared["obs"].copy(), shared["rewards"].copy(), dones, infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def set_policy(self, policy):
+        '''the policy of collect, a picklable function observations (n, ...) -> actions (n,); None for random'''
+        self._call("policy", policy)
+
+    def collect(self, k: int):
+        """
+        run k steps in every env, continuing from the current observations
+        :return: dict of (k, num_envs, ...) arrays: obs (before the step), actions, rewards, dones,
+                 truncated and states (after the step); done envs are reset. The arrays live in
+                 shared memory and are overwritten by the next collect, copy them to keep them.
+        """
+        if self.rollout is None or len(self.rollout["rewards"]) < k:
+            if self.rollout is not None:
+                self._call("rollout_buffers", {})
+                self.rollout.close()
+            self.rollout = SharedArrays({
+                "obs": ((k, self.num_envs) + self.obs_shape, self.obs_dtype),
+                "actions": ((k, self.num_envs), np.int64),
+                "rewards": ((k, self.num_envs), np.float64),
+                "dones": ((k, self.num_envs), np.bool_),
+                "truncated": ((k, self.num_envs), np.bool_),
+                "states": ((k, self.num_envs), np.int64),
+            })
+            self._call("rollout_buffers", self.rollout.names)
+        self._call("collect", k)
+        return {key: array[:k] for key, array in self.rollout.arrays.items()}
+
+    def _workers_of(self, indices):
+        if indices is None:
+            return list(range(self.num_workers)), None
+        indices = [indices] if isinstance(indices, int) else list(indices)
+        workers = sorted({i for i, (lo, hi) in enumerate(self.bounds) for j in indices if lo <= j < hi})
+        return workers, indices
+
+    def get_attr(self, attr_name, indices=None):
+        # a batched worker shares one layout between its envs, so it answers once for all of them
+        workers, indices = self._workers_of(indices)
+        results = self._call("get_attr", attr_name, workers)
+        values = {}
+        for w, result in zip(workers, results):
+            lo, hi = self.bounds[w]
+            for j in range(lo, hi):
+                values[j] = result[j - lo] if len(result) == hi - lo else result[0]
+        return [values[j] for j in (indices if indices is not None else range(self.num_envs))]
+
+    def set_attr(self, attr_name, value, indices=None):
+        workers, _ = self._workers_of(indices)
+        self._call("set_attr", (attr_name, value), workers)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        workers, indices = self._workers_of(indices)
+        results = self._call("env_method", (method_name, method_args, method_kwargs), workers)
+        values = {}
+        for w, result in zip(workers, results):
+            lo, hi = self.bounds[w]
+            for j in range(lo, hi):
+                values[j] = result[j - lo] if len(result) == hi - lo else result[0]
+        return [values[j] for j in (indices if indices is not None else range(self.num_envs))]
+
+    def seed(self, seed=None):
+        '''reseed all workers as a new collector with this seed would be (the same worker split), the envs
+        are reset and play the streams from episode 0 on; returns the entropy of the seed'''
+        sequence = np.random.SeedSequence(seed)
+        for pipe, s in zip(self.pipes, sequence.spawn(self.num_workers)):
+            pipe.send(("seed", s))
+        for pipe in self.pipes:
+            pipe.recv()
+        return [sequence.entropy]
+
+    def close(self):
+        if self.closed:
+            return
+        for pipe in self.pipes:
+            try:
+                pipe.send(("close", None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join(5)
+        if self.rollout is not None:
+            self.rollout.close()
+        self.shared.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def __getattr__(name):
+    # the workers import this module too, they do not need stable_baselines: see batched_gridworld.__getattr__
+    if name == "ParallelRolloutCollector":
+        cls = globals()[name] = with_vec_env_base(_ParallelRolloutCollector, name)
+        return cls
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,258 @@
+"""
+Point-based POMDP value iteration (PBVI / Perseus) on the exact model of the POMDP gridworld envs
+"""
+import time
+
+import numpy as np
+
+from belief import BeliefTracker
+from planning import MdpModel, value_iteration
+
+
+class PointBasedSolver(object):
+    '''Point-based value iteration over the exact model of a GridWorldEnvNew
+    (or subclass) layout.
+
+    The model is the one of BeliefTracker (action noise, transition_table,
+    obs_table of the new state) with the rewards and end states of MdpModel.
+    The value function is a dense (K, S) matrix of alpha-vectors over the
+    reachable states, each with the action of its first step. Backups are
+    batched over belief points: because the observation is a function of the
+    new state, the belief after (a, o) is the predicted belief restricted to
+    the states showing o, so all the (belief, action, observation, alpha)
+    scores of a batch come from one predict and one matrix product per
+    observation.
+
+    The solver keeps its alpha-vectors between calls, so solve() can be
+    interrupted (time_limit, max_iterations or Ctrl-C) and resumed.
+    '''
+
+    def __init__(self, env, gamma: float = 0.95, n_beliefs: int = 1000, seed=None, batch_size: int = 256):
+        """
+        :param env: the env whose layout is solved (GridWorldEnvNew or subclass)
+        :param gamma: the discount factor
+        :param n_beliefs: number of belief points sampled by sample_beliefs
+        :param seed: seed of the belief sampling and of the Perseus order
+        :param batch_size: belief points backed up together (bounds the memory of a backup)
+        """
+        self.mdp = MdpModel(env, gamma)
+        self.tracker = BeliefTracker(env)
+        self.gamma = gamma
+        self.n_states = self.mdp.n_states
+        self.n_actions = self.mdp.n_actions
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        self.horizon = env._max_episode_steps
+
+        self.observations = self.tracker.observations
+        self.n_obs = int(self.observations.max()) + 1
+        self._obs_states = [np.flatnonzero(self.observations == o) for o in range(self.n_obs)]
+        # immediate reward of each intended action: R[a, s] = sum_b P(b|a) rewards[next(s, b)]
+        self.action_rewards = (self.mdp.rewards[self.mdp.next_index] @ self.mdp.action_probs.T).T
+
+        # the fully observable values bound the POMDP values from above, their policy guides the sampling
+        mdp_values, mdp_policy = value_iteration(env, gamma, write_values=False, model=self.mdp)
+        self.mdp_values = mdp_values[self.mdp.states]
+        self.mdp_policy = mdp_policy[self.mdp.states]
+
+        # start from one alpha-vector below the value of any policy: the worst reward forever
+        self.alphas = self.mdp.lower_bound()[None, :]
+        self.alpha_actions = np.zeros(1, np.int64)
+        self.beliefs = self.sample_beliefs(n_beliefs)
+        self.iterations = 0
+
+    def sample_beliefs(self, n_beliefs: int, num_envs: int = 64, n_steps=None, explore: float = 0.5):
+        """
+        collect reachable beliefs by simulating the model from env.start. The actions follow the
+        optimal policy of the underlying MDP in the simulated state, or are random with probability
+        explore, so that the beliefs on the way to far away end states are found too.
+        :param n_beliefs: number of distinct belief points to return (fewer if the layout has less)
+        :param num_envs: number of trajectories simulated together
+        :param n_steps: number of simulated steps, default the max_episode_steps of the env
+        :return: (n_beliefs, S) beliefs
+        """
+        tracker = self.tracker.spawn(num_envs)
+        states = np.full(num_envs, self.mdp.start_index)
+        elapsed = np.zeros(num_envs, np.int64)
+        beliefs = [tracker.belief.copy()]
+        for step in range(n_steps or self.horizon):
+            actions = np.where(self.rng.random(num_envs) < explore,
+                               self.rng.integers(self.n_actions, size=num_envs), self.mdp_policy[states])
+            effective = np.where(self.rng.random(num_envs) < self.mdp.action_noise,
+                                 self.rng.integers(self.n_actions, size=num_envs), actions)
+            states = self.mdp.next_index[states, effective]
+            tracker.update(actions, self.observations[states])
+            beliefs.append(tracker.belief.copy())
+            elapsed += 1
+            done = self.mdp.terminal[states] | (elapsed >= self.horizon)
+            if done.any():
+                states[done] = self.mdp.start_index
+                elapsed[done] = 0
+                tracker.reset(mask=done)
+            if step % 20 == 19:
+                beliefs = [self._distinct(np.concatenate(beliefs))]
+        beliefs = self._distinct(np.concatenate(beliefs))
+        # the beliefs in an end state are never acted on
+        beliefs = beliefs[beliefs[:, self.mdp.terminal].sum(axis=1) < 1 - 1e-9]
+        if len(beliefs) > n_beliefs:
+            beliefs = beliefs[self.rng.choice(len(beliefs), n_beliefs, replace=False)]
+        return beliefs
+
+    @staticmethod
+    def _distinct(beliefs):
+        _, index = np.unique(np.round(beliefs, 9), axis=0, return_index=True)
+        return beliefs[np.sort(index)]
+
+    def values(self, beliefs):
+        '''(N,) values of beliefs under the current alpha-vectors'''
+        return (beliefs @ self.alphas.T).max(axis=1)
+
+    def upper_bound(self, beliefs):
+        '''(N,) values of beliefs if the state were observed from the next step on (the MDP values)'''
+        return beliefs @ self.mdp_values
+
+    def greedy_actions(self, beliefs):
+        '''(N,) actions of the best alpha-vector of each belief'''
+        return self.alpha_actions[np.argmax(beliefs @ self.alphas.T, axis=1)]
+
+    def backup(self, beliefs):
+        """
+        point-based Bellman backup of a batch of beliefs against the current alpha-vectors
+        :param beliefs: (N, S) beliefs
+        :return: (N, S) new alpha-vectors and their (N,) actions
+        """
+        n = len(beliefs)
+        probs = self.mdp.action_probs
+        continuation = self.mdp.continuation
+        # prior[i, a, t]: probability of arriving in t after intending a from belief i
+        prior = np.empty((n, self.n_actions, self.n_states))
+        for a in range(self.n_actions):
+            weights = beliefs[:, :, None] * probs[a][None, None, :]
+            target = self.mdp.next_index[None, :, :] + (np.arange(n) * self.n_states)[:, None, None]
+            prior[:, a] = np.bincount(target.ravel(), weights.ravel(),
+                                      minlength=n * self.n_states).reshape(n, self.n_states)
+        prior *= continuation  # arriving in an end state has no future
+
+        # future[i, a, t]: discounted value of arriving in t, from the best alpha of (i, a, obs(t))
+        future = np.zeros_like(prior)
+        alphas = self.alphas
+        for states in self._obs_states:
+            if len(states) == 0:
+                continue
+            best = np.argmax(prior[:, :, states] @ alphas[:, states].T, axis=2)  # (N, A)
+            future[:, :, states] = alphas[:, states][best]
+        future *= continuation
+
+        # new[i, a, s] = R[a, s] + sum_b P(b|a) future[i, a, next(s, b)]
+        new = np.broadcast_to(self.action_rewards, (n,) + self.action_rewards.shape).copy()
+        for b in range(self.n_actions):
+            new += probs[:, b][None, :, None] * future[:, :, self.mdp.next_index[:, b]]
+        best_action = np.argmax(np.einsum("nas,ns->na", new, beliefs), axis=1)
+        return new[np.arange(n), best_action], best_action
+
+    def _backup_batches(self, beliefs):
+        alphas, actions = [], []
+        for i in range(0, len(beliefs), self.batch_size):
+            a, b = self.backup(beliefs[i:i + self.batch_size])
+            alphas.append(a)
+            actions.append(b)
+        return np.concatenate(alphas), np.concatenate(actions)
+
+    def pbvi_iteration(self):
+        '''one PBVI step: back up every belief point, keep the distinct new alpha-vectors'''
+        alphas, actions = self._backup_batches(self.beliefs)
+        # keep the old best alpha of the points the backup makes worse, so that the values only go up
+        scores = self.beliefs @ self.alphas.T
+        worse = np.einsum("ns,ns->n", alphas, self.beliefs) < scores.max(axis=1)
+        old_best = np.argmax(scores[worse], axis=1)
+        alphas[worse], actions[worse] = self.alphas[old_best], self.alpha_actions[old_best]
+        _, keep = np.unique(np.round(alphas, 9), axis=0, return_index=True)
+        self.alphas, self.alpha_actions = alphas[keep], actions[keep]
+        self.iterations += 1
+
+    def perseus_iteration(self):
+        '''one Perseus step: back up random batches of the belief points whose value has
+        not improved yet, until every point is at least as good as before
+        '''
+        old_values = self.values(self.beliefs)
+        new_alphas = np.zeros((0, self.n_states))
+        new_actions = np.zeros(0, np.int64)
+        todo = np.arange(len(self.beliefs))
+        while len(todo):
+            batch = self.rng.choice(todo, min(self.batch_size, len(todo)), replace=False)
+            alphas, actions = self.backup(self.beliefs[batch])
+            gained = np.einsum("ns,ns->n", alphas, self.beliefs[batch]) >= old_values[batch] - 1e-9
+            # a backup that does not improve its point is replaced by the old best alpha of the point
+            old_best = np.argmax(self.beliefs[batch[~gained]] @ self.alphas.T, axis=1)
+            new_alphas = np.concatenate((new_alphas, alphas[gained], self.alphas[old_best]))
+            new_actions = np.concatenate((new_actions, actions[gained], self.alpha_actions[old_best]))
+            values = (self.beliefs[todo] @ new_alphas.T).max(axis=1)
+            # with a margin for the rounding of the products, otherwise ties never leave todo
+            todo = todo[values < old_values[todo] - 1e-9]
+        _, keep = np.unique(np.round(new_alphas, 9), axis=0, return_index=True)
+        self.alphas, self.alpha_actions = new_alphas[keep], new_actions[keep]
+        self.iterations += 1
+
+    def solve(self, method: str = "perseus", max_iterations: int = 1000, tol: float = 1e-4,
+              time_limit=None, callback=None):
+        """
+        iterate until the value of the belief points changes by less than tol
+        :param method: "perseus" or "pbvi"
+        :param time_limit: stop after this many seconds (checked between iterations)
+        :param callback: called as callback(solver) after each iteration, return True to stop
+        :return: the policy of the current alpha-vectors; Ctrl-C also stops and returns it
+        """
+        iteration = {"perseus": self.perseus_iteration, "pbvi": self.pbvi_iteration}[method]
+        start = time.time()
+        values = self.values(self.beliefs)
+        try:
+            for _ in range(max_iterations):
+                iteration()
+                new_values = self.values(self.beliefs)
+                change = np.abs(new_values - values).max()
+                values = new_values
+                if callback is not None and callback(self):
+                    break
+                if change < tol:
+                    break
+                if time_limit is not None and time.time() - start > time_limit:
+                    break
+        except KeyboardInterrupt:
+            pass
+        return self.policy()
+
+    def policy(self, num_envs: int = 1):
+        '''a copy of the current alpha-vectors as an AlphaVectorPolicy'''
+        return AlphaVectorPolicy(self.alphas.copy(), self.alpha_actions.copy(), self.tracker, num_envs)
+
+
+class AlphaVectorPolicy(object):
+    '''acts greedily on the exact belief, which is tracked from the actions and observations
+
+    usage:
+        obs = env.reset(); policy.reset()
+        while not done:
+            action = policy.act()
+            obs, reward, done, info = env.step(action)
+            policy.observe(action, obs)
+    '''
+
+    def __init__(self, alphas, actions, tracker, num_envs: int = 1):
+        self.alphas = alphas
+        self.actions = actions
+        self.tracker = tracker.spawn(num_envs)
+
+    def reset(self, mask=None):
+        self.tracker.reset(mask=mask)
+
+    def act(self):
+        '''(num_envs,) actions, or one int for a single env'''
+        actions = self.actions[np.argmax(self.tracker.belief @ self.alphas.T, axis=1)]
+        return int(actions[0]) if self.tracker.num_envs == 1 else actions
+
+    def observe(self, actions, observations):
+        self.tracker.update(actions, observations)
+
+    def value(self):
+        '''(num_envs,) expected discounted returns from the current beliefs'''
+        return (self.tracker.belief @ self.alphas.T).max(axis=1)
@@ -0,0 +1,187 @@
+"""
+Exact planning on the underlying MDP of the gridworld envs: value iteration and policy iteration
+"""
+import numpy as np
+
+
+class MdpModel(object):
+    '''The MDP of a gridworld env, read from its tables, over the states reachable from env.start.
+
+    The intended action is replaced by a uniformly random one with probability
+    env.action_noise, the move follows transition_table, the reward is
+    reward_table of the new state (so the L1 reward of GridWorldEnvRnn is
+    included) and entering an end state finishes the episode.
+    '''
+
+    def __init__(self, env, gamma: float = 0.99, action_noise=None):
+        env._check_tables()
+        self.gamma = gamma
+        self.action_noise = env.action_noise if action_noise is None else action_noise
+        self.n_env_states = len(env.transition_table)
+        self.n_actions = env.action_space.n
+
+        self.states = np.flatnonzero(env._reachable_states())
+        self.n_states = len(self.states)
+        index = np.full(self.n_env_states, -1, np.int64)
+        index[self.states] = np.arange(self.n_states)
+        self.next_index = index[env.transition_table[self.states]]  # (S, A)
+        self.rewards = env.reward_table[self.states]  # reward for entering each state
+        self.terminal = env.end_table[self.states]
+        # discount of the future after arriving in each state, 0 for the end states
+        self.continuation = np.where(self.terminal, 0.0, gamma)
+        self.start_index = index[env._xy_to_state(env.start)]
+
+        # P(effective action | intended action)
+        self.action_probs = ((1 - self.action_noise) * np.eye(self.n_actions)
+                             + self.action_noise / self.n_actions)
+
+        # predecessors in CSR form: pred_states[pred_ptr[j]:pred_ptr[j+1]] can move into j
+        targets = self.next_index.ravel()
+        order = np.argsort(targets, kind="stable")
+        self.pred_states = order // self.n_actions
+        self.pred_ptr = np.zeros(self.n_states + 1, np.int64)
+        np.cumsum(np.bincount(targets, minlength=self.n_states), out=self.pred_ptr[1:])
+
+    def predecessors(self, states):
+        '''the states that can move into any of the given states (without duplicates)'''
+        starts, ends = self.pred_ptr[states], self.pred_ptr[states + 1]
+        counts = ends - starts
+        if counts.sum() == 0:
+            return np.zeros(0, np.int64)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        seen = np.zeros(self.n_states, bool)
+        seen[self.pred_states[np.repeat(starts, counts) + offsets]] = True
+        return np.flatnonzero(seen)
+
+    def distances(self):
+        '''the number of moves from each state to the nearest end state if the intended actions
+        are applied, -1 for the states that can not reach one
+        '''
+        distance = np.full(self.n_states, -1, np.int64)
+        frontier = np.flatnonzero(self.terminal)
+        distance[frontier] = 0
+        d = 0
+        while len(frontier):
+            d += 1
+            frontier = self.predecessors(frontier)
+            frontier = frontier[distance[frontier] < 0]
+            distance[frontier] = d
+        return distance
+
+    def proper_policy(self):
+        '''the actions that move one step closer to an end state: with action_noise < 1 every state
+        that can reach an end reaches it with probability 1, so the policy evaluation converges for gamma = 1
+        '''
+        distance = self.distances()
+        distance[distance < 0] = self.n_states
+        return distance[self.next_index].argmin(axis=1)
+
+    def backup(self, values, rows, policy=None):
+        """
+        Bellman backup of some states
+        :param values: (S,) current values
+        :param rows: the states to back up
+        :param policy: None for the optimal backup, otherwise (S,) actions
+        :return: the q values (len(rows), A) if policy is None, else the values (len(rows),)
+        """
+        # value of arriving in each next state: its reward plus the discounted future if not terminal
+        nxt = self.next_index[rows]
+        arrive = self.rewards[nxt] + self.continuation[nxt] * values[nxt]
+        q = arrive @ self.action_probs.T
+        if policy is None:
+            return q
+        return q[np.arange(len(rows)), policy[rows]]
+
+    def lower_bound(self):
+        '''a value lower than the value of any policy, the start of the monotone iterations'''
+        r_min = min(self.rewards.min(), 0.0)
+        if self.gamma < 1:
+            return np.full(self.n_states, r_min / (1 - self.gamma))
+        return np.full(self.n_states, r_min * self.n_states)
+
+    def to_env_states(self, array, fill=np.nan):
+        '''spread an array over the reachable states to all env states'''
+        out = np.full(self.n_env_states, fill, np.result_type(array, type(fill)))
+        out[self.states] = array
+        return out
+
+
+def _iterate(model, values, tol, max_iterations, policy=None):
+    '''asynchronous iterations: after a full sweep only the predecessors of the
+    states whose value changed by more than tol are backed up again
+    '''
+    non_terminal = np.flatnonzero(~model.terminal)
+    rows = non_terminal
+    for iteration in range(max_iterations):
+        new = model.backup(values, rows, policy)
+        if policy is None:
+            new = new.max(axis=1)
+        changed = rows[np.abs(new - values[rows]) > tol]
+        values[rows] = new
+        if len(changed) == 0:
+            if len(rows) == len(non_terminal):
+                return values, iteration + 1
+            # confirm with a full sweep
+            rows = non_terminal
+            continue
+        if 4 * len(changed) > len(non_terminal):
+            # most values still move, finding the predecessors costs more than the full sweep
+            rows = non_terminal
+            continue
+        rows = model.predecessors(changed)
+        rows = rows[~model.terminal[rows]]
+    return values, max_iterations
+
+
+def value_iteration(env, gamma: float = 0.99, tol: float = 1e-6, max_iterations: int = 100000,
+                    write_values: bool = True, model=None):
+    """
+    :param env: a gridworld env, its layout, noise and rewards define the MDP
+    :param gamma: the discount factor
+    :param tol: stop when no value changes by more than tol
+    :param write_values: write the values into env.grids (see GridMatrix.set_values)
+    :param model: an MdpModel of the env, built if not given
+    :return: values and greedy policy indexed by env state (nan / -1 for unreachable states)
+    """
+    model = model or MdpModel(env, gamma)
+    values = model.lower_bound()
+    values[model.terminal] = 0.0
+    values, model.iterations = _iterate(model, values, tol, max_iterations)
+    return _finish(env, model, values, write_values)
+
+
+def policy_iteration(env, gamma: float = 0.99, tol: float = 1e-6, max_iterations: int = 1000,
+                     write_values: bool = True, model=None, max_sweeps: int = 100000):
+    """
+    policy iteration with iterative policy evaluation, same arguments as value_iteration;
+    max_iterations bounds the number of policy improvements
+    :param max_sweeps: bounds the sweeps of each policy evaluation
+    """
+    model = model or MdpModel(env, gamma)
+    values = model.lower_bound()
+    values[model.terminal] = 0.0
+    # a proper first policy, the evaluation of one that never ends does not converge for gamma = 1
+    policy = model.proper_policy()
+    all_states = np.arange(model.n_states)
+    model.sweeps = 0
+    for iteration in range(max_iterations):
+        values, sweeps = _iterate(model, values, tol, max_sweeps, policy)
+        model.sweeps += sweeps
+        q = model.backup(values, all_states)
+        # keep the current action on ties so that the iteration stops
+        best = q.max(axis=1)
+        improve = q[all_states, policy] < best - tol
+        if not improve.any():
+            break
+        policy[improve] = q[improve].argmax(axis=1)
+    model.iterations = iteration + 1
+    return _finish(env, model, values, write_values)
+
+
+def _finish(env, model, values, write_values):
+    policy = model.backup(values, np.arange(model.n_states)).argmax(axis=1)
+    values = model.to_env_states(values)
+    if write_values:
+        reachable = ~np.isnan(values[1:]).reshape(env.n_height, env.n_width)
+        env.grids.set_values(values[1:], reachable)
+    return values, model.to_env_states(policy, fill=-1)
@@ -0,0 +1,270 @@
+"""
+Headless rendering: the grid, walls, start/end, the observation window and the agent drawn straight into
+NumPy RGB arrays (no display, no pyglet), one env or a batch of envs per call, and offline GIF/video export
+"""
+import numpy as np
+
+# the colors of GridWorldEnv.render, 0..255
+WHITE = (255, 255, 255)
+FREE_COLOR = (230, 230, 230)
+WALL_COLOR = (77, 77, 77)
+START_COLOR = (128, 128, 204)
+END_COLOR = (230, 230, 0)
+AGENT_COLOR = (255, 255, 0)
+WINDOW_COLOR = (255, 255, 204)
+WINDOW_ALPHA = 0.5
+
+
+def _cell_colors(types, rewards):
+    '''(n_height, n_width, 3) color of every grid: by reward like GridWorldEnv.render, walls dark grey'''
+    r = np.asarray(rewards, np.float64) / 10
+    colors = np.empty(r.shape + (3,))
+    colors[...] = np.array(FREE_COLOR) / 255
+    neg, pos = r < 0, r > 0
+    colors[neg] = np.stack([0.9 - r[neg], 0.9 + r[neg], 0.9 + r[neg]], axis=-1)
+    colors[pos] = np.stack([np.full(pos.sum(), 0.3), 0.5 + r[pos], np.full(pos.sum(), 0.3)], axis=-1)
+    colors[np.asarray(types) == 1] = np.array(WALL_COLOR) / 255
+    return (np.clip(colors, 0, 1) * 255).round().astype(np.uint8)
+
+
+class GridRasterizer(object):
+    '''Draws gridworld envs into (height, width, 3) uint8 RGB arrays.
+
+    The static part (grids, walls, start and end outlines) is drawn once per
+    layout and cached; a frame is a copy of it with the observation window
+    (blended) and the agent stamped on. render_states draws the frames of
+    many agent positions of one layout at once (e.g. all envs of a
+    BatchedGridWorldEnv). Row 0 of a frame is the top of the grid, as in the
+    pyglet viewer.
+
+    usage:
+        rasterizer = GridRasterizer(u_size=8)
+        frame = rasterizer.render(env)                        # (n_height*8, n_width*8, 3)
+        frames = rasterizer.render_states(env, engine.state)  # (num_envs, ...)
+    '''
+
+    def __init__(self, u_size=None, gap: int = 2, outline: int = 3, window=None, max_cached: int = 16):
+        """
+        :param u_size: pixels per grid, default the u_size of the env
+        :param gap: pixels between the grids
+        :param outline: line width of the start and end outlines
+        :param window: draw the observation window, default for envs with local view observations
+        :param max_cached: number of layouts whose background is kept
+        """
+        self.u_size = u_size
+        self.gap = gap
+        self.outline = outline
+        self.window = window
+        self.max_cached = max_cached
+        self._cache = {}
+
+    def _geometry(self, env):
+        u = self.u_size or env.u_size
+        encoder = getattr(env, "encoder", None)
+        show = self.window if self.window is not None else encoder is not None
+        radius = encoder.radius if (show and encoder is not None) else (1 if show else 0)
+        return u, radius
+
+    def background(self, env):
+        '''(pad + n_height*u + pad, pad + n_width*u + pad, 3) static canvas of the layout, pad = window radius * u'''
+        u, radius = self._geometry(env)
+        key = (id(env.grids), env.grids.version, env.n_width, env.n_height, tuple(env.start), tuple(np.ravel(env.end)), u, radius,
+               self.gap, self.outline)
+        canvas = self._cache.get(key)
+        if canvas is None:
+            if len(self._cache) >= self.max_cached:
+                self._cache.pop(next(iter(self._cache)))
+            canvas = self._cache[key] = self._draw_background(env, u, radius)
+        return canvas
+
+    def _draw_background(self, env, u, radius):
+        n_width, n_height = env.n_width, env.n_height
+        pad = radius * u
+        colors = _cell_colors(env.grids.types, env.grids.rewards)[::-1]  # row 0 is the top
+        image = np.repeat(np.repeat(colors, u, axis=0), u, axis=1)
+        offset = np.arange(u)
+        inner = (offset >= self.gap) & (offset < u - self.gap)
+        gaps = ~np.tile(inner, n_height)[:, None] | ~np.tile(inner, n_width)[None, :]
+        image[gaps] = WHITE
+
+        def outline(x, y, color):
+            top, left = (n_height - y) * u + self.gap, (x - 1) * u + self.gap
+            size, w = u - 2 * self.gap, min(self.outline, (u - 2 * self.gap) // 2)
+            cell = image[top:top + size, left:left + size]
+            cell[:w], cell[-w:], cell[:, :w], cell[:, -w:] = color, color, color, color
+
+        if u - 2 * self.gap >= 2:  # room for the outlines inside a grid
+            outline(env.start[0], env.start[1], START_COLOR)
+            end = np.asarray(env.end).reshape(-1, 2)
+            for x, y in end:
+                outline(int(x), int(y), END_COLOR)
+        canvas = np.empty((n_height * u + 2 * pad, n_width * u + 2 * pad, 3), np.uint8)
+        canvas[...] = WHITE
+        canvas[pad:pad + n_height * u, pad:pad + n_width * u] = image
+        return canvas
+
+    def _agent_mask(self, u):
+        c = (np.arange(u) + 0.5) - u / 2
+        return c[:, None] ** 2 + c[None, :] ** 2 <= (u / 4) ** 2
+
+    def render_states(self, env, states):
+        """
+        :param env: the env whose layout is drawn
+        :param states: (N,) agent states (state numbers 1..n_width*n_height)
+        :return: (N, n_height*u, n_width*u, 3) uint8 frames (a view into a padded buffer)
+        """
+        states = np.asarray(states, np.int64).reshape(-1)
+        u, radius = self._geometry(env)
+        canvas = self.background(env)
+        n = len(states)
+        frames = np.empty((n,) + canvas.shape, np.uint8)
+        frames[...] = canvas
+        pad = radius * u
+        x = (states - 1) % env.n_width + 1
+        y = (states - 1) // env.n_width + 1
+        top = pad + (env.n_height - y) * u
+        left = pad + (x - 1) * u
+        rows_n = np.arange(n)[:, None, None]
+
+        if radius:
+            size = (2 * radius + 1) * u
+            rr = (top - pad)[:, None] + np.arange(size)[None, :]
+            cc = (left - pad)[:, None] + np.arange(size)[None, :]
+            region = frames[rows_n, rr[:, :, None], cc[:, None, :]].astype(np.float32)
+            region += WINDOW_ALPHA * (np.array(WINDOW_COLOR, np.float32) - region)
+            frames[rows_n, rr[:, :, None], cc[:, None, :]] = region.round().astype(np.uint8)
+
+        rr = top[:, None] + np.arange(u)[None, :]
+        cc = left[:, None] + np.arange(u)[None, :]
+        region = frames[rows_n, rr[:, :, None], cc[:, None, :]]
+        region[:, self._agent_mask(u)] = AGENT_COLOR
+        frames[rows_n, rr[:, :, None], cc[:, None, :]] = region
+        return frames[:, pad:pad + env.n_height * u, pad:pad + env.n_width * u]
+
+    def render(self, env):
+        '''(n_height*u, n_width*u, 3) uint8 frame of the current state of env'''
+        return np.ascontiguousarray(self.render_states(env, [env.state])[0])
+
+    def render_batch(self, engine):
+        '''frames of all envs of a BatchedGridWorldEnv'''
+        return self.render_states(engine.env, engine.state)
+
+
+def tile(frames, n_cols=None, pad: int = 2):
+    '''(N, H, W, 3) frames -> one mosaic image of n_cols columns (default about square), pad white pixels apart'''
+    frames = np.asarray(frames)
+    n, h, w = frames.shape[:3]
+    n_cols = n_cols or int(np.ceil(np.sqrt(n)))
+    n_rows = -(-n // n_cols)
+    mosaic = np.empty((n_rows * (h + pad) - pad, n_cols * (w + pad) - pad, 3), np.uint8)
+    mosaic[...] = WHITE
+    for i in range(n):
+        r, c = divmod(i, n_cols)
+        mosaic[r * (h + pad):r * (h + pad) + h, c * (w + pad):c * (w + pad) + w] = frames[i]
+    return mosaic
+
+
+def record_episodes(env, policy=None, num_envs: int = 16, steps=None, seed=None, u_size: int = 8, n_cols=None):
+    """
+    run num_envs episodes together (BatchedGridWorldEnv) and draw every step
+    :param policy: called as policy(observations) -> actions, default uniform random
+    :param steps: number of steps, default max_episode_steps of env
+    :return: (steps + 1, num_envs, H, W, 3) frames, or the (steps + 1, mosaic H, mosaic W, 3) mosaics with
+             n_cols; an env that is done stays at its last position
+    """
+    from batched_gridworld import BatchedGridWorldEnv
+    engine = BatchedGridWorldEnv(env, num_envs, seed=seed)
+    rasterizer = GridRasterizer(u_size=u_size)
+    steps = steps or engine._max_episode_steps
+    observations = engine.reset()
+    states = engine.state.copy()
+    running = np.ones(num_envs, bool)
+    frames = []
+    for t in range(steps + 1):
+        batch = rasterizer.render_states(env, states)
+        frames.append(tile(batch, n_cols) if n_cols else np.ascontiguousarray(batch))
+        if t == steps or not running.any():
+            break
+        if policy is None:
+            actions = engine.np_random.integers(0, engine.action_space.n, num_envs)
+        else:
+            actions = policy(observations)
+        observations, _, dones, _ = engine.step(actions)
+        states = np.where(running, engine.state, states)
+        running &= ~dones
+    return np.stack(frames)
+
+
+def save_video(frames, path: str, fps: float = 10):
+    """
+    write (T, H, W, 3) uint8 frames to path by its extension:
+    .gif with the built-in encoder (NumPy only), .npz the raw frames (compressed),
+    any other (.mp4, .avi, ...) through imageio (pip install imageio imageio-ffmpeg)
+    """
+    frames = np.asarray(frames, np.uint8)
+    if path.endswith(".gif"):
+        write_gif(frames, path, fps)
+    elif path.endswith(".npz"):
+        np.savez_compressed(path, frames=frames, fps=fps)
+    else:
+        try:
+            import imageio
+        except ImportError:
+            raise ImportError("saving %s needs imageio, pip install imageio imageio-ffmpeg, "
+                              "or save as .gif / .npz" % path)
+        imageio.mimwrite(path, frames, fps=fps)
+
+
+def _palette(frames):
+    '''(T, H, W) palette indices and the (256, 3) palette; more than 256 colors are reduced to a 6x7x6 cube'''
+    packed = (frames[..., 0].astype(np.uint32) << 16) | (frames[..., 1].astype(np.uint32) << 8) | frames[..., 2]
+    colors, indices = np.unique(packed, return_inverse=True)
+    if len(colors) <= 256:
+        palette = np.zeros((256, 3), np.uint8)
+        palette[:len(colors)] = np.stack([colors >> 16, (colors >> 8) & 255, colors & 255], axis=1)
+        return indices.reshape(packed.shape).astype(np.uint8), palette
+    levels = np.array([6, 7, 6])
+    q = (frames.astype(np.uint16) * levels // 256).astype(np.uint8)
+    indices = (q[..., 0] * 7 + q[..., 1]) * 6 + q[..., 2]
+    grid = np.stack(np.meshgrid(np.arange(6), np.arange(7), np.arange(6), indexing="ij"), axis=-1).reshape(-1, 3)
+    palette = np.zeros((256, 3), np.uint8)
+    palette[:len(grid)] = ((grid + 0.5) * 256 / levels).astype(np.uint8)
+    return indices.astype(np.uint8), palette
+
+
+# every code is a 9-bit literal; a clear code before the table would need 10-bit codes keeps it that way
+_CLEAR, _END, _RUN = 256, 257, 250
+
+
+def _lzw_literal(indices):
+    '''GIF image data of 8-bit palette indices as uncompressed (literal) LZW codes'''
+    pixels = indices.ravel().astype(np.uint16)
+    n_runs = -(-len(pixels) // _RUN)
+    codes = np.full(n_runs * (_RUN + 1) + 1, _CLEAR, np.uint16)
+    slots = np.arange(len(pixels))
+    codes[slots // _RUN * (_RUN + 1) + 1 + slots % _RUN] = pixels
+    codes = codes[:len(pixels) + n_runs]
+    codes = np.append(codes, _END)
+    bits = ((codes[:, None] >> np.arange(9, dtype=np.uint16)) & 1).astype(np.uint8).ravel()
+    data = np.packbits(bits, bitorder="little").tobytes()
+    blocks = [bytes([len(data[i:i + 255])]) + data[i:i + 255] for i in range(0, len(data), 255)]
+    return bytes([8]) + b"".join(blocks) + b"\x00"
+
+
+def write_gif(frames, path: str, fps: float = 10, loop: int = 0):
+    '''animated GIF of (T, H, W, 3) uint8 frames without image libraries; the pixel data is not compressed
+    (about 9/8 byte per pixel), use a small u_size for long recordings'''
+    frames = np.asarray(frames, np.uint8)
+    if frames.ndim == 3:
+        frames = frames[None]
+    n, h, w = frames.shape[:3]
+    indices, palette = _palette(frames)
+    delay = max(1, int(round(100 / fps)))
+    with open(path, "wb") as f:
+        f.write(b"GIF89a" + np.array([w, h], "<u2").tobytes() + bytes([0xF7, 0, 0]) + palette.tobytes())
+        f.write(b"\x21\xFF\x0BNETSCAPE2.0\x03\x01" + np.array([loop], "<u2").tobytes() + b"\x00")
+        for i in range(n):
+            f.write(b"\x21\xF9\x04\x00" + np.array([delay], "<u2").tobytes() + b"\x00\x00")
+            f.write(b"\x2C" + np.array([0, 0, w, h], "<u2").tobytes() + b"\x00")
+            f.write(_lzw_literal(indices[i]))
+        f.write(b"\x3B")
@@ -0,0 +1,206 @@
+"""
+Trajectory recorder: runs a gridworld env in batches and streams typed columns to disk in chunks
+(replaces the DataFrame / pd.concat loop of lstm/record_data.ipynb)
+"""
+import numpy as np
+
+from batched_gridworld import BatchedGridWorldEnv, KIND_STATE
+from trajectory_dataset import DatasetWriter, TrajectoryDataset
+
+# column name -> dtype, one row per recorded time step
+COLUMNS = {
+    "trajectory": np.int64,  # trajectory id, counted from 0
+    "step": np.int32,  # time step in the trajectory, 0 is the state after reset
+    "action": np.int8,  # the action applied before this step (after the noise), 0 at step 0
+    "observation": np.int32,  # observation index (obs_table), only for GridWorldEnvNew and subclasses
+    "obs_matrix": np.uint8,  # the local view (obs_matrix_table), one row of size k*k per step
+    "state": np.int32,
+    "x": np.int16,
+    "y": np.int16,
+    "reward": np.float32,  # 0 at step 0
+    "done": np.bool_,
+    "inputs": np.int8,  # [action, obs_matrix], the input of the state-estimator LSTM
+}
+
+
+class TrajectoryRecorder(object):
+    '''Drives num_envs copies of a gridworld env (see BatchedGridWorldEnv) and
+    writes every step into preallocated column arrays.
+
+    The envs run in lockstep rounds of num_envs trajectories, so the rows of a
+    trajectory are contiguous. When chunk_size rows are filled, the chunk is
+    appended to the dataset at path (see trajectory_dataset.DatasetWriter) and
+    the arrays are reused.
+
+    usage:
+        with TrajectoryRecorder(env, "trajectories", num_envs=256) as recorder:
+            recorder.record(n_trajectories=100000, steps=249, stop_on_done=False)
+        x = TrajectoryDataset("trajectories").tensor("inputs")  # (100000, 250, 10), memory-mapped
+
+    steps counts the transitions, a trajectory has steps + 1 rows with the one of the reset: steps=249
+    gives the 250 rows per trajectory of record_data.ipynb (the reset and 249 steps).
+    '''
+
+    def __init__(self, env, path: str, num_envs: int = 256, chunk_size: int = 1 << 20, seed=None, policy=None,
+                 columns=None):
+        """
+        :param env: the prototype env (any of the gridworld envs), its layout is recorded
+        :param path: the directory the chunks are written to
+        :param num_envs: number of trajectories simulated together
+        :param chunk_size: rows per chunk file
+        :param policy: called as policy(observations) -> actions for the batch, default uniform random
+        :param columns: the columns to record (trajectory is always recorded), default all of COLUMNS
+                        the env provides; only these are computed per step
+        """
+        self.engine = BatchedGridWorldEnv(env, num_envs, seed=seed)
+        self.num_envs = num_envs
+        self.path = path
+        self.chunk_size = chunk_size
+        self.policy = policy
+
+        available = [c for c in COLUMNS
+                     if self.engine.kind != KIND_STATE or c not in ("observation", "obs_matrix", "inputs")]
+        if columns is not None:
+            unknown = set(columns) - set(available)
+            assert not unknown, "the env can not record the columns %s" % sorted(unknown)
+            available = [c for c in available if c in columns or c == "trajectory"]
+        self.columns = available
+        self._obs_matrix = None if self.engine.kind == KIND_STATE else env.obs_matrix_table.astype(np.uint8)
+        self.chunk = {c: self._allocate(c, chunk_size) for c in self.columns}
+        self.n_rows = 0  # rows in the current chunk
+        self.n_chunks = 0
+        self.n_trajectories = 0
+        self.total_rows = 0
+        meta = {"env": type(env).__name__, "n_width": env.n_width, "n_height": env.n_height,
+                "start": list(env.start), "end": np.asarray(env.end).tolist(), "action_noise": env.action_noise}
+        if self.engine.kind != KIND_STATE:
+            # the number of observation indices of the env, codes that never occur in the data included
+            meta["n_obs"] = int(env.n_obs)
+        self.writer = DatasetWriter(path, meta)
+
+    def _allocate(self, column, rows):
+        return np.zeros((rows,) + self._row_shape(column), COLUMNS[column])
+
+    def record(self, n_trajectories: int, steps=None, stop_on_done: bool = True):
+        """
+        record n_trajectories trajectories
+        :param steps: the maximum number of steps (transitions) of a trajectory, default the max_episode_steps
+                      of the env; a trajectory has up to steps + 1 rows, the one of the reset included
+        :param stop_on_done: end a trajectory when the env is done, otherwise keep stepping
+                             for exactly steps steps like record_data.ipynb did
+        :return: the number of rows written
+        """
+        steps = steps or self.engine._max_episode_steps
+        rows_before = self.total_rows + self.n_rows
+        block = {c: self._allocate(c, (steps + 1) * self.num_envs).reshape((steps + 1, self.num_envs) + self._row_shape(c))
+                 for c in self.columns}
+        alive = np.zeros((steps + 1, self.num_envs), bool)
+        engine = self.engine
+
+        remaining = n_trajectories
+        while remaining > 0:
+            n = min(self.num_envs, remaining)
+            observations = engine.reset()
+            running = np.arange(self.num_envs) < n
+            alive[...] = False
+            alive[0] = running
+            self._write_step(block, 0, np.zeros(self.num_envs), np.zeros(self.num_envs, bool))
+            length = 1
+            for t in range(1, steps + 1):
+                if not running.any():
+                    break
+                if self.policy is None:
+                    actions = engine.np_random.integers(0, engine.action_space.n, self.num_envs)
+                else:
+                    actions = self.policy(observations)
+                observations, rewards, dones, _ = engine.step(actions)
+                self._write_step(block, t, rewards, dones)
+                alive[t] = running
+                length = t + 1
+                if stop_on_done:
+                    # the step that reaches done is the last one of the trajectory
+                    running = running & ~dones
+            self._append(block, alive, length, self.n_trajectories)
+            self.n_trajectories += n
+            remaining -= n
+        return self.total_rows + self.n_rows - rows_before
+
+    def _row_shape(self, column):
+        if column == "obs_matrix":
+            return (self._obs_matrix.shape[1],)
+        if column == "inputs":
+            return (1 + self._obs_matrix.shape[1],)
+        return ()
+
+    def _write_step(self, block, t, rewards, dones):
+        engine = self.engine
+        action = engine.action if t > 0 else 0
+        if "step" in block:
+            block["step"][t] = t
+        if "action" in block:
+            block["action"][t] = action
+        if "state" in block:
+            block["state"][t] = engine.state
+        if "x" in block or "y" in block:
+            x, y = engine.get_xy()
+            if "x" in block:
+                block["x"][t] = x
+            if "y" in block:
+                block["y"][t] = y
+        if "reward" in block:
+            block["reward"][t] = rewards
+        if "done" in block:
+            block["done"][t] = dones
+        if "observation" in block:
+            block["observation"][t] = engine.observation
+        if "obs_matrix" in block or "inputs" in block:
+            obs_matrix = self._obs_matrix[engine.state]
+            if "obs_matrix" in block:
+                block["obs_matrix"][t] = obs_matrix
+            if "inputs" in block:
+                block["inputs"][t, :, 0] = action
+                block["inputs"][t, :, 1:] = obs_matrix
+
+    def _append(self, block, alive, length, first_id):
+        # (time, env) -> trajectory-major rows, keeping only the recorded steps
+        keep = alive[:length].T
+        block["trajectory"][:length] = first_id + np.arange(self.num_envs)
+        rows = {c: np.swapaxes(block[c][:length], 0, 1)[keep] for c in self.columns}
+        n, done = int(keep.sum()), 0
+        while done < n:
+            take = min(n - done, self.chunk_size - self.n_rows)
+            for c in self.columns:
+                self.chunk[c][self.n_rows:self.n_rows + take] = rows[c][done:done + take]
+            self.n_rows += take
+            done += take
+            if self.n_rows == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        '''append the rows of the current chunk to the dataset'''
+        if self.n_rows == 0:
+            return
+        self.writer.append({c: self.chunk[c][:self.n_rows] for c in self.columns})
+        self.n_chunks += 1
+        self.total_rows += self.n_rows
+        self.n_rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def load_trajectories(path, columns=None):
+    """
+    read a recording back
+    :param columns: the columns to read, default all
+    :return: dict column -> memory-mapped array over all rows
+    """
+    dataset = TrajectoryDataset(path)
+    return {c: dataset.column(c) for c in columns or dataset.columns}
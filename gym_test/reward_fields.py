@@ -0,0 +1,141 @@
+"""
+Reward / distance fields: the distance of every grid to one or many goals (L1, shortest path around the
+walls, or a registered potential) and the normalized reward maps built from them, computed once per
+(layout, goals, metric) and shared read-only by all envs of a process (and through a directory by processes)
+
+    fields = reward_fields(env.grids.types, [(5, 6), (8, 2)], "bfs")
+    fields["distance"][g, y-1, x-1], fields["reward"][g, y-1, x-1], fields["n_max"][g]
+"""
+import hashlib
+import json
+
+import numpy as np
+
+from layouts import CACHE_VERSION, WALL, TableCache
+
+# 4-neighbourhood in (dy, dx) like layouts._NEIGHBOURS
+_MOVES = ((0, -1), (0, 1), (1, 0), (-1, 0))
+
+
+def _goal_array(goals):
+    goals = np.asarray(goals, np.int64).reshape(-1, 2)
+    return goals[:, 0], goals[:, 1]
+
+
+def l1_fields(types, goals):
+    '''(G, n_height, n_width) L1 distances |x - goal_x| + |y - goal_y| of every grid to each goal (x, y)'''
+    n_height, n_width = np.shape(types)
+    gx, gy = _goal_array(goals)
+    x = np.arange(1, n_width + 1)
+    y = np.arange(1, n_height + 1)
+    return np.abs(x[None, None, :] - gx[:, None, None]) + np.abs(y[None, :, None] - gy[:, None, None])
+
+
+def bfs_fields(types, goals):
+    '''(G, n_height, n_width) steps from every grid to each goal (x, y) around the walls, -1 for walls and
+    grids that can not reach the goal; all goals are searched together, the frontier holds (goal, grid) pairs'''
+    types = np.asarray(types)
+    n_height, n_width = types.shape
+    n = n_height * n_width
+    free = (types != WALL).ravel()
+    # neighbour of every grid in every direction, the grid itself where the move hits a wall or the border
+    grids = np.arange(n)
+    rows, cols = np.divmod(grids, n_width)
+    neighbours = np.empty((n, len(_MOVES)), np.int64)
+    for k, (dy, dx) in enumerate(_MOVES):
+        r, c = rows + dy, cols + dx
+        inside = (r >= 0) & (r < n_height) & (c >= 0) & (c < n_width)
+        neighbours[:, k] = np.where(inside, r * n_width + c, grids)
+    neighbours = np.where(free[neighbours], neighbours, grids[:, None])
+
+    gx, gy = _goal_array(goals)
+    dist = np.full(len(gx) * n, -1, np.int64)
+    owner = np.zeros(len(gx) * n, np.int64)  # 用于去重，同_reachable_states
+    frontier = np.arange(len(gx)) * n + (gy - 1) * n_width + gx - 1
+    dist[frontier] = 0
+    d = 0
+    while len(frontier):
+        d += 1
+        goal, grid = np.divmod(frontier, n)
+        frontier = (goal[:, None] * n + neighbours[grid]).ravel()
+        frontier = frontier[dist[frontier] < 0]
+        owner[frontier] = np.arange(len(frontier))
+        frontier = frontier[owner[frontier] == np.arange(len(frontier))]
+        dist[frontier] = d
+    return dist.reshape(len(gx), n_height, n_width)
+
+
+# name -> fn(types, goals) -> (G, n_height, n_width) distances; register custom potentials here to cache them
+METRICS = {"l1": l1_fields, "bfs": bfs_fields}
+
+
+def distance_fields(types, goals, metric: str = "l1"):
+    '''distances of every grid to each goal under a metric of METRICS'''
+    assert metric in METRICS, "unknown metric %r, one of %s" % (metric, sorted(METRICS))
+    return METRICS[metric](types, goals)
+
+
+def _normalizers(types, goals, metric, dist):
+    # n_max per goal: the largest distance from the goal. For L1 the largest x and y offsets over the inner
+    # grids (inside the outer wall) as GridWorldEnvRnn always had, otherwise the largest reachable distance
+    if metric == "l1":
+        n_height, n_width = np.shape(types)
+        gx, gy = _goal_array(goals)
+        x = np.arange(2, n_width)
+        y = np.arange(2, n_height)
+        return (np.abs(x[None, :] - gx[:, None]).max(axis=1, initial=0)
+                + np.abs(y[None, :] - gy[:, None]).max(axis=1, initial=0))
+    return dist.reshape(len(dist), -1).max(axis=1)
+
+
+def compute_reward_fields(types, goals, metric: str = "l1"):
+    '''the fields without the cache: distance (G, H, W), n_max (G,) and reward = -distance / n_max,
+    -1 where the goal can not be reached'''
+    dist = distance_fields(types, goals, metric)
+    n_max = _normalizers(types, goals, metric, dist)
+    reward = -1 * dist / np.maximum(n_max, 1)[:, None, None]
+    reward[dist < 0] = -1.0
+    return {"distance": dist, "reward": reward, "n_max": n_max}
+
+
+def nearest_reward(fields):
+    '''(n_height, n_width) reward of the nearest goal of fields (argmin over the distances): -distance / n_max
+    with one n_max for all goals (their largest), -1 where no goal can be reached; for one goal the reward field'''
+    dist = fields["distance"]
+    unreachable = np.iinfo(dist.dtype).max
+    nearest = np.where(dist < 0, unreachable, dist).min(axis=0)
+    reward = -1 * nearest / max(int(fields["n_max"].max()), 1)
+    reward[nearest == unreachable] = -1.0
+    return reward
+
+
+_cache = TableCache(max_items=256)
+
+
+def set_cache(cache: TableCache):
+    '''share the fields through cache, e.g. a TableCache(directory) for worker processes'''
+    global _cache
+    _cache = cache
+
+
+def field_key(types, goals, metric: str):
+    types = np.ascontiguousarray(types, np.int8)
+    h = hashlib.sha1()
+    h.update(np.array(types.shape, np.int64).tobytes())
+    h.update(types.tobytes())
+    # tagged, the cache may share its directory with the env tables
+    h.update(json.dumps(["reward_fields", CACHE_VERSION, metric,
+                         np.asarray(goals, np.int64).reshape(-1, 2).tolist()]).encode())
+    return h.hexdigest()
+
+
+def reward_fields(types, goals, metric: str = "l1"):
+    '''the fields of compute_reward_fields from the shared cache (read-only arrays), computed on a miss'''
+    key = field_key(types, goals, metric)
+    fields = _cache.load(key)
+    if fields is None:
+        fields = compute_reward_fields(types, goals, metric)
+        _cache.save(key, fields)
+    for values in fields.values():
+        values.flags.writeable = False
+    return fields
@@ -0,0 +1,131 @@
+"""
+Counter-based random streams for the action noise: the noise of step t of episode e of env i is a pure
+function of (seed, i, e, t), so single envs, the slots of a batched env and the envs of worker processes
+draw the same numbers without sharing any generator state
+
+    z = mix(base + (t + 1) * GAMMA),  base = mix(key_i + (e + 1) * EPISODE_GAMMA)
+
+mix is the SplitMix64 output function, key_i comes from SeedSequence(seed, spawn_key=(NOISE_KEY, i)).
+The step is noisy if z < p * 2^64, the random action is then z mod n.
+"""
+import math
+
+import numpy as np
+
+GAMMA = 0x9E3779B97F4A7C15  # the SplitMix64 increment
+EPISODE_GAMMA = 0xD1B54A32D192ED03
+NOISE_KEY = 0x6E6F6973  # spawn_key tag, keeps the noise keys apart from SeedSequence(seed).spawn(n)
+BLOCK = 64  # draws per block of NoiseStream
+TWO_64 = 18446744073709551616.0
+
+
+def seed_sequence(seed=None):
+    '''np.random.SeedSequence of an int, None (fresh entropy) or a SeedSequence'''
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def _mix(z):
+    # SplitMix64 output function on a uint64 array (wraps around)
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB
+    return z ^ (z >> 31)
+
+
+def stream_keys(entropy, indices, tag: int = NOISE_KEY):
+    '''(n,) uint64 keys of the envs with the given indices; entropy is SeedSequence.entropy,
+    other tags give other independent streams of the same envs'''
+    keys = [np.random.SeedSequence(entropy, spawn_key=(tag, int(i))).generate_state(1, np.uint64)[0]
+            for i in np.ravel(indices)]
+    return np.array(keys, np.uint64)
+
+
+def episode_bases(keys, episodes):
+    '''stream base of episode e (0, 1, ...) of each key'''
+    return _mix(np.asarray(keys, np.uint64) + (np.asarray(episodes, np.uint64) + 1) * EPISODE_GAMMA)
+
+
+def counter_draws(bases, steps):
+    '''the uint64 draws of the given steps (0, 1, ...) of each stream, broadcast over bases and steps'''
+    return _mix(np.asarray(bases, np.uint64) + (np.asarray(steps, np.uint64) + 1) * GAMMA)
+
+
+def noise_actions(draws, actions, p: float, n: int):
+    '''actions with the random action z mod n where a draw z says the step is noisy (probability p)'''
+    noise = (draws % n).astype(np.int64)
+    if p >= 1:
+        return noise
+    # z < ceil(p * 2^64) <=> z < p * 2^64 as in NoiseStream.action
+    return np.where(draws < np.uint64(math.ceil(p * TWO_64)), noise, actions)
+
+
+class NoiseStream(object):
+    '''the noise of one env, pre-drawn in blocks of BLOCK steps.
+
+    The stream begins at episode 0; start() moves to the next episode once
+    the current one has drawn, so resets without steps in between do not count.
+    start(e) jumps to episode e: every episode can be replayed from (seed, index, e).
+    '''
+
+    def __init__(self, seed=None, index: int = 0, block: int = BLOCK):
+        self.entropy = seed_sequence(seed).entropy
+        self.index = index
+        self.block = block
+        self.key = stream_keys(self.entropy, [index])
+        self.episode = 0
+        self._base, self._draws, self._pos, self._step = None, [], 0, 0
+
+    def start(self, episode=None):
+        if episode is None:
+            if not self._step:
+                return
+            episode = self.episode + 1
+        self.episode = episode
+        self._base = None  # drawn with the first block
+        self._draws = []
+        self._pos = 0
+        self._step = 0
+
+    def _refill(self):
+        if self._base is None:
+            self._base = episode_bases(self.key, [self.episode])
+        self._draws = counter_draws(self._base, np.arange(self._step, self._step + self.block)).tolist()
+        self._pos = 0
+
+    def action(self, p: float, n: int):
+        '''the random action replacing the chosen one at the next step, or -1 to keep it'''
+        if self._pos == len(self._draws):
+            self._refill()
+        z = self._draws[self._pos]
+        self._pos += 1
+        self._step += 1
+        # int < float compares exactly
+        return z % n if z < p * TWO_64 else -1
+
+
+class BatchNoise(object):
+    '''the noise streams of the envs indices[0], indices[1], ... of a batch, one draw per env per call;
+    env indices[j] draws the same numbers as a NoiseStream(seed, indices[j])'''
+
+    def __init__(self, seed=None, indices=(0,)):
+        self.entropy = seed_sequence(seed).entropy
+        self.indices = np.asarray(indices, np.int64)
+        self.keys = stream_keys(self.entropy, self.indices)
+        self.episodes = np.zeros(len(self.indices), np.int64)
+        # base + (t + 1) * GAMMA of the next draw t of every env
+        self.counters = episode_bases(self.keys, self.episodes) + np.uint64(GAMMA)
+
+    def start(self, mask=None):
+        '''begin the next episode of the envs where mask is True (all by default); like NoiseStream.start
+        the caller leaves out the envs that have not stepped in their current episode'''
+        if mask is None:
+            mask = np.ones(len(self.indices), bool)
+        self.episodes[mask] += 1
+        self.counters[mask] = episode_bases(self.keys[mask], self.episodes[mask]) + np.uint64(GAMMA)
+
+    def apply(self, actions, p: float, n: int):
+        '''the actions of the next step with the noise of every env applied'''
+        draws = _mix(self.counters)
+        self.counters += np.uint64(GAMMA)
+        return noise_actions(draws, actions, p, n)
@@ -0,0 +1,174 @@
+"""
+Minibatches of truncated-BPTT windows over a recorded TrajectoryDataset, prefetched in a background thread
+"""
+import heapq
+import queue
+import threading
+
+import numpy as np
+
+N_ACTIONS = 4
+
+# the input encodings of a time step
+ENCODINGS = {
+    "index": "(B, U, 2) int64 [action, observation index], e.g. for two embeddings",
+    "onehot": "(B, U, 4 + n_obs) float32 one-hot action and one-hot observation index",
+    "inputs": "(B, U, 1 + k*k) int64 [action, obs_matrix], the input of embedding_lstm.ipynb",
+    "obs_matrix": "(B, U, 4 + k*k) float32 one-hot action and obs_matrix",
+}
+
+
+class TbpttBatchGenerator(object):
+    '''Shuffled (batch, unroll, features) windows for truncated BPTT.
+
+    Every epoch the trajectories are shuffled and dealt to batch_size lanes
+    (each to the lane with the least work so far). A lane walks through its
+    trajectories window by window, so the LSTM state of lane b can be carried
+    from one batch to the next: reset[b] is True when the window starts a new
+    trajectory (zero the state of lane b before it). The last window of a
+    trajectory is padded, mask is False on the padding and on empty lanes.
+
+    usage:
+        batches = TbpttBatchGenerator(TrajectoryDataset(path), batch_size=32, unroll=10)
+        for x, y, reset, mask in batches:
+            h[reset] = 0; c[reset] = 0
+            ...
+    '''
+
+    def __init__(self, dataset, batch_size: int = 32, unroll: int = 10, encoding: str = "index",
+                 labels: str = "state", label_classes=None, shuffle: bool = True, seed=None,
+                 prefetch: int = 4, n_observations=None):
+        """
+        :param dataset: a trajectory_dataset.TrajectoryDataset
+        :param encoding: the input encoding, one of ENCODINGS
+        :param labels: the column of the targets
+        :param label_classes: one-hot encode the targets with this many classes, default the indices
+        :param prefetch: number of batches prepared ahead by the background thread, 0 for none
+        :param n_observations: size of the one-hot observation, default the n_obs of the env in the dataset
+                               meta (the largest observation + 1 for datasets without it)
+        """
+        assert encoding in ENCODINGS, "unknown encoding %r, use one of %s" % (encoding, list(ENCODINGS))
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.unroll = unroll
+        self.encoding = encoding
+        self.labels = labels
+        self.label_classes = label_classes
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.prefetch = prefetch
+
+        self.n_windows = -(-dataset.lengths // unroll)  # windows per trajectory
+        if encoding == "onehot" and n_observations is None:
+            # the n_obs of the recording env; datasets without it (convert_csv) fall back to the data
+            n_observations = dataset.meta.get("n_obs")
+            if n_observations is None:
+                n_observations = int(np.max(dataset.column("observation"))) + 1
+        self.n_observations = n_observations
+        self._steps = np.arange(unroll)
+
+    def __len__(self):
+        '''an upper bound of the number of batches of an epoch (reached when the lanes are balanced)'''
+        return int(-(-self.n_windows.sum() // self.batch_size) + self.n_windows.max())
+
+    def schedule(self):
+        '''(n_batches, batch_size) trajectory and window index of every lane and batch, -1 for empty lanes'''
+        order = self.rng.permutation(len(self.dataset)) if self.shuffle else np.arange(len(self.dataset))
+        lanes = [[] for _ in range(self.batch_size)]
+        heap = [(0, lane) for lane in range(self.batch_size)]
+        for trajectory in order:
+            load, lane = heapq.heappop(heap)
+            lanes[lane].append(trajectory)
+            heapq.heappush(heap, (load + int(self.n_windows[trajectory]), lane))
+
+        n_batches = max(load for load, _ in heap)
+        trajectories = np.full((n_batches, self.batch_size), -1, np.int64)
+        windows = np.full((n_batches, self.batch_size), -1, np.int64)
+        for lane, assigned in enumerate(lanes):
+            if not assigned:
+                continue
+            assigned = np.asarray(assigned)
+            counts = self.n_windows[assigned]
+            n = counts.sum()
+            trajectories[:n, lane] = np.repeat(assigned, counts)
+            windows[:n, lane] = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+        return trajectories, windows
+
+    def make_batch(self, trajectories, windows):
+        """
+        :param trajectories: (batch_size,) trajectory of every lane, -1 for none
+        :param windows: (batch_size,) window index in the trajectory
+        :return: x, y, reset, mask
+        """
+        dataset = self.dataset
+        empty = trajectories < 0
+        trajectories = np.where(empty, 0, trajectories)
+        offset = windows[:, None] * self.unroll + self._steps[None, :]
+        mask = (offset < dataset.lengths[trajectories][:, None]) & ~empty[:, None]
+        rows = np.where(mask, dataset.offsets[trajectories][:, None] + offset, 0)
+        reset = (windows == 0) | empty
+
+        x = self._encode(rows)
+        y = np.asarray(dataset.column(self.labels)[rows.ravel()]).reshape(rows.shape)
+        if self.label_classes is not None:
+            y = np.eye(self.label_classes, dtype=np.float32)[y]
+        return x, y, reset, mask
+
+    def _encode(self, rows):
+        dataset, flat = self.dataset, rows.ravel()
+        if self.encoding == "inputs":
+            x = dataset.column("inputs")[flat].astype(np.int64)
+        elif self.encoding == "index":
+            x = np.stack((dataset.column("action")[flat], dataset.column("observation")[flat]), axis=1).astype(np.int64)
+        else:
+            action = np.eye(N_ACTIONS, dtype=np.float32)[dataset.column("action")[flat]]
+            if self.encoding == "onehot":
+                obs = np.eye(self.n_observations, dtype=np.float32)[dataset.column("observation")[flat]]
+            else:
+                obs = dataset.column("obs_matrix")[flat].astype(np.float32)
+            x = np.hstack((action, obs))
+        return x.reshape(rows.shape + (-1,))
+
+    def epoch(self):
+        '''the batches of one epoch, prepared in the calling thread'''
+        trajectories, windows = self.schedule()
+        for i in range(len(trajectories)):
+            yield self.make_batch(trajectories[i], windows[i])
+
+    def __iter__(self):
+        '''the batches of one epoch, prepared prefetch batches ahead in a background thread'''
+        if self.prefetch <= 0:
+            yield from self.epoch()
+            return
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        end = object()
+
+        def produce():
+            try:
+                for batch in self.epoch():
+                    if stop.is_set():
+                        return
+                    batches.put(batch)
+                batches.put(end)
+            except BaseException as e:  # raised again in the consumer
+                batches.put(e)
+
+        worker = threading.Thread(target=produce, daemon=True)
+        worker.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is end:
+                    return
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            # the consumer stopped early: let the worker finish
+            stop.set()
+            while worker.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    worker.join(0.01)
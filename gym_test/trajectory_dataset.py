@@ -0,0 +1,196 @@
+"""
+Columnar trajectory dataset: one raw fixed-width binary file per column, an index of trajectory
+offsets and meta.json; loaded with memory maps
+"""
+import csv
+import json
+import os
+
+import numpy as np
+
+META = "meta.json"
+OFFSETS = "offsets.bin"
+
+
+class DatasetWriter(object):
+    '''Appends rows to a dataset directory in chunks.
+
+    Every column is a raw C-order file <name>.bin of fixed-width rows, its
+    dtype and row shape are kept in meta.json. The rows of a trajectory must be
+    contiguous (a new trajectory starts where the trajectory column changes);
+    offsets.bin holds the first row of every trajectory plus the total.
+    '''
+
+    def __init__(self, path: str, meta=None):
+        """
+        :param path: the dataset directory, existing column files are overwritten
+        :param meta: extra entries for meta.json (e.g. the env layout)
+        """
+        self.path = path
+        self.meta = dict(meta or {})
+        self.schema = None
+        self.n_rows = 0
+        self._files = {}
+        self._offsets = []
+        self._last_id = None
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, columns):
+        '''append a chunk: dict column -> array with the same number of rows, including "trajectory"'''
+        if self.schema is None:
+            self.schema = {c: {"dtype": np.asarray(a).dtype.str, "shape": list(np.shape(a)[1:])}
+                           for c, a in columns.items()}
+            for c in self.schema:
+                self._files[c] = open(os.path.join(self.path, c + ".bin"), "wb")
+        assert set(columns) == set(self.schema), "the columns of a dataset can not change"
+        ids = np.asarray(columns["trajectory"])
+        if len(ids) == 0:
+            return
+        starts = np.flatnonzero(np.r_[ids[0] != self._last_id, ids[1:] != ids[:-1]])
+        self._offsets.append(starts + self.n_rows)
+        self._last_id = ids[-1]
+        for c, a in columns.items():
+            spec = self.schema[c]
+            np.ascontiguousarray(a, dtype=spec["dtype"]).tofile(self._files[c])
+        self.n_rows += len(ids)
+        self._write_meta()
+
+    def _write_meta(self):
+        offsets = np.concatenate(self._offsets + [[self.n_rows]]).astype(np.int64)
+        offsets.tofile(os.path.join(self.path, OFFSETS))
+        meta = dict(self.meta, n_rows=self.n_rows, n_trajectories=len(offsets) - 1, columns=self.schema)
+        with open(os.path.join(self.path, META), "w") as f:
+            json.dump(meta, f, indent=1)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TrajectoryDataset(object):
+    '''Memory-mapped view of a dataset written by DatasetWriter (or TrajectoryRecorder).
+
+    Nothing is read at construction: column(name) is a np.memmap over the
+    rows, dataset[i] gives views of trajectory i, and when all trajectories
+    have the same length tensor(name) reshapes a column to (num_traj, T, features)
+    without copying.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META)) as f:
+            self.meta = json.load(f)
+        self.n_rows = self.meta["n_rows"]
+        self.columns = list(self.meta["columns"])
+        self.offsets = np.fromfile(os.path.join(path, OFFSETS), np.int64)
+        self.lengths = np.diff(self.offsets)
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def column(self, name):
+        '''(n_rows,) + row shape memmap of a column'''
+        if name not in self._maps:
+            spec = self.meta["columns"][name]
+            shape = (self.n_rows,) + tuple(spec["shape"])
+            if self.n_rows == 0:
+                self._maps[name] = np.zeros(shape, spec["dtype"])
+            else:
+                self._maps[name] = np.memmap(os.path.join(self.path, name + ".bin"),
+                                             dtype=spec["dtype"], mode="r", shape=shape)
+        return self._maps[name]
+
+    def __getitem__(self, i):
+        '''dict column -> rows of trajectory i (views)'''
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return {c: self.column(c)[start:end] for c in self.columns}
+
+    @property
+    def uniform_length(self):
+        '''the common length of all trajectories, None if they differ'''
+        if len(self.lengths) and (self.lengths == self.lengths[0]).all():
+            return int(self.lengths[0])
+        return None
+
+    def tensor(self, name):
+        """
+        :return: (num_traj, T, features) view of a column; needs trajectories of equal length,
+                 otherwise see padded()
+        """
+        T = self.uniform_length
+        if T is None:
+            raise ValueError("the trajectories have different lengths, use padded()")
+        data = self.column(name)
+        return data.reshape((len(self), T, -1))
+
+    def padded(self, name, T=None, fill=0):
+        '''(num_traj, T, features) copy of a column, trajectories cut or padded with fill to length T'''
+        T = T or int(self.lengths.max())
+        data = self.column(name)
+        out = np.full((len(self), T) + data.shape[1:], fill, data.dtype)
+        steps = np.arange(T)
+        valid = steps[None, :] < self.lengths[:, None]
+        rows = (self.offsets[:-1, None] + steps[None, :])[valid]
+        out[valid] = data[rows]
+        return out.reshape((len(self), T, -1))
+
+
+def _parse_list(text):
+    # "[0 4]", "[2, 2]" or "[1, 0, 0, 1]" -> list of ints
+    return [int(float(v)) for v in text.strip("[]() \"").replace(",", " ").split()]
+
+
+def convert_csv(csv_path: str, path: str, chunk_size: int = 1 << 16):
+    """
+    one-shot conversion of the CSV files written by the old record_data.ipynb
+    (columns trajectory, inputs "[action obs]", state and optionally position "[x, y]", obs_matrix "[...]")
+    :param csv_path: the CSV file
+    :param path: the dataset directory to write
+    :return: the TrajectoryDataset
+
+    the columns written are trajectory, step, action, observation, state (and x, y, obs_matrix and
+    inputs = [action, obs_matrix] when the CSV has them)
+    """
+    with open(csv_path, newline="") as f, DatasetWriter(path, {"source": os.path.basename(csv_path)}) as writer:
+        reader = csv.DictReader(f)
+        rows = []
+        last_id, step = None, 0
+        for row in reader:
+            rows.append(row)
+            if len(rows) == chunk_size:
+                last_id, step = _write_csv_rows(writer, rows, last_id, step)
+                rows = []
+        if rows:
+            _write_csv_rows(writer, rows, last_id, step)
+    return TrajectoryDataset(path)
+
+
+def _write_csv_rows(writer, rows, last_id, step):
+    ids = np.array([int(r["trajectory"]) for r in rows], np.int64)
+    inputs = np.array([_parse_list(r["inputs"]) for r in rows], np.int64)
+    # step counter, restarting at every new trajectory (also across chunks)
+    steps = np.empty(len(ids), np.int32)
+    for i, t in enumerate(ids):
+        step = step + 1 if t == last_id else 0
+        steps[i] = step
+        last_id = t
+    columns = {"trajectory": ids, "step": steps,
+               "action": inputs[:, 0].astype(np.int8), "observation": inputs[:, 1].astype(np.int32),
+               "state": np.array([int(r["state"]) for r in rows], np.int32)}
+    if "position" in rows[0]:
+        position = np.array([_parse_list(r["position"]) for r in rows], np.int16)
+        columns["x"], columns["y"] = position[:, 0], position[:, 1]
+    if "obs_matrix" in rows[0]:
+        obs_matrix = np.array([_parse_list(r["obs_matrix"]) for r in rows], np.uint8)
+        columns["obs_matrix"] = obs_matrix
+        columns["inputs"] = np.hstack((columns["action"][:, None], obs_matrix)).astype(np.int8)
+    writer.append(columns)
+    return last_id, step
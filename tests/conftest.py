@@ -0,0 +1,55 @@
+"""
+Shared fixtures: the four gridworld env classes built with the same layout settings
+"""
+import numpy as np
+import pytest
+
+from gridworld2 import GridWorldEnv, GridWorldEnvNew
+from gridworldRNN import GridWorldEnvRnn, GridWorldEnvRnnNew
+
+ENV_CLASSES = {"GridWorldEnv": GridWorldEnv, "GridWorldEnvNew": GridWorldEnvNew,
+               "GridWorldEnvRnn": GridWorldEnvRnn, "GridWorldEnvRnnNew": GridWorldEnvRnnNew}
+
+
+def build_env(name, size=7, max_episode_steps=50, num_obs=3, action_noise=None, **kwargs):
+    '''an env of class name on a size x size grid with walls around, the end at (size-2, size-2)'''
+    kwargs = dict(n_width=size, n_height=size, u_size=40, default_type=0, default_reward=-1,
+                  max_episode_steps=max_episode_steps, **kwargs)
+    if name == "GridWorldEnvRnnNew":
+        kwargs["num_obs"] = num_obs
+    env = ENV_CLASSES[name](**kwargs)
+    env.end = (size - 2, size - 2)
+    if action_noise is not None:
+        env.action_noise = action_noise
+    env.reset()
+    return env
+
+
+@pytest.fixture
+def make_env():
+    return build_env
+
+
+@pytest.fixture(params=list(ENV_CLASSES))
+def env_name(request):
+    return request.param
+
+
+def first(reset_output):
+    '''the observation of reset(); GridWorldEnvRnn.reset returns (input, state)'''
+    return reset_output[0] if isinstance(reset_output, tuple) else reset_output
+
+
+def random_actions(n_steps, shape=(), seed=0):
+    return np.random.default_rng(seed).integers(0, 4, (n_steps,) + tuple(shape))
+
+
+def random_lstm_weights(n_tokens=4, dim=3, n_inputs=10, units=5, n_states=49, seed=0):
+    '''weights of a small state estimator (Embedding -> LSTM -> Dense) in the layout of numpy_lstm.export_weights'''
+    rng = np.random.default_rng(seed)
+    return {"embedding": rng.normal(size=(n_tokens, dim)),
+            "kernel": rng.normal(size=(n_inputs * dim, 4 * units)),
+            "recurrent_kernel": rng.normal(size=(units, 4 * units)),
+            "bias": rng.normal(size=4 * units),
+            "dense_kernel": rng.normal(size=(units, n_states)),
+            "dense_bias": rng.normal(size=n_states)}
@@ -0,0 +1,54 @@
+import numpy as np
+
+from batched_gridworld import BatchedGridWorldEnv, _BatchedVecEnv
+from conftest import build_env, first, random_actions
+
+
+def test_batched_matches_single_envs(env_name):
+    # slot j of a batch seeded (seed, first_index) steps like a single env seeded (seed, index=first_index + j)
+    num_envs, seed, first_index = 6, 123, 4
+    engine = BatchedGridWorldEnv(build_env(env_name, action_noise=0.3), num_envs, seed=seed,
+                                 first_index=first_index)
+    singles = [build_env(env_name, action_noise=0.3) for _ in range(num_envs)]
+    for j, env in enumerate(singles):
+        env.seed(seed, index=first_index + j)
+    observations = engine.reset()
+    assert np.array_equal(observations, np.stack([np.asarray(first(env.reset())) for env in singles]))
+
+    for actions in random_actions(300, (num_envs,)):
+        observations, rewards, dones, truncated = engine.step(actions)
+        results = [env.step(int(a)) for env, a in zip(singles, actions)]
+        assert np.array_equal(observations, np.stack([np.asarray(r[0]) for r in results]))
+        assert np.allclose(rewards, [r[1] for r in results])
+        assert np.array_equal(dones, [r[2] for r in results])
+        assert np.array_equal(truncated, [r[3]["TimeLimit.truncated"] for r in results])
+        assert np.array_equal(engine.state, [env.state for env in singles])
+        if dones.any():
+            engine.reset(dones)
+            for j in np.flatnonzero(dones):
+                singles[j].reset()
+
+
+def test_vec_env_resets_done_envs():
+    vec = _BatchedVecEnv(build_env("GridWorldEnvNew", max_episode_steps=5), 3, seed=0)
+    vec.reset()
+    for _ in range(4):
+        _, _, dones, infos = vec.step(np.zeros(3, np.int64))
+        assert not dones.any()
+    observations, _, dones, infos = vec.step(np.zeros(3, np.int64))
+    assert dones.all()
+    assert all(info["TimeLimit.truncated"] for info in infos)
+    assert all("terminal_observation" in info for info in infos)
+    assert (vec.engine._elapsed_steps == 0).all()
+
+
+def test_observation_space_follows_the_env():
+    vec = _BatchedVecEnv(build_env("GridWorldEnvRnnNew", num_obs=2), 4, seed=0)
+    assert list(vec.observation_space.nvec) == [9, 9, 4, 4]
+    vec.set_attr("num_obs", 5)
+    observations = vec.reset()
+    assert list(vec.observation_space.nvec) == [9] * 5 + [4] * 5
+    assert vec.engine.observation_space == vec.observation_space
+    assert observations.shape == (4, 10)
+    observations, _, _, _ = vec.step([0, 1, 2, 3])
+    assert all(vec.observation_space.contains(o) for o in observations)
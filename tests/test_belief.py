@@ -0,0 +1,62 @@
+import numpy as np
+
+from belief import BeliefTracker
+from conftest import build_env, random_actions
+
+
+def dense_update(env, belief, action, observation):
+    '''the Bayes filter with the full (n, n) transition matrix of the intended action'''
+    n, n_actions = len(env.transition_table), 4
+    matrix = np.zeros((n, n))
+    for s in range(1, n):
+        for b in range(n_actions):
+            p = env.action_noise / n_actions + (1 - env.action_noise) * (b == action)
+            matrix[s, env.transition_table[s, b]] += p
+    posterior = (belief @ matrix) * (env.obs_table == observation)
+    return posterior / posterior.sum()
+
+
+def test_tracker_matches_the_dense_filter():
+    env = build_env("GridWorldEnvNew", size=8, action_noise=0.3)
+    env.types = env.types + [(4, 4, 1)]
+    env.seed(3)
+    env.reset()
+    tracker = BeliefTracker(env)
+    belief = tracker.full_belief()[0]
+    assert belief[env.state] == 1
+    for action in random_actions(60):
+        env.step(int(action))
+        tracker.update([action], [env.observation])
+        belief = dense_update(env, belief, int(action), env.observation)
+        assert np.allclose(tracker.full_belief()[0], belief)
+        # the true state never loses its belief
+        assert tracker.full_belief()[0, env.state] > 0
+        if env._elapsed_steps >= env._max_episode_steps:
+            break
+
+
+def test_batched_beliefs_are_independent():
+    env = build_env("GridWorldEnvNew", action_noise=0.2)
+    tracker = BeliefTracker(env, num_envs=3)
+    singles = [tracker.spawn(1) for _ in range(3)]
+    actions = random_actions(20, (3,))
+    observations = np.random.default_rng(1).choice(env.obs_table[1:][env.obs_table[1:] >= 0], (20, 3))
+    for a, o in zip(actions, observations):
+        tracker.update(a, o)
+        for j, single in enumerate(singles):
+            single.update(a[j:j + 1], o[j:j + 1])
+            assert np.allclose(tracker.belief[j], single.belief[0])
+    assert np.allclose(tracker.belief.sum(axis=1), 1)
+    # a masked reset puts the masked envs back on the start
+    tracker.reset(mask=np.array([False, True, False]))
+    assert tracker.most_likely_state()[1] == env._xy_to_state(env.start)
+
+
+def test_noiseless_tracking_is_exact_on_an_open_room():
+    env = build_env("GridWorldEnvNew", action_noise=0)
+    env.reset()
+    tracker = BeliefTracker(env)
+    for action in [1, 1, 2, 2, 0, 3]:
+        env.step(action)
+        tracker.update([action], [env.observation])
+        assert tracker.belief.max() == 1 and tracker.most_likely_state()[0] == env.state
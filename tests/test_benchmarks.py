@@ -0,0 +1,44 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "bench_envs.py")
+
+
+@pytest.fixture(scope="module")
+def bench():
+    spec = importlib.util.spec_from_file_location("bench_envs", PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_quick_run_covers_every_case(bench):
+    results = bench.run([7], [1, 4], quick=True)
+    cases = {(r["env"], r["history"], r["mode"]) for r in results}
+    for name in ("GridWorldEnv", "GridWorldEnvNew", "GridWorldEnvRnn"):
+        assert {(name, None, "single"), (name, None, "batched"), (name, None, "kernel_numpy")} <= cases
+    assert {("GridWorldEnvRnnNew", 1, "single"), ("GridWorldEnvRnnNew", 4, "batched")} <= cases
+    assert ("GridWorldEnvNew", None, "encoding") in cases
+    assert all(r["steps_per_sec"] > 0 for r in results if "steps_per_sec" in r)
+
+
+def test_kernel_case_runs_with_a_time_limit(bench):
+    env = bench.make_env("GridWorldEnvNew", 7)
+    result = bench.bench_kernel(env, 1000, 1, "numpy")
+    assert result["time_limit"] == 4 * 7 * 7
+    assert env._max_episode_steps == 10 ** 9
+
+
+def test_compare_flags_regressions(bench, tmp_path, capsys):
+    row = {"env": "GridWorldEnv", "size": 7, "history": None, "mode": "single"}
+    for name, rate, reset in (("old", 100.0, 1.0), ("new", 50.0, 1.05)):
+        with open(str(tmp_path / name), "w") as f:
+            json.dump({"revision": name, "results": [dict(row, steps_per_sec=rate, reset_us=reset)]}, f)
+    bench.compare(str(tmp_path / "old"), str(tmp_path / "new"))
+    lines = capsys.readouterr().out.splitlines()
+    assert any("steps_per_sec" in line and "REGRESSION" in line for line in lines)
+    assert any("reset_us" in line and "REGRESSION" not in line for line in lines)
@@ -0,0 +1,68 @@
+import numpy as np
+
+from conftest import build_env
+from evaluation import EvaluationResult, evaluate_policy
+
+
+def greedy(observations):
+    # right, and up once the wall is on the right (observations 1 and 2)
+    return np.where(np.isin(observations, (1, 2)), 2, 1)
+
+
+def serial_returns(env_name, n_envs, episodes_per_env, seed, gamma):
+    returns, lengths = [], []
+    for j in range(n_envs):
+        env = build_env(env_name, action_noise=0.3, max_episode_steps=15)
+        env.seed(seed, index=j)
+        for _ in range(episodes_per_env):
+            observation, done, total, discount = env.reset(), False, 0.0, 1.0
+            while not done:
+                observation, reward, done, _ = env.step(int(greedy(observation)))
+                total += discount * reward
+                discount *= gamma
+            returns.append(total)
+            lengths.append(env._elapsed_steps)
+    return sorted(returns), sorted(lengths)
+
+
+def test_batched_evaluation_matches_serial_episodes():
+    env = build_env("GridWorldEnvNew", action_noise=0.3, max_episode_steps=15)
+    result = evaluate_policy(greedy, env, num_episodes=12, num_envs=4, seed=3, gamma=0.9)
+    assert result.n_episodes == 12
+    returns, lengths = serial_returns("GridWorldEnvNew", 4, 3, 3, 0.9)
+    assert np.allclose(sorted(result.returns), returns)
+    assert sorted(result.lengths) == lengths
+    assert 0 < result.truncation_rate < 1
+    assert env.evaluate(greedy, num_episodes=8, num_envs=4) <= 0
+
+
+class RecurrentModel(object):
+    '''a model with the stable_baselines predict interface counting the steps of each episode'''
+
+    def __init__(self):
+        self.masks = []
+
+    def predict(self, observations, state=None, mask=None, deterministic=True):
+        self.masks.append(mask.copy())
+        state = np.zeros(len(observations), np.int64) if state is None else np.where(mask, 0, state + 1)
+        # walk right then up: the policy needs its state
+        return np.where(state < 3, 1, 2), state
+
+
+def test_recurrent_state_is_reset_at_episode_starts():
+    env = build_env("GridWorldEnvNew", action_noise=0, max_episode_steps=10)
+    model = RecurrentModel()
+    result = evaluate_policy(model, env, num_episodes=6, num_envs=3)
+    # right 3 times then up 3 times from (2, 2) to the end (5, 5)
+    assert list(result.lengths) == [6] * 6
+    assert model.masks[0].all() and model.masks[6].all() and not model.masks[1].any()
+
+
+def test_result_statistics():
+    result = EvaluationResult([1.0, 2.0, 3.0, 4.0], [5, 6, 7, 8], [False] * 4)
+    lo, hi = result.return_ci
+    assert lo < result.mean_return == 2.5 < hi
+    assert result.truncation_rate == 0
+    lo, hi = result.truncation_ci
+    assert lo == 0 and 0 < hi < 1
+    assert result.summary()["mean_length"] == 6.5
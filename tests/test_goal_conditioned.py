@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from conftest import build_env, first, random_actions
+from goal_conditioned import GoalConditionedBatchedEnv, GoalConditionedEnv, GoalSet
+
+
+def test_batched_matches_single_envs(env_name):
+    # slot j of a batch seeded (seed, first_index) plays the goals of GoalConditionedEnv(index=first_index + j)
+    num_envs, seed, first_index = 5, 77, 3
+    goals = GoalSet(build_env(env_name, action_noise=0.3))
+    engine = GoalConditionedBatchedEnv(build_env(env_name, action_noise=0.3), num_envs, goals, seed=seed,
+                                       first_index=first_index)
+    singles = [GoalConditionedEnv(build_env(env_name, action_noise=0.3), goals.goals, seed=seed,
+                                  index=first_index + j) for j in range(num_envs)]
+    observations = engine.reset()
+    assert np.array_equal(observations, np.stack([first(env.reset()) for env in singles]))
+
+    played = set()
+    for actions in random_actions(400, (num_envs,)):
+        observations, rewards, dones, truncated = engine.step(actions)
+        results = [env.step(int(a)) for env, a in zip(singles, actions)]
+        assert np.array_equal(observations, np.stack([r[0] for r in results]))
+        assert np.allclose(rewards, [r[1] for r in results])
+        assert np.array_equal(dones, [r[2] for r in results])
+        assert np.array_equal(truncated, [r[3]["TimeLimit.truncated"] for r in results])
+        assert np.array_equal(engine.goal, [r[3]["goal"] for r in results])
+        played.update(engine.goal.tolist())
+        if dones.any():
+            engine.reset(dones)
+            for j in np.flatnonzero(dones):
+                singles[j].reset()
+    # the goals change across episodes
+    assert len(played) > 3
+
+
+@pytest.mark.parametrize("env_name", ["GridWorldEnvRnn", "GridWorldEnvRnnNew"])
+def test_goal_rewards_are_the_rewards_of_the_goal_as_end(env_name):
+    env = build_env(env_name)
+    goals = GoalSet(env, [(3, 4), (5, 2), (4, 4)])
+    for g, goal in enumerate(goals.goals):
+        reference = build_env(env_name)
+        reference.end = tuple(goal)
+        reference.reset()
+        assert np.allclose(goals.rewards[g], reference.reward_table[1:])
+
+
+def test_layout_rewards_do_not_depend_on_the_goal():
+    env = build_env("GridWorldEnv")
+    env.rewards = [(3, 3, -5)]
+    goals = GoalSet(env, [(3, 4), (5, 2)])
+    assert np.array_equal(goals.rewards[0], env.reward_table[1:])
+    assert np.array_equal(goals.rewards[1], env.reward_table[1:])
+
+
+def test_default_goals_are_the_reachable_cells_but_the_start():
+    env = build_env("GridWorldEnv")
+    env.types = env.types + [(4, 2, 1), (4, 3, 1), (4, 4, 1), (4, 5, 1), (4, 6, 1)]
+    goals = GoalSet(env)
+    # the walls around and at x = 4 cut the grid to the 2 x 5 cells of x in 2..3
+    assert sorted(map(tuple, goals.goals.tolist())) == [(x, y) for x in (2, 3) for y in range(2, 7)
+                                                         if (x, y) != env.start]
+
+
+def test_episode_ends_at_the_goal_not_at_the_ends(env_name):
+    env = build_env(env_name, action_noise=0)
+    # the layout end (3, 2) is on the way to the goal (4, 2)
+    env.end = [(3, 2), (5, 5)]
+    env.reset()
+    assert env.end_table.sum() == 2
+    single = GoalConditionedEnv(env, [(4, 2), (2, 4)], seed=0)
+    observation = first(single.reset(goal=0))
+    assert observation[-1] == 0 and single.goal_xy == (4, 2)
+    _, _, done, info = single.step(1)
+    assert env.state == env._xy_to_state(3, 2) and not done and info["goal"] == 0
+    _, _, done, info = single.step(1)
+    assert done and not info["TimeLimit.truncated"]
+
+    engine = GoalConditionedBatchedEnv(env, 2, [(4, 2), (2, 4)], seed=0)
+    engine.reset(goals=[0, 1])
+    for action, expected in [([1, 2], [False, False]), ([1, 2], [True, True])]:
+        _, _, dones, truncated = engine.step(np.array(action))
+        assert np.array_equal(dones, expected) and not truncated.any()
@@ -0,0 +1,118 @@
+import pickle
+
+import numpy as np
+
+from conftest import build_env, random_actions
+
+
+def reference_step(env, state, action):
+    '''one move on the grid matrix itself: walls and the border keep the agent in place'''
+    x, y = env._state_to_xy(state)
+    dx, dy = [(-1, 0), (1, 0), (0, 1), (0, -1)][action]
+    new_x = min(max(x + dx, 1), env.n_width)
+    new_y = min(max(y + dy, 1), env.n_height)
+    if env.grids.get_type(new_x, new_y) == 1:
+        new_x, new_y = x, y
+    return env._xy_to_state(new_x, new_y), env.grids.get_reward(new_x, new_y), (new_x, new_y) in env.ends
+
+
+def test_tables_match_the_grid_matrix(env_name):
+    env = build_env(env_name, size=8)
+    env.types = env.types + [(3, 3, 1), (4, 5, 1)]
+    env.rewards = [(2, 4, -5), (5, 2, 3)]
+    env._check_tables()
+    for state in range(1, env.n_width * env.n_height + 1):
+        for action in range(4):
+            new_state, reward, done = reference_step(env, state, action)
+            assert env.transition_table[state, action] == new_state
+            if env_name in ("GridWorldEnv", "GridWorldEnvNew"):
+                assert env.reward_table[new_state] == reward
+            assert env.end_table[new_state] == done
+
+
+def test_step_follows_the_tables(env_name):
+    env = build_env(env_name, action_noise=0)
+    env.reset()
+    for action in random_actions(200):
+        state = env.state
+        _, reward, done, _ = env.step(int(action))
+        expected, _, end = reference_step(env, state, int(action))
+        assert env.state == expected
+        assert reward == env.reward_table[expected]
+        assert done == (end or env._elapsed_steps >= env._max_episode_steps)
+        if done:
+            env.reset()
+
+
+def test_tables_follow_layout_changes():
+    env = build_env("GridWorldEnv")
+    assert env.transition_table[env._xy_to_state(2, 2), 1] == env._xy_to_state(3, 2)
+    # setters of the env mark the tables dirty
+    env.types = env.types + [(3, 2, 1)]
+    env.reset()
+    assert env.transition_table[env._xy_to_state(2, 2), 1] == env._xy_to_state(2, 2)
+    # so do direct writes to the grid matrix
+    env.grids.set_type(3, 2, 0)
+    env.grids.set_reward(3, 2, 7)
+    env.reset()
+    assert env.transition_table[env._xy_to_state(2, 2), 1] == env._xy_to_state(3, 2)
+    assert env.reward_table[env._xy_to_state(3, 2)] == 7
+    env.end = [(5, 5), (2, 5)]
+    assert env._is_end_state(2, 5) and env._is_end_state(5, 5)
+    assert env.end_table.sum() == 2
+
+
+def test_grid_matrix_views():
+    from gridworld2 import GridMatrix
+    matrix = GridMatrix(n_width=4, n_height=3, default_reward=-1)
+    version = matrix.version
+    matrix.set_type(2, 3, 1)
+    matrix.set_reward(4, 1, 5.5)
+    matrix.set_value(1, 2, 0.25)
+    assert matrix.version == version + 2
+    # the read-only views are (n_height, n_width), [y-1, x-1] is the grid (x, y), and follow the writes
+    assert matrix.types[2, 1] == 1 and matrix.rewards[0, 3] == 5.5 and matrix.values[1, 0] == 0.25
+    assert not matrix.types.flags.writeable and not matrix.rewards.flags.writeable
+    assert matrix.get_reward(4, 1) == 5.5 and matrix.get_grid((3, 3)).reward == -1
+    grid = matrix.get_grid(2, 3)
+    assert grid.type == 1 and not hasattr(grid, "__dict__")
+    grid.reward = 2
+    assert matrix.rewards[2, 1] == 2
+    assert [(g.x, g.y) for g in matrix.grids][:5] == [(1, 1), (2, 1), (3, 1), (4, 1), (1, 2)]
+    matrix.set_values(np.ones((3, 4)), mask=matrix.types == 1)
+    assert matrix.values.sum() == 1.25
+
+
+def run_infos(env, n_steps=40):
+    env.seed(4)
+    env.reset()
+    infos = []
+    for action in random_actions(n_steps):
+        infos.append(env.step(int(action))[3])
+        if infos[-1].get("TimeLimit.truncated") or env._is_end_state(env.state):
+            env.reset()
+    return infos
+
+
+def test_info_modes(env_name):
+    full = run_infos(build_env(env_name, action_noise=0.3, max_episode_steps=8))
+    assert set(full[0]) == set(build_env(env_name).INFO_KEYS) | {"TimeLimit.truncated"}
+
+    env = build_env(env_name, action_noise=0.3, max_episode_steps=8)
+    env.set_info_mode("lazy")
+    lazy = run_infos(env)
+    assert [dict(info) for info in lazy] == full
+    assert pickle.loads(pickle.dumps(lazy[0])) == full[0]
+
+    env.set_info_mode("minimal")
+    assert run_infos(env) == [{"TimeLimit.truncated": info["TimeLimit.truncated"]} for info in full]
+    env.set_info_mode("none")
+    # only a truncated step reports it
+    assert run_infos(env) == [{"TimeLimit.truncated": True} if info["TimeLimit.truncated"] else {} for info in full]
+
+    env.set_info_mode("full", fields=("state", "grids"))
+    info = run_infos(env, 1)[0]
+    assert set(info) == {"state", "grids", "TimeLimit.truncated"} and info["state"] == env.state
+    assert np.array_equal(info["grids"], env.grids.types)
+    env.set_info_mode()
+    assert run_infos(env) == full
@@ -0,0 +1,44 @@
+import numpy as np
+
+from conftest import build_env, random_actions
+from history import HistoryBuffer
+
+
+def test_env_input_matches_list_history():
+    # the list history GridWorldEnvRnnNew kept before: insert the newest at the front, drop the last
+    env = build_env("GridWorldEnvRnnNew", num_obs=4, action_noise=0.3, copy_obs=True)
+    env.seed(5)
+    observation = env.reset()
+    obs_list, act_list = [env.observation] * 4, [0] * 4
+    assert list(observation) == obs_list + act_list
+    for action in random_actions(120):
+        observation, _, done, _ = env.step(int(action))
+        obs_list = [env.observation] + obs_list[:-1]
+        act_list = [env.action] + act_list[:-1]
+        assert list(observation) == obs_list + act_list
+        assert env.obs_list == obs_list and env.act_list == act_list
+        if done:
+            observation = env.reset()
+            obs_list, act_list = [env.observation] * 4, [0] * 4
+
+
+def test_input_is_filled_in_place_unless_copied():
+    env = build_env("GridWorldEnvRnnNew", num_obs=2)
+    first_input = env.reset()
+    assert env.step(1)[0] is first_input
+    env = build_env("GridWorldEnvRnnNew", num_obs=2, copy_obs=True)
+    first_input = env.reset()
+    assert env.step(1)[0] is not first_input
+
+
+def test_batch_history_with_mask():
+    history = HistoryBuffer(3, batch_shape=(2,))
+    history.reset(np.array([1, 2]))
+    history.push(np.array([3, 4]), np.array([1, 2]))
+    history.reset(np.array([9]), mask=np.array([False, True]))
+    assert history.observations.tolist() == [[3, 1, 1], [9, 9, 9]]
+    assert history.actions.tolist() == [[1, 0, 0], [0, 0, 0]]
+    for step in range(5):
+        history.push(np.array([step, -step]), np.array([2, 3]))
+    assert history.observations.tolist() == [[4, 3, 2], [-4, -3, -2]]
+    assert history.fill().tolist() == [[4, 3, 2, 2, 2, 2], [-4, -3, -2, 3, 3, 3]]
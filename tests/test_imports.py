@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from env_core import Discrete, MultiDiscrete
+
+GYM_TEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gym_test")
+
+CHECK = """
+import sys
+import gridworlds
+env = gridworlds.GridWorldEnvRnnNew(n_width=7, n_height=7, u_size=40, default_type=0, max_episode_steps=10,
+                                    default_reward=-1, num_obs=2)
+env.reset()
+env.step(1)
+heavy = ("gym", "pyglet", "stable_baselines", "tensorflow", "keras", "pandas", "numba", "batched_gridworld", "pbvi")
+print(sorted(m for m in heavy if m in sys.modules))
+gridworlds.PointBasedSolver
+print("pbvi" in sys.modules, "belief" in sys.modules)
+"""
+
+
+def test_core_imports_with_numpy_only():
+    # a fresh interpreter: the test session may have loaded anything already
+    out = subprocess.check_output([sys.executable, "-c", CHECK], cwd=GYM_TEST).decode().split("\n")
+    assert out[0] == "[]"
+    assert out[1] == "True True"
+
+
+def test_spaces():
+    space = Discrete(4)
+    assert space.contains(3) and space.contains(np.int64(0)) and not space.contains(4) and 2.0 not in space
+    space.seed(1)
+    samples = [space.sample() for _ in range(5)]
+    space.seed(1)
+    assert [space.sample() for _ in range(5)] == samples
+    space = MultiDiscrete([9, 9, 4, 4])
+    assert space.contains([8, 0, 3, 1]) and not space.contains([9, 0, 0, 0]) and not space.contains([1, 2, 3])
+    assert space.contains(space.sample()) and space == MultiDiscrete([9, 9, 4, 4])
+
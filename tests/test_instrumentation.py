@@ -0,0 +1,78 @@
+import numpy as np
+
+from batched_gridworld import BatchedGridWorldEnv
+from conftest import build_env, first, random_actions, random_lstm_weights
+from gridworld2 import GridWorldEnv
+from gridworldLSTM import GridWorldEnvLstm
+from instrumentation import PHASES, StepProfiler
+from numpy_lstm import NumpyLstmStatePredictor
+
+
+def build_lstm_env():
+    env = GridWorldEnvLstm(n_width=7, n_height=7, u_size=40, default_type=0, max_episode_steps=20,
+                           default_reward=-1, predictor=NumpyLstmStatePredictor(**random_lstm_weights()))
+    env.end = (5, 5)
+    return env
+
+
+class TeleportEnv(GridWorldEnv):
+    '''a subclass whose step does not call GridWorldEnv.step'''
+
+    def step(self, action):
+        self._elapsed_steps += 1
+        self.state = 1 + (self.state + action) % (self.n_width * self.n_height)
+        return self.state, 0.0, self._elapsed_steps >= 3, {}
+
+
+def run(env, n_steps=80):
+    env.seed(2)
+    results = [np.asarray(first(env.reset())).tolist()]
+    for action in random_actions(n_steps):
+        observation, reward, done, _ = env.step(int(action))
+        results.append((np.asarray(observation).tolist(), reward, done, env.state))
+        if done:
+            results.append(np.asarray(first(env.reset())).tolist())
+    return results
+
+
+def test_profiled_steps_are_unchanged(env_name):
+    env = build_env(env_name, action_noise=0.3)
+    expected = run(build_env(env_name, action_noise=0.3))
+    with StepProfiler(env) as profiler:
+        assert run(env) == expected
+    assert profiler.step_timer.count == 80
+    # every phase of GridWorldEnv.step is timed once per step
+    assert all(profiler.phase_timers[name].count == 80 for name in PHASES)
+    assert profiler.episode_stats()["episodes"] == len(profiler.episode_returns) > 0
+    # detached, the env runs its own methods again
+    assert "step" not in env.__dict__ and "reset" not in env.__dict__ and env._phase_clock is None
+
+
+def test_subclass_steps_run_under_the_profiler():
+    # the LSTM env returns the predicted state, the profiler must not replace its step
+    expected = run(build_lstm_env())
+    env = build_lstm_env()
+    with StepProfiler(env) as profiler:
+        assert run(env) == expected
+    assert profiler.phase_timers["movement"].count == 80
+
+    env = TeleportEnv(n_width=5, n_height=5)
+    plain = run(TeleportEnv(n_width=5, n_height=5), 10)
+    with StepProfiler(env) as profiler:
+        assert run(env, 10) == plain
+    # no phase marks, only the whole step is timed
+    assert profiler.step_timer.count == 10 and profiler.phase_timers["movement"].count == 0
+    assert profiler.episode_lengths == [3, 3, 3]
+
+
+def test_batched_episodes_are_counted_per_env():
+    engine = BatchedGridWorldEnv(build_env("GridWorldEnvNew", max_episode_steps=5), 3, seed=0)
+    with StepProfiler(engine) as profiler:
+        engine.reset()
+        for actions in random_actions(10, (3,)):
+            _, _, dones, _ = engine.step(actions)
+            if dones.any():
+                engine.reset(dones)
+    assert profiler.step_timer.count == 10
+    assert profiler.episode_lengths == [5] * 6
+    assert profiler.episode_truncated == [True] * 6
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from conftest import build_env
+from kernels import _rollout_chunks, episode_returns, evaluate_table_policy, have_numba, rollout
+from layouts import generate
+
+BACKENDS = ["numpy", pytest.param("numba", marks=pytest.mark.skipif(not have_numba(), reason="numba not installed"))]
+
+
+def build_kernel_env(env_name, action_noise=0.3):
+    env = build_env(env_name, max_episode_steps=40, action_noise=action_noise, num_obs=4)
+    env.set_layout(generate("rooms", 10, 10, seed=3))
+    env.reset()
+    return env
+
+
+def policy_table(env, seed=1):
+    n_keys = env.n_obs if hasattr(env, "n_obs") else len(env.transition_table)
+    return np.random.default_rng(seed).integers(0, 4, n_keys)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("action_noise", [0.0, 0.3, 1.0])
+def test_rollout_matches_env_step(env_name, backend, action_noise):
+    # rollout(env, seed=s, index=i) runs the episodes of env.step after env.seed(s, index=i)
+    env = build_kernel_env(env_name, action_noise)
+    table = policy_table(env)
+    trajectory = rollout(env, steps=300, policy=table, seed=5, index=3, episode=2, backend=backend)
+    env.seed(5, index=3)
+    env.reset()
+    env.noise.start(2)
+    for t in range(300):
+        key = env.obs_table[env.state] if hasattr(env, "obs_table") else env.state
+        assert trajectory["obs"][t] == key and trajectory["action"][t] == table[key]
+        _, reward, done, info = env.step(int(table[key]))
+        assert env.action == trajectory["taken"][t] and env.state == trajectory["state"][t]
+        assert reward == trajectory["reward"][t]
+        assert done == (trajectory["done"][t] or trajectory["truncated"][t])
+        assert info["TimeLimit.truncated"] == trajectory["truncated"][t]
+        if action_noise > 0:
+            # a stream that never draws stays on its episode, the number only matters for the draws
+            assert trajectory["episode"][t] == env.noise.episode
+        if done:
+            env.reset()
+
+
+@pytest.mark.skipif(not have_numba(), reason="numba not installed")
+def test_backends_agree():
+    env = build_kernel_env("GridWorldEnvNew")
+    probs = np.random.default_rng(2).random((env.n_obs, 4))
+    for policy in (None, probs):
+        a, b = (rollout(env, steps=2000, policy=policy, seed=9, backend=backend) for backend in ("numpy", "numba"))
+        assert all(np.array_equal(a[name], b[name]) for name in a)
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 64, 65])
+def test_pieces_join_to_one_rollout(chunk):
+    env = build_kernel_env("GridWorldEnvNew")
+    whole = rollout(env, steps=500, seed=4, backend="numpy")
+    pieces = list(_rollout_chunks(env, steps=500, seed=4, backend="numpy", chunk=chunk))
+    assert all(np.array_equal(whole[name], np.concatenate([p[name] for p in pieces])) for name in whole)
+    episodes = rollout(env, episodes=6, seed=4, backend="numpy")
+    pieces = list(_rollout_chunks(env, episodes=6, seed=4, backend="numpy", chunk=chunk))
+    assert all(np.array_equal(episodes[name], np.concatenate([p[name] for p in pieces])) for name in episodes)
+    ends = episodes["done"] | episodes["truncated"]
+    assert ends.sum() == 6 and ends[-1]
+
+
+def test_policy_probabilities_and_random_policy():
+    env = build_kernel_env("GridWorldEnv", action_noise=0)
+    probs = np.ones((len(env.transition_table), 4))
+    probs[:, 2] = 0
+    assert not (rollout(env, steps=2000, policy=probs, seed=0, backend="numpy")["action"] == 2).any()
+    actions = rollout(env, steps=4000, seed=0, backend="numpy")["action"]
+    assert set(np.bincount(actions, minlength=4) > 800) == {True}
+
+
+def test_returns_and_evaluation():
+    env = build_kernel_env("GridWorldEnvNew")
+    trajectory = rollout(env, steps=3000, seed=1, backend="numpy")
+    returns, lengths, truncated = episode_returns(trajectory, gamma=0.9)
+    ends = np.flatnonzero(trajectory["done"] | trajectory["truncated"])
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    assert np.array_equal(lengths, ends - starts + 1)
+    for i in (0, len(ends) // 2, len(ends) - 1):
+        rewards = trajectory["reward"][starts[i]:ends[i] + 1]
+        assert np.isclose(returns[i], (rewards * 0.9 ** np.arange(len(rewards))).sum())
+    assert np.array_equal(truncated, trajectory["truncated"][ends])
+
+    result = evaluate_table_policy(env, num_episodes=len(ends), seed=1, gamma=0.9, backend="numpy")
+    assert np.allclose(result.returns, returns) and np.array_equal(result.lengths, lengths)
+
+
+def test_huge_time_limits_need_no_huge_buffers():
+    env = build_kernel_env("GridWorldEnvNew")
+    env._max_episode_steps = 10 ** 9
+    result = evaluate_table_policy(env, num_episodes=3, seed=0, backend="numpy")
+    assert result.n_episodes == 3 and not result.truncated.any()
+    assert len(rollout(env, episodes=2, seed=0, backend="numpy")["state"]) == result.lengths[:2].sum()
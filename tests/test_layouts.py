@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from conftest import build_env, random_actions
+from layouts import GENERATORS, Layout, TableCache, generate, layout_stream, maze
+
+
+@pytest.mark.parametrize("kind", sorted(GENERATORS))
+def test_generators_are_seeded_and_connected(kind):
+    args = (8,) if kind == "t_maze" else (15, 13)
+    a, b = generate(kind, *args, seed=3), generate(kind, *args, seed=3)
+    assert a.key == b.key and a.is_connected()
+    # the border is walled
+    assert (a.types[[0, -1]] == 1).all() and (a.types[:, [0, -1]] == 1).all()
+    if kind not in ("box", "t_maze"):
+        assert any(generate(kind, *args, seed=s).key != a.key for s in range(4, 8))
+
+
+def test_maze_is_perfect():
+    layout = maze(11, 9, seed=0)
+    free = layout.types == 0
+    # a tree: edges between free neighbours = free grids - 1
+    edges = (free[1:] & free[:-1]).sum() + (free[:, 1:] & free[:, :-1]).sum()
+    assert edges == free.sum() - 1
+    assert (layout.distances() >= 0).sum() == free.sum()
+
+
+def test_text_round_trip():
+    layout = generate("rooms", 13, 13, seed=1)
+    again = Layout.from_text(layout.to_text())
+    assert again.key == layout.key
+
+
+def test_layout_stream_is_seeded():
+    keys = [layout.key for layout in layout_stream("maze", 3, 9, 9, seed=0)]
+    assert keys == [layout.key for layout in layout_stream("maze", 3, 9, 9, seed=0)]
+    assert len(set(keys)) == 3
+
+
+def trajectory(env, n_steps=150):
+    env.seed(0)
+    env.reset()
+    states = []
+    for action in random_actions(n_steps):
+        observation, reward, done, _ = env.step(int(action))
+        states.append((env.state, np.asarray(observation).tolist(), reward, done))
+        if done:
+            env.reset()
+    return states
+
+
+@pytest.mark.parametrize("directory", [False, True])
+def test_cached_tables_give_the_same_env(env_name, directory, tmp_path):
+    cache = TableCache(str(tmp_path) if directory else None)
+    layouts = list(layout_stream("random_obstacles", 3, 9, 8, seed=2))
+    compiled = build_env(env_name, action_noise=0.2)
+    for layout in layouts:
+        compiled.set_layout(layout, cache)
+    assert cache.misses == 3 and cache.hits == 0
+    if directory:
+        cache = TableCache(str(tmp_path))  # a later run: read from disk
+    for layout in layouts:
+        fresh, cached = build_env(env_name, action_noise=0.2), build_env(env_name, action_noise=0.2)
+        fresh.set_layout(layout)
+        cached.set_layout(layout, cache)
+        for name in ("transition_table", "reward_table", "end_table", "type_table"):
+            assert np.array_equal(getattr(fresh, name), getattr(cached, name))
+        assert fresh.observation_space == cached.observation_space
+        assert trajectory(fresh) == trajectory(cached)
+    assert cache.hits == 3
@@ -0,0 +1,52 @@
+import numpy as np
+
+from conftest import build_env
+from local_view import OBS_TEMPLATES, LocalViewEncoder
+
+
+def test_border_cells_get_the_nine_templates():
+    env = build_env("GridWorldEnvNew")
+    # corners and sides of the room inside the border walls, e.g. (2, 2) sees walls on its left and below
+    expected = {(4, 4): 0, (6, 4): 1, (6, 2): 2, (4, 2): 3, (2, 2): 4, (2, 4): 5, (2, 6): 6, (4, 6): 7, (6, 6): 8}
+    for (x, y), obs in expected.items():
+        assert env._xy_to_obs(x, y) == obs
+        assert np.array_equal(env.obs_matrix_table[env._xy_to_state(x, y)], OBS_TEMPLATES[obs])
+    assert env.n_obs == 9
+
+
+def test_new_patterns_get_new_ids_that_stay_stable():
+    encoder = LocalViewEncoder(1)
+    types = np.zeros((5, 5), np.int8)
+    types[2, 2] = 1  # an interior obstacle at (3, 3)
+    ids = encoder.fit(types)
+    assert encoder.n_patterns > 9
+    # the cell (2, 3) sees the obstacle on its right: a pattern that is no template
+    assert ids[(3 - 1) * 5 + 2 - 1] >= 9
+    again = encoder.fit(types)
+    assert np.array_equal(ids, again)
+    # the ids of another layout keep the ids registered before
+    other = encoder.fit(np.zeros((4, 6), np.int8))
+    assert set(other) <= set(range(encoder.n_patterns))
+    assert np.array_equal(encoder.fit(types), ids)
+
+
+def test_windows_treat_cells_off_the_map_as_walls():
+    encoder = LocalViewEncoder(2)
+    windows = encoder.windows(np.zeros((3, 4), np.int8))
+    assert windows.shape == (12, 25)
+    # the grid (1, 1): the two bottom rows and two left columns are off the map
+    window = windows[0].reshape(5, 5)
+    assert (window[3:] == 1).all() and (window[:, :2] == 1).all() and window[:3, 2:].sum() == 0
+    assert np.array_equal(encoder.unpack(encoder.pack(windows)), windows)
+
+
+def test_unreachable_cells_do_not_register_patterns():
+    encoder = LocalViewEncoder(1)
+    types = np.zeros((5, 5), np.int8)
+    types[2, 2] = 1
+    reachable = np.ones(25, bool)
+    reachable[(3 - 1) * 5 + 2 - 1] = False
+    # only the grid (2, 3) sees the obstacle right of it
+    ids = encoder.fit(types, reachable)
+    assert ids[(3 - 1) * 5 + 2 - 1] == -1
+    assert (np.delete(ids, (3 - 1) * 5 + 2 - 1) >= 0).all()
@@ -0,0 +1,39 @@
+import numpy as np
+
+from conftest import random_actions, random_lstm_weights
+from gridworldLSTM import GridWorldEnvLstm
+from numpy_lstm import NumpyLstmStatePredictor
+
+
+def build_lstm_env():
+    predictor = NumpyLstmStatePredictor(**random_lstm_weights())
+    env = GridWorldEnvLstm(n_width=7, n_height=7, u_size=40, default_type=0, max_episode_steps=30,
+                           default_reward=-1, predictor=predictor)
+    env.end = (5, 5)
+    return env
+
+
+def test_incremental_predictions_match_the_whole_sequence():
+    # carrying the LSTM state step by step predicts what re-running the whole episode's inputs predicts
+    env = build_lstm_env()
+    env.seed(1)
+    for episode in range(3):
+        predicted = [env.reset()]
+        inputs = [np.hstack((0, env.obs_matrix_table[env.state]))]
+        for action in random_actions(30, seed=episode):
+            predicted.append(env.step(int(action))[0])
+            inputs.append(np.hstack((env.action, env.obs_matrix_table[env.state])))
+            if env._elapsed_steps >= 30 or env._is_end_state(env.state):
+                break
+        expected = env.predictor.run(np.array(inputs)[None])[0].argmax(axis=-1)
+        assert predicted == expected.tolist()
+
+
+def test_reset_starts_a_new_sequence():
+    env = build_lstm_env()
+    first = env.reset()
+    h = env.predictor.h.copy()
+    for action in range(4):
+        env.step(action)
+    assert env.reset() == first
+    assert np.array_equal(env.predictor.h, h)
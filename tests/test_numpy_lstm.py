@@ -0,0 +1,81 @@
+import numpy as np
+
+from conftest import random_lstm_weights
+from numpy_lstm import NumpyLstmStatePredictor, export_weights
+
+
+def reference_run(weights, sequences):
+    '''the keras layers one by one: Embedding, flatten, LSTM (gates i, f, c, o), Dense, softmax'''
+    units = weights["recurrent_kernel"].shape[0]
+    batch, T, n_inputs = sequences.shape
+    h, c = np.zeros((batch, units)), np.zeros((batch, units))
+    sigmoid = lambda x: 1 / (1 + np.exp(-x))
+    out = []
+    for t in range(T):
+        x = weights["embedding"][sequences[:, t]].reshape(batch, -1)
+        z = x @ weights["kernel"] + h @ weights["recurrent_kernel"] + weights["bias"]
+        i, f, g, o = z[:, :units], z[:, units:2 * units], z[:, 2 * units:3 * units], z[:, 3 * units:]
+        c = sigmoid(f) * c + sigmoid(i) * np.tanh(g)
+        h = sigmoid(o) * np.tanh(c)
+        logits = h @ weights["dense_kernel"] + weights["dense_bias"]
+        y = np.exp(logits - logits.max(axis=1, keepdims=True))
+        out.append(y / y.sum(axis=1, keepdims=True))
+    return np.stack(out, axis=1)
+
+
+def random_sequences(batch=3, T=20, seed=1):
+    return np.random.default_rng(seed).integers(0, 4, (batch, T, 10))
+
+
+def test_run_matches_the_keras_layers():
+    weights = random_lstm_weights()
+    sequences = random_sequences()
+    out = NumpyLstmStatePredictor(**weights).run(sequences)
+    assert np.allclose(out, reference_run(weights, sequences), atol=1e-4)
+
+
+def test_predict_steps_like_run():
+    weights = random_lstm_weights()
+    sequences = random_sequences()
+    predictor = NumpyLstmStatePredictor(num_envs=3, **weights)
+    expected = predictor.run(sequences)
+    steps = [predictor.predict(sequences[:, t]) for t in range(sequences.shape[1])]
+    assert np.allclose(np.stack(steps, axis=1), expected, atol=1e-6)
+    # a masked reset starts a new sequence for the masked envs only
+    predictor.reset(np.array([True, False, False]))
+    assert not predictor.h[0].any() and predictor.h[1:].any()
+
+
+class Embedding(object):
+    def __init__(self, weights):
+        self.weights = weights
+
+    def get_weights(self):
+        return self.weights
+
+
+class LSTM(Embedding):
+    def get_config(self):
+        return {"recurrent_activation": "hard_sigmoid"}
+
+
+class Dense(Embedding):
+    pass
+
+
+class Model(object):
+    def __init__(self, weights):
+        self.layers = [Embedding([weights["embedding"]]),
+                       LSTM([weights["kernel"], weights["recurrent_kernel"], weights["bias"]]),
+                       Dense([weights["dense_kernel"], weights["dense_bias"]])]
+
+
+def test_exported_weights_load_back(tmp_path):
+    weights = random_lstm_weights()
+    path = str(tmp_path / "weights.npz")
+    export_weights(Model(weights), path)
+    predictor = NumpyLstmStatePredictor.load(path)
+    assert predictor.recurrent_activation.__name__ == "_hard_sigmoid"
+    expected = NumpyLstmStatePredictor(recurrent_activation="hard_sigmoid", **weights)
+    sequences = random_sequences(batch=1)
+    assert np.allclose(predictor.run(sequences), expected.run(sequences))
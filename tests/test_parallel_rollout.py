@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from conftest import build_env, first, random_actions
+from env_core import Discrete
+from parallel_rollout import ParallelRolloutCollector
+
+NUM_ENVS, SEED = 5, 11
+
+
+def make_env():
+    return build_env("GridWorldEnvNew", max_episode_steps=20, action_noise=0.3)
+
+
+def run(collector, n_steps=60):
+    collector.reset()
+    states = []
+    for actions in random_actions(n_steps, (NUM_ENVS,)):
+        _, _, _, infos = collector.step(actions)
+        states.append([info["state"] for info in infos])
+    return np.array(states)
+
+
+@pytest.mark.parametrize("batched", [True, False])
+def test_env_i_steps_like_an_env_seeded_with_index_i(batched):
+    singles = [make_env() for _ in range(NUM_ENVS)]
+    for i, env in enumerate(singles):
+        env.seed(SEED, index=i)
+        first(env.reset())
+    expected = []
+    for actions in random_actions(60, (NUM_ENVS,)):
+        expected.append([])
+        for env, action in zip(singles, actions):
+            _, _, done, _ = env.step(int(action))
+            expected[-1].append(env.state)
+            if done:
+                env.reset()
+    # whatever the number of workers
+    for num_workers in (1, 3):
+        with ParallelRolloutCollector(make_env, NUM_ENVS, num_workers=num_workers, seed=SEED,
+                                      batched=batched) as collector:
+            assert np.array_equal(run(collector), expected)
+
+
+def test_seed_reproduces_a_new_collector():
+    with ParallelRolloutCollector(make_env, NUM_ENVS, num_workers=2, seed=SEED) as collector:
+        first_run = collector.collect(100)["states"].copy()
+        collector.seed(5)
+        reseeded = collector.collect(100)["states"].copy()
+        collector.seed(SEED)
+        assert np.array_equal(collector.collect(100)["states"], first_run)
+    with ParallelRolloutCollector(make_env, NUM_ENVS, num_workers=2, seed=5) as collector:
+        assert np.array_equal(collector.collect(100)["states"], reseeded)
+    assert not np.array_equal(first_run, reseeded)
+
+
+def test_vec_env_interface():
+    with ParallelRolloutCollector(make_env, NUM_ENVS, num_workers=2, seed=SEED) as collector:
+        observations = collector.reset()
+        assert observations.shape == (NUM_ENVS,)
+        assert collector.get_attr("n_obs") == [9] * NUM_ENVS
+        for t in range(20):
+            _, _, dones, infos = collector.step(np.zeros(NUM_ENVS, np.int64))
+        # the time limit of 20 steps
+        assert dones.all() and all("terminal_observation" in info for info in infos)
+
+
+def make_two_action_env():
+    env = make_env()
+    # only left and right
+    env.action_space = Discrete(2)
+    return env
+
+
+@pytest.mark.parametrize("batched", [True, False])
+def test_random_policy_follows_the_action_space(batched):
+    with ParallelRolloutCollector(make_two_action_env, NUM_ENVS, num_workers=2, seed=SEED,
+                                  batched=batched) as collector:
+        actions = collector.collect(100)["actions"].copy()
+    assert set(np.unique(actions).tolist()) == {0, 1}
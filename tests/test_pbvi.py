@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from conftest import build_env
+from layouts import bfs_distances
+from pbvi import PointBasedSolver
+
+
+@pytest.mark.parametrize("method", ["perseus", "pbvi"])
+def test_values_rise_below_the_mdp_bound(method):
+    env = build_env("GridWorldEnvNew", size=6, max_episode_steps=30, action_noise=0.1)
+    solver = PointBasedSolver(env, gamma=0.9, n_beliefs=200, seed=0)
+    values = solver.values(solver.beliefs)
+    for _ in range(15):
+        getattr(solver, method + "_iteration")()
+        new_values = solver.values(solver.beliefs)
+        assert (new_values >= values - 1e-9).all()
+        values = new_values
+    assert (values <= solver.upper_bound(solver.beliefs) + 1e-9).all()
+
+
+def test_policy_reaches_the_end():
+    env = build_env("GridWorldEnvNew", size=6, max_episode_steps=30, action_noise=0)
+    solver = PointBasedSolver(env, gamma=0.9, n_beliefs=200, seed=0)
+    policy = solver.solve(max_iterations=100)
+    # noiseless from a known start, the belief stays a point and the value is the MDP value
+    start = env._xy_to_state(env.start)
+    assert np.isclose(policy.value()[0], solver.mdp_values[solver.mdp.start_index], atol=1e-3)
+    env.reset()
+    policy.reset()
+    done = False
+    while not done:
+        action = policy.act()
+        observation, _, done, _ = env.step(action)
+        policy.observe([action], [observation])
+    assert env._is_end_state(env.state) and env.state != start
+    # along a shortest path
+    x, y = env.start
+    assert env._elapsed_steps == bfs_distances(env.grids.types, env.end)[y - 1, x - 1]
@@ -0,0 +1,71 @@
+import numpy as np
+
+from conftest import build_env
+from layouts import bfs_distances
+from planning import MdpModel, policy_iteration, value_iteration
+
+
+def build_planning_env(action_noise, rewards=((7, 3, -10),)):
+    env = build_env("GridWorldEnv", size=9, action_noise=action_noise)
+    env.types = env.types + [(4, y, 1) for y in range(2, 7)]
+    env.rewards = list(rewards)
+    env.reset()
+    return env
+
+
+def dense_value_iteration(env, gamma, n_sweeps=3000):
+    '''synchronous sweeps over all states with the full model'''
+    values = np.zeros(len(env.transition_table))
+    probs = (1 - env.action_noise) * np.eye(4) + env.action_noise / 4
+    for _ in range(n_sweeps):
+        arrive = env.reward_table + np.where(env.end_table, 0, gamma * values)
+        q = arrive[env.transition_table] @ probs.T
+        values = np.where(env.end_table, 0, q.max(axis=1))
+    return values
+
+
+def test_value_iteration_matches_dense_sweeps():
+    env = build_planning_env(0.2)
+    values, policy = value_iteration(env, gamma=0.95, tol=1e-10)
+    expected = dense_value_iteration(env, 0.95)
+    reachable = ~np.isnan(values)
+    assert reachable.sum() == 9 * 9 - 32 - 5
+    assert np.allclose(values[reachable], expected[reachable], atol=1e-6)
+    # the values are written into the grid matrix
+    x, y = env.start
+    assert np.isclose(env.grids.get_value(x, y), values[env._xy_to_state(env.start)])
+
+
+def test_policy_iteration_matches_value_iteration():
+    env = build_planning_env(0.2)
+    v_values, v_policy = value_iteration(env, gamma=0.95, tol=1e-10, write_values=False)
+    p_values, p_policy = policy_iteration(env, gamma=0.95, tol=1e-10, write_values=False)
+    assert np.allclose(v_values, p_values, atol=1e-6, equal_nan=True)
+    assert np.array_equal(v_policy, p_policy)
+
+
+def test_policy_iteration_without_discount_converges():
+    # the first policy is proper, so its evaluation ends without the sweep cap
+    env = build_env("GridWorldEnv", size=30, action_noise=0.3)
+    model = MdpModel(env, gamma=1.0)
+    p_values, p_policy = policy_iteration(env, gamma=1.0, write_values=False, model=model)
+    v_values, _ = value_iteration(env, gamma=1.0, write_values=False)
+    assert model.iterations < 30 and model.sweeps < 3000
+    assert np.allclose(p_values, v_values, atol=1e-4, equal_nan=True)
+    reachable = ~np.isnan(p_values)
+    assert (p_values[reachable] > -200).all()
+
+
+def test_noiseless_values_are_shortest_paths():
+    env = build_planning_env(0, rewards=())
+    values, policy = value_iteration(env, gamma=1.0, tol=1e-9)
+    dist = bfs_distances(env.grids.types, env.end).ravel()
+    reachable = ~np.isnan(values[1:])
+    # every step costs -1, entering the end too, so -distance (0 on the end itself)
+    assert np.allclose(values[1:][reachable], -dist[reachable])
+    # the greedy policy walks the shortest path
+    env.action_noise = 0
+    state = env.reset()
+    for _ in range(dist[state - 1]):
+        _, _, done, _ = env.step(int(policy[env.state]))
+    assert done and env._is_end_state(env.state)
@@ -0,0 +1,84 @@
+import numpy as np
+
+from conftest import build_env
+from rasterizer import (AGENT_COLOR, END_COLOR, START_COLOR, WALL_COLOR, GridRasterizer, record_episodes,
+                        save_video, write_gif)
+
+U = 10
+
+
+def pixel(frame, env, x, y, dx=U // 2, dy=U // 2):
+    '''the color at pixel (dx, dy) of the grid (x, y); row 0 of a frame is the top'''
+    return tuple(frame[(env.n_height - y) * U + dy, (x - 1) * U + dx])
+
+
+def test_frame_shows_the_layout_and_the_agent():
+    env = build_env("GridWorldEnv", size=6)
+    env.u_size = U
+    frame = env.render(mode="rgb_array")
+    assert frame.shape == (6 * U, 6 * U, 3) and frame.dtype == np.uint8
+    assert pixel(frame, env, 1, 1) == WALL_COLOR
+    assert pixel(frame, env, 2, 2) == AGENT_COLOR  # the agent on the start
+    assert pixel(frame, env, 2, 2, dx=2, dy=U // 2) == START_COLOR
+    assert pixel(frame, env, 4, 4, dx=2, dy=U // 2) == END_COLOR
+    env.grids.set_type(3, 3, 1)
+    assert pixel(env.render(mode="rgb_array"), env, 3, 3) == WALL_COLOR
+
+
+def test_batch_frames_equal_single_frames():
+    env = build_env("GridWorldEnvNew", size=6)
+    rasterizer = GridRasterizer(u_size=U)
+    states = [8, 9, 15, 22]
+    frames = rasterizer.render_states(env, states)
+    for state, frame in zip(states, frames):
+        env.state = state
+        assert np.array_equal(rasterizer.render(env), frame)
+    # the observation window of GridWorldEnvNew is blended around the agent
+    assert not np.array_equal(frames[0], GridRasterizer(u_size=U, window=False).render_states(env, states)[0])
+
+
+def test_record_episodes_keeps_done_envs_still():
+    env = build_env("GridWorldEnv", size=5, max_episode_steps=30, action_noise=0)
+    # env 0 goes up then right to the end (3, 3), env 1 keeps walking into the left wall
+    moves = iter([[2, 0], [1, 0]] + [[0, 0]] * 10)
+    frames = record_episodes(env, policy=lambda obs: np.array(next(moves)), num_envs=2, steps=5, u_size=4)
+    assert frames.shape == (6, 2, 20, 20, 3)
+    assert not np.array_equal(frames[1, 0], frames[2, 0])
+    assert all(np.array_equal(frames[2, 0], frame) for frame in frames[3:, 0])
+    mosaic = record_episodes(env, num_envs=4, steps=3, seed=0, u_size=4, n_cols=2)
+    assert mosaic.shape == (4, 2 * 20 + 2, 2 * 20 + 2, 3)
+
+
+def read_gif(path):
+    '''the frames of a GIF written by write_gif (9-bit literal codes)'''
+    data = open(path, "rb").read()
+    w, h = np.frombuffer(data[6:10], "<u2")
+    palette = np.frombuffer(data[13:13 + 768], np.uint8).reshape(256, 3)
+    pos, frames = 13 + 768 + 19, []
+    while data[pos] != 0x3B:
+        pos += 8 + 10  # graphic control extension and image descriptor
+        assert data[pos] == 8
+        pos += 1
+        chunks = []
+        while data[pos]:
+            chunks.append(data[pos + 1:pos + 1 + data[pos]])
+            pos += 1 + data[pos]
+        pos += 1
+        bits = np.unpackbits(np.frombuffer(b"".join(chunks), np.uint8), bitorder="little")
+        codes = (bits[:len(bits) // 9 * 9].reshape(-1, 9).astype(np.uint16) << np.arange(9, dtype=np.uint16)).sum(1)
+        codes = codes[:list(codes).index(257)]
+        frames.append(palette[codes[codes != 256]].reshape(h, w, 3))
+    return np.stack(frames)
+
+
+def test_gif_and_npz_export(tmp_path):
+    env = build_env("GridWorldEnvNew", size=6)
+    frames = GridRasterizer(u_size=4).render_states(env, np.arange(8, 30))
+    path = str(tmp_path / "episode.gif")
+    save_video(frames, path)
+    assert np.array_equal(read_gif(path), frames)
+    save_video(frames, str(tmp_path / "episode.npz"), fps=5)
+    with np.load(str(tmp_path / "episode.npz")) as data:
+        assert np.array_equal(data["frames"], frames) and data["fps"] == 5
+    write_gif(frames[0], path)
+    assert np.array_equal(read_gif(path), frames[:1])
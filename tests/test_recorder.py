@@ -0,0 +1,57 @@
+import numpy as np
+
+from conftest import build_env
+from recorder import TrajectoryRecorder, load_trajectories
+from trajectory_dataset import TrajectoryDataset
+
+
+def record(env, path, chunk_size=1 << 20, **kwargs):
+    with TrajectoryRecorder(env, str(path), num_envs=4, chunk_size=chunk_size, seed=7) as recorder:
+        rows = recorder.record(n_trajectories=10, steps=30, **kwargs)
+    return rows, load_trajectories(str(path))
+
+
+def test_recorded_steps_follow_the_env_tables(tmp_path):
+    env = build_env("GridWorldEnvNew", action_noise=0.2)
+    rows, data = record(env, tmp_path / "data")
+    assert rows == len(data["trajectory"])
+    assert np.array_equal(np.unique(data["trajectory"]), np.arange(10))
+    for i in range(10):
+        t = data["trajectory"] == i
+        state, action, step = data["state"][t], data["action"][t], data["step"][t]
+        assert np.array_equal(step, np.arange(len(step)))
+        assert state[0] == env._xy_to_state(env.start) and action[0] == 0
+        assert np.array_equal(state[1:], env.transition_table[state[:-1], action[1:]])
+        assert np.array_equal(data["reward"][t][1:], env.reward_table[state[1:]])
+        assert np.array_equal(data["observation"][t], env.obs_table[state])
+        assert np.array_equal(data["inputs"][t][:, 1:], env.obs_matrix_table[state])
+        x, y = env._state_to_xy(state)
+        assert np.array_equal(data["x"][t], x) and np.array_equal(data["y"][t], y)
+        # a trajectory stops at its first done, or after the 30 steps
+        done = data["done"][t]
+        assert not done[:-1].any() and (done[-1] or len(step) == 31)
+
+
+def test_chunks_and_fixed_length_recordings(tmp_path):
+    env = build_env("GridWorldEnvRnnNew")
+    _, whole = record(env, tmp_path / "whole")
+    _, chunked = record(env, tmp_path / "chunked", chunk_size=7)
+    for column in whole:
+        assert np.array_equal(whole[column], chunked[column])
+    _, fixed = record(env, tmp_path / "fixed", stop_on_done=False)
+    assert np.array_equal(np.bincount(fixed["trajectory"]), [31] * 10)
+
+
+def test_state_envs_record_no_observations(tmp_path):
+    _, data = record(build_env("GridWorldEnv"), tmp_path / "data")
+    assert "observation" not in data and "inputs" not in data and "state" in data
+
+
+def test_notebook_layout(tmp_path):
+    # record_data.ipynb: 250 rows per trajectory, the reset and 249 random steps
+    env = build_env("GridWorldEnvRnnNew", max_episode_steps=100)
+    with TrajectoryRecorder(env, str(tmp_path), num_envs=4, seed=7) as recorder:
+        recorder.record(n_trajectories=6, steps=249, stop_on_done=False)
+    dataset = TrajectoryDataset(str(tmp_path))
+    assert dataset.tensor("inputs").shape == (6, 250, 10)
+    assert np.array_equal(np.bincount(dataset.column("trajectory")), [250] * 6)
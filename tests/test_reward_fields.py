@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+import reward_fields
+from conftest import build_env
+from layouts import TableCache, bfs_distances, generate
+from reward_fields import bfs_fields, compute_reward_fields, nearest_reward, set_cache
+
+
+def original_l1_reward(env, x, y):
+    '''the reward of GridWorldEnvRnn.get_reward before the fields, with n_max of the current end'''
+    end_x, end_y = env.end
+    n_width_max = max(abs(i + 2 - end_x) for i in range(env.n_width - 2))
+    n_height_max = max(abs(i + 2 - end_y) for i in range(env.n_height - 2))
+    return -1 * (abs(x - end_x) + abs(y - end_y)) / (n_height_max + n_width_max)
+
+
+@pytest.mark.parametrize("env_name", ["GridWorldEnvRnn", "GridWorldEnvRnnNew"])
+def test_l1_reward_is_the_original_one(env_name):
+    env = build_env(env_name, size=9)
+    for end in [(7, 7), (3, 6), (2, 2)]:
+        env.end = end
+        env.reset()
+        for x in range(1, 10):
+            for y in range(1, 10):
+                assert np.isclose(env.get_reward(x, y), original_l1_reward(env, x, y))
+
+
+def test_bfs_fields_are_shortest_paths():
+    types = generate("rooms", 13, 11, seed=2).types
+    goals = [(2, 2), (7, 5), (11, 9)]
+    fields = bfs_fields(types, goals)
+    for g, goal in enumerate(goals):
+        assert np.array_equal(fields[g], bfs_distances(types, goal))
+
+
+def test_bfs_reward_metric():
+    env = build_env("GridWorldEnvRnn", size=9)
+    env.types = env.types + [(4, y, 1) for y in range(2, 8)] + [(4, 8, 0)]
+    env.reward_metric = "bfs"
+    env.reset()
+    dist = bfs_distances(env.grids.types, env.end)
+    reward = env.reward_table[1:].reshape(9, 9)
+    assert np.allclose(reward[dist >= 0], -dist[dist >= 0] / dist.max())
+    assert (reward[dist < 0] == -1).all()
+
+
+def test_several_ends_reward_the_nearest_one():
+    env = build_env("GridWorldEnvRnn", size=9)
+    ends = [(7, 7), (2, 7)]
+    env.end = ends
+    env.reset()
+    fields = compute_reward_fields(env.grids.types, ends)
+    n_max = fields["n_max"].max()
+    for x in range(2, 9):
+        for y in range(2, 9):
+            nearest = min(abs(x - ex) + abs(y - ey) for ex, ey in ends)
+            assert np.isclose(env.get_reward(x, y), -nearest / n_max)
+    assert np.array_equal(nearest_reward(compute_reward_fields(env.grids.types, ends[:1])),
+                          compute_reward_fields(env.grids.types, ends[:1])["reward"][0])
+
+
+def test_fields_are_shared_and_read_only(tmp_path):
+    a, b = build_env("GridWorldEnvRnn", size=9), build_env("GridWorldEnvRnnNew", size=9)
+    assert a.reward_field["reward"] is b.reward_field["reward"]
+    assert not a.reward_field["distance"].flags.writeable
+    # a directory cache shares them across processes and runs
+    default = reward_fields._cache
+    try:
+        set_cache(TableCache(str(tmp_path)))
+        first = build_env("GridWorldEnvRnn", size=9).reward_field
+        set_cache(TableCache(str(tmp_path)))
+        again = build_env("GridWorldEnvRnn", size=9).reward_field
+        assert reward_fields._cache.misses == 0 and reward_fields._cache.hits > 0
+        assert all(np.array_equal(first[name], again[name]) for name in first)
+    finally:
+        set_cache(default)
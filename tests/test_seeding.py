@@ -0,0 +1,74 @@
+import numpy as np
+
+from conftest import build_env, random_actions
+from env_core import np_random
+from seeding import BatchNoise, NoiseStream, counter_draws, episode_bases, noise_actions
+
+
+def stream_actions(stream, n_steps, p=0.3):
+    return [stream.action(p, 4) for _ in range(n_steps)]
+
+
+def test_stream_draws_do_not_depend_on_the_block_size():
+    draws = [stream_actions(NoiseStream(9, index=2, block=block), 150) for block in (1, 7, 64)]
+    assert draws[0] == draws[1] == draws[2]
+
+
+def test_batch_slots_draw_like_single_streams():
+    indices = [0, 3, 4]
+    batch = BatchNoise(21, indices)
+    streams = [NoiseStream(21, index=i) for i in indices]
+    for episode in range(3):
+        for _ in range(70):
+            noisy = batch.apply(np.full(3, -1), 0.3, 4)
+            assert noisy.tolist() == [s.action(0.3, 4) for s in streams]
+        batch.start()
+        for s in streams:
+            s.start()
+
+
+def test_episodes_replay_and_resets_without_steps_do_not_count():
+    stream = NoiseStream(5)
+    first = stream_actions(stream, 10)
+    stream.start()
+    second = stream_actions(stream, 10)
+    assert first != second
+    stream.start(0)
+    assert stream_actions(stream, 10) == first
+    stream.start(1)
+    stream.start()  # no steps since: still episode 1
+    assert stream.episode == 1
+    assert stream_actions(stream, 10) == second
+    stream.start()
+    assert stream.episode == 2
+
+
+def test_noise_rate_and_edge_cases():
+    draws = counter_draws(episode_bases(np.array([7], np.uint64), [0]), np.arange(100000))
+    actions = np.full(len(draws), -1)
+    assert (noise_actions(draws, actions, 0.0, 4) == -1).all()
+    assert (noise_actions(draws, actions, 1.0, 4) >= 0).all()
+    rate = (noise_actions(draws, actions, 0.2, 4) >= 0).mean()
+    assert abs(rate - 0.2) < 0.01
+    stream = NoiseStream(0)
+    assert all(a == -1 for a in stream_actions(stream, 100, p=0.0))
+    assert all(a >= 0 for a in stream_actions(stream, 100, p=1.0))
+
+
+def test_env_seed_index_streams():
+    def states(seed, index):
+        env = build_env("GridWorldEnv", action_noise=0.5)
+        env.seed(seed, index=index)
+        env.reset()
+        result = []
+        for action in random_actions(100):
+            _, _, done, _ = env.step(int(action))
+            result.append(env.state)
+            if done:
+                env.reset()
+        return result
+
+    assert states(3, 1) == states(3, 1)
+    assert states(3, 1) != states(3, 2)
+    assert np_random(5)[1] == 5
+    assert np_random(5, index=1)[0].randint(1 << 30) != np_random(5, index=2)[0].randint(1 << 30)
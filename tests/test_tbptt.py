@@ -0,0 +1,58 @@
+import numpy as np
+
+from conftest import build_env
+from recorder import TrajectoryRecorder
+from tbptt import TbpttBatchGenerator
+from trajectory_dataset import DatasetWriter, TrajectoryDataset
+
+
+def small_dataset(path, lengths=(7, 3, 12, 1, 5), meta=None):
+    ids = np.repeat(np.arange(len(lengths)), lengths)
+    rows = np.arange(len(ids))
+    with DatasetWriter(str(path), meta) as writer:
+        writer.append({"trajectory": ids, "action": rows % 4, "observation": rows % 6, "state": rows})
+    return TrajectoryDataset(str(path))
+
+
+def test_lanes_walk_every_row_once_in_order(tmp_path):
+    dataset = small_dataset(tmp_path)
+    generator = TbpttBatchGenerator(dataset, batch_size=2, unroll=4, seed=0, prefetch=0)
+    lanes = [[] for _ in range(2)]
+    n_batches = 0
+    for x, y, reset, mask in generator:
+        n_batches += 1
+        assert x.shape == (2, 4, 2) and y.shape == (2, 4)
+        for lane in range(2):
+            if reset[lane]:
+                lanes[lane].append([])
+            lanes[lane][-1].extend(y[lane][mask[lane]])
+        # the state column holds the row number: inputs and labels come from the same rows
+        assert np.array_equal(x[..., 0][mask], y[mask] % 4)
+    assert n_batches <= len(generator)
+    trajectories = [t for lane in lanes for t in lane if t]
+    # each window continues the trajectory of the lane, so a lane holds whole trajectories
+    assert sorted(map(tuple, trajectories)) == sorted(tuple(dataset[i]["state"]) for i in range(len(dataset)))
+
+
+def test_prefetch_gives_the_same_batches(tmp_path):
+    dataset = small_dataset(tmp_path)
+    direct = list(TbpttBatchGenerator(dataset, batch_size=3, unroll=2, seed=5, prefetch=0))
+    prefetched = list(TbpttBatchGenerator(dataset, batch_size=3, unroll=2, seed=5, prefetch=2))
+    assert len(direct) == len(prefetched)
+    for a, b in zip(direct, prefetched):
+        assert all(np.array_equal(u, v) for u, v in zip(a, b))
+
+
+def test_onehot_width_is_the_n_obs_of_the_env(tmp_path):
+    env = build_env("GridWorldEnvNew")
+    env.types = env.types + [(4, 4, 1)]
+    env.reset()
+    with TrajectoryRecorder(env, str(tmp_path / "data"), num_envs=2, seed=0) as recorder:
+        recorder.record(n_trajectories=2, steps=3)
+    dataset = TrajectoryDataset(str(tmp_path / "data"))
+    assert dataset.column("observation").max() + 1 < env.n_obs
+    x, _, _, _ = next(iter(TbpttBatchGenerator(dataset, batch_size=2, unroll=2, encoding="onehot", prefetch=0)))
+    assert x.shape[-1] == 4 + env.n_obs
+    # datasets without n_obs in their meta (convert_csv) size it by the data
+    legacy = TbpttBatchGenerator(small_dataset(tmp_path / "legacy"), encoding="onehot", prefetch=0)
+    assert legacy.n_observations == 6
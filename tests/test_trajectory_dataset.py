@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from trajectory_dataset import DatasetWriter, TrajectoryDataset, convert_csv
+
+
+def write_dataset(path, lengths, chunk_size):
+    ids = np.repeat(np.arange(len(lengths)), lengths)
+    values = np.arange(len(ids) * 2, dtype=np.float32).reshape(-1, 2)
+    with DatasetWriter(str(path), {"env": "test"}) as writer:
+        # chunks that split trajectories
+        for i in range(0, len(ids), chunk_size):
+            writer.append({"trajectory": ids[i:i + chunk_size], "value": values[i:i + chunk_size]})
+    return values
+
+
+def test_round_trip_with_trajectories_across_chunks(tmp_path):
+    values = write_dataset(tmp_path, [3, 5, 2], chunk_size=4)
+    dataset = TrajectoryDataset(str(tmp_path))
+    assert len(dataset) == 3 and dataset.meta["env"] == "test"
+    assert list(dataset.offsets) == [0, 3, 8, 10]
+    assert isinstance(dataset.column("value"), np.memmap)
+    assert np.array_equal(dataset.column("value"), values)
+    assert np.array_equal(dataset[1]["value"], values[3:8])
+    assert dataset.uniform_length is None
+    with pytest.raises(ValueError):
+        dataset.tensor("value")
+    padded = dataset.padded("value", fill=-1)
+    assert padded.shape == (3, 5, 2)
+    assert np.array_equal(padded[2, :2], values[8:10]) and (padded[2, 2:] == -1).all()
+
+
+def test_tensor_of_equal_lengths(tmp_path):
+    values = write_dataset(tmp_path, [4, 4, 4], chunk_size=5)
+    tensor = TrajectoryDataset(str(tmp_path)).tensor("value")
+    assert tensor.shape == (3, 4, 2)
+    assert np.array_equal(tensor.reshape(-1, 2), values)
+
+
+def test_convert_csv(tmp_path):
+    csv_path = tmp_path / "trajectories.csv"
+    csv_path.write_text(',trajectory,inputs,state,position\n'
+                        '0,1,[0 4],12,"[2, 2]"\n1,1,[3 4],12,"[2, 2]"\n2,1,[1 3],13,"[3, 2]"\n'
+                        '3,2,[0 4],12,"[2, 2]"\n4,2,[2 5],22,"[2, 3]"\n')
+    dataset = convert_csv(str(csv_path), str(tmp_path / "data"), chunk_size=2)
+    assert list(dataset.lengths) == [3, 2]
+    assert list(dataset.column("step")) == [0, 1, 2, 0, 1]
+    assert list(dataset.column("action")) == [0, 3, 1, 0, 2]
+    assert list(dataset.column("observation")) == [4, 4, 3, 4, 5]
+    assert list(dataset.column("state")) == [12, 12, 13, 12, 22]
+    assert list(dataset.column("x")) == [2, 2, 3, 2, 2] and list(dataset.column("y")) == [2, 2, 2, 2, 3]